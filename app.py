@@ -4,35 +4,47 @@ Serves the single-page frontend and provides REST endpoints for
 image browsing, crop-region management, image cropping, and PPT generation.
 """
 
+import asyncio
 import os
 import sys
-import glob
+import threading
 import yaml
 import json
 import shutil
 import logging
 import base64
-import io
+import hashlib
 from datetime import datetime
 from html import escape
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, Callable, Iterator, List, Optional
 
 import cv2
 import numpy as np
-import webcolors
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import FileResponse, JSONResponse, Response
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from reportlab.pdfgen import canvas as pdf_canvas
-from reportlab.lib.utils import ImageReader
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 
+from frame_index import load_image_paths, scan_method_dir
+from image_cache import ByteBudgetLRU, DecodedImageCache
+from image_codec import DEFAULT_POLICY, DEFAULT_QUALITY, POLICIES, RESAMPLE_FILTERS, encode_image, negotiate_encoding
 from image_cropper import crop_images
-from ppt_maker import make_ppt
+from image_meta import ImageSizeIndex, file_version
+from jobs import DONE, Job, JobManager
+from pdf_stream import FlateImage, PdfStreamWriter
+from ppt_maker import make_ppt_from_crops
+from prefetch import FramePrefetcher
+from stitch_render import (
+    PIXEL_FIELDS, BlockRenderer, RenderedBlock, draft_layout, parse_color_bgr, render_draft_block,
+)
+from thumbnails import TIER_WIDTHS, ThumbnailStore
+from tile_store import TilePyramidStore
 from visualizer import make_variance_map, make_ranking_map
+from workers import HEAVY, INTERACTIVE, PriorityScheduler, SchedulerBusy, make_executor
+from zip_stream import ZipStream
 
 # ---------------------------------------------------------------------------
 # Logging
@@ -47,18 +59,12 @@ config_file = sys.argv[1] if len(sys.argv) > 1 else "configs.yaml"
 with open(config_file, encoding="utf-8") as f:
     CONFIG: dict = yaml.safe_load(f)
 logger.info("Loaded config from %s", config_file)
+CACHE_DIR: str = CONFIG.get("cache_path", ".cherrypicker_cache")
 
 # ---------------------------------------------------------------------------
 # Pre-compute image paths  (sorted deterministically)
 # ---------------------------------------------------------------------------
-IMG_PATHS: dict[int, list[str]] = {}
-for idx, method in enumerate(CONFIG["methods"]):
-    IMG_PATHS[idx] = sorted(
-        glob.glob(os.path.join(method["path"], "**", "*.png"), recursive=True)
-        + glob.glob(os.path.join(method["path"], "**", "*.jpg"), recursive=True)
-        + glob.glob(os.path.join(method["path"], "**", "*.jpeg"), recursive=True)
-        + glob.glob(os.path.join(method["path"], "**", "*.bmp"), recursive=True)
-    )
+IMG_PATHS: dict[int, list[str]] = load_image_paths(CONFIG)
 
 FRAME_COUNT: int = len(IMG_PATHS.get(0, []))
 METHOD_COUNT: int = len(CONFIG["methods"])
@@ -104,30 +110,75 @@ if CONFIG.get("clear_previous", False):
 else:
     _load_crops()
 
+# ---------------------------------------------------------------------------
+# Worker process pools  (forked here, before this process starts any thread)
+# ---------------------------------------------------------------------------
+_DEFAULT_PROCESSES = min(4, os.cpu_count() or 1)
+CROP_POOL = make_executor(int(CONFIG.get("crop_processes", _DEFAULT_PROCESSES)), "crop")
+STITCH_POOL = make_executor(int(CONFIG.get("stitch_workers", _DEFAULT_PROCESSES)), "stitch")
+_VISUALIZER_POOL = None
+if CONFIG.get("make_variance_map", False) or CONFIG.get("make_ranking_map", False):
+    _VISUALIZER_POOL = make_executor(
+        min(int(CONFIG.get("visualizer_processes", _DEFAULT_PROCESSES)), FRAME_COUNT), "visualizer"
+    )
+
 # ---------------------------------------------------------------------------
 # Optional visualisation on startup
 # ---------------------------------------------------------------------------
 if CONFIG.get("make_variance_map", False):
-    CONFIG = make_variance_map(CONFIG)
+    CONFIG = make_variance_map(CONFIG, pool=_VISUALIZER_POOL)
     # Refresh IMG_PATHS for newly-added method
     new_idx = len(CONFIG["methods"]) - 1
     m = CONFIG["methods"][new_idx]
-    IMG_PATHS[new_idx] = sorted(
-        glob.glob(os.path.join(m["path"], "**", "*.png"), recursive=True)
-        + glob.glob(os.path.join(m["path"], "**", "*.jpg"), recursive=True)
-    )
+    IMG_PATHS[new_idx] = scan_method_dir(m["path"], CACHE_DIR, (".png", ".jpg"))
     METHOD_COUNT = len(CONFIG["methods"])
 
 if CONFIG.get("make_ranking_map", False):
-    CONFIG = make_ranking_map(CONFIG, lambda x, y: -np.abs(x.astype(float) - y.astype(float)).sum(axis=2))
-    new_idx = len(CONFIG["methods"]) - 1
-    m = CONFIG["methods"][new_idx]
-    IMG_PATHS[new_idx] = sorted(
-        glob.glob(os.path.join(m["path"], "**", "*.png"), recursive=True)
-        + glob.glob(os.path.join(m["path"], "**", "*.jpg"), recursive=True)
-    )
+    _first_new = len(CONFIG["methods"])
+    CONFIG = make_ranking_map(CONFIG, pool=_VISUALIZER_POOL)  # per-pixel L1 to GT
+    # One virtual method per ranked method (see ranking_map_methods)
+    for new_idx in range(_first_new, len(CONFIG["methods"])):
+        m = CONFIG["methods"][new_idx]
+        IMG_PATHS[new_idx] = scan_method_dir(m["path"], CACHE_DIR, (".png", ".jpg"))
     METHOD_COUNT = len(CONFIG["methods"])
 
+if _VISUALIZER_POOL is not None:
+    _VISUALIZER_POOL.shutdown()
+
+# ---------------------------------------------------------------------------
+# Shared image caches
+# ---------------------------------------------------------------------------
+IMAGE_SIZES = ImageSizeIndex()
+DECODED_IMAGES = DecodedImageCache(int(CONFIG.get("decode_cache_mb", 1024)) * 1024 * 1024)
+TILE_PYRAMID: bool = bool(CONFIG.get("tile_pyramid", False))
+THUMBNAILS = ThumbnailStore(CACHE_DIR, DECODED_IMAGES, IMAGE_SIZES)
+TILE_IMAGES = DecodedImageCache(int(CONFIG.get("tile_cache_mb", 256)) * 1024 * 1024)
+TILES = TilePyramidStore(CACHE_DIR, DECODED_IMAGES, TILE_IMAGES, tile_size=int(CONFIG.get("tile_size", 256)))
+ENCODED_IMAGES = ByteBudgetLRU(int(CONFIG.get("encoded_cache_mb", 256)) * 1024 * 1024)
+ENCODING_POLICY: dict = dict(DEFAULT_POLICY)
+for _endpoint, _policy in (CONFIG.get("encoding_policy") or {}).items():
+    if _endpoint in ENCODING_POLICY and _policy in POLICIES:
+        ENCODING_POLICY[_endpoint] = _policy
+    else:
+        logger.warning("Ignoring encoding_policy entry %s: %s", _endpoint, _policy)
+PREVIEW_QUALITY: int = int(CONFIG.get("preview_quality", DEFAULT_QUALITY))
+
+# ---------------------------------------------------------------------------
+# Worker lanes  (exports never take the threads reserved for UI requests)
+# ---------------------------------------------------------------------------
+SCHEDULER = PriorityScheduler(
+    reserved=int(CONFIG.get("interactive_workers", CONFIG.get("crop_workers", 4))),
+    shared=int(CONFIG.get("heavy_workers", 2)),
+    heavy_limit=int(CONFIG.get("heavy_workers", 2)),
+    max_pending=int(CONFIG.get("heavy_queue", 8)),
+)
+STITCH_BLOCKS = ByteBudgetLRU(int(CONFIG.get("stitch_cache_mb", 512)) * 1024 * 1024)
+STITCH_RENDERER = BlockRenderer(
+    int(CONFIG.get("stitch_workers", _DEFAULT_PROCESSES)), DECODED_IMAGES.get, cache=STITCH_BLOCKS,
+    pool=STITCH_POOL,
+)
+JOBS = JobManager(SCHEDULER, os.path.join(CACHE_DIR, "jobs"), history=int(CONFIG.get("job_history", 20)))
+
 # ---------------------------------------------------------------------------
 # FastAPI app
 # ---------------------------------------------------------------------------
@@ -161,38 +212,281 @@ def get_config():
         "method_count": METHOD_COUNT,
         "display_rows": CONFIG.get("display_rows", 2),
         "display_cols": CONFIG.get("display_cols", 2),
+        "image_tiers": TIER_WIDTHS,
+        "tile_pyramid": TILE_PYRAMID,
+        "tile_size": TILES.tile_size,
     }
 
 
+# ---- HTTP caching -------------------------------------------------------
+_IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+
+def _http_cache(request: Request, path, v: Optional[str], *params) -> tuple[dict, Optional[Response]]:
+    """ETag / Cache-Control headers for a response rendered from *path* (or a
+    list of paths) with *params*, plus a ready 304 response when the client
+    already has it.
+
+    Responses are marked immutable only when the URL's ``v`` matches the
+    file's current version (see /api/frame-meta; versions of several paths
+    are joined with "-"); otherwise clients must revalidate.
+    """
+    versions = [file_version(p) for p in ([path] if isinstance(path, str) else path)]
+    if not versions or None in versions:
+        return {}, None
+    version = "-".join(versions)
+    raw = "|".join([version, *(str(p) for p in params)])
+    etag = '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20] + '"'
+    headers = {"ETag": etag, "Cache-Control": _IMMUTABLE_CACHE if v == version else "no-cache"}
+    inm = request.headers.get("if-none-match", "")
+    tags = [t.strip().removeprefix("W/") for t in inm.split(",") if t.strip()]
+    if etag in tags or "*" in tags:
+        return headers, Response(status_code=304, headers=headers)
+    return headers, None
+
+
+def _encoded_response(request: Request, endpoint: str, path, v: Optional[str], quality: Optional[int],
+                      params: tuple, render) -> Response:
+    """Encode the image produced by *render* under the endpoint's encoding policy.
+
+    *render* returns ``(image, extra_headers)`` and is only called when
+    neither the client (304) nor ENCODED_IMAGES already has the bytes for
+    this ETag, which covers the negotiated encoding and quality.
+    """
+    encoding, q = negotiate_encoding(ENCODING_POLICY[endpoint], request.headers.get("accept"),
+                                     quality, PREVIEW_QUALITY)
+    headers, not_modified = _http_cache(request, path, v, endpoint, *params, encoding, q)
+    if not_modified is not None:
+        not_modified.headers["Vary"] = "Accept"
+        return not_modified
+    headers["Vary"] = "Accept"
+
+    etag = headers.get("ETag")
+    cached = ENCODED_IMAGES.get(etag) if etag else None
+    if cached is None:
+        img, extra = render()
+        try:
+            data, media_type = encode_image(img, encoding, q)
+        except ValueError:
+            raise HTTPException(500, "Encoding failed")
+        cached = (data, media_type, extra)
+        if etag:
+            ENCODED_IMAGES.put(etag, cached, len(data))
+    data, media_type, extra = cached
+    return Response(content=data, media_type=media_type, headers={**headers, **extra})
+
+
+def _submit_heavy(fn, *args) -> asyncio.Future:
+    """Queue *fn* on the heavy lane; the request awaits it without holding a thread."""
+    try:
+        return asyncio.wrap_future(SCHEDULER.submit(HEAVY, fn, *args))
+    except SchedulerBusy:
+        raise HTTPException(503, "Server busy with other exports, try again later")
+
+
+_STREAM_END = object()
+
+
+def _stream_heavy(chunks: Iterator, name: str) -> AsyncIterator:
+    """Produce *chunks* on the heavy lane and relay them to a streaming response.
+
+    The generator runs as a single heavy job, at most two chunks ahead of
+    the client.  It stops at the next chunk boundary when the client goes
+    away.  Errors after the first byte can only end the stream early, so
+    they are logged here.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    room = threading.Semaphore(2)
+    stopped = threading.Event()
+
+    def _pump():
+        try:
+            for chunk in chunks:
+                room.acquire()
+                if stopped.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+        except Exception as e:
+            logger.exception("%s failed", name)
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            chunks.close()
+            loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+
+    _submit_heavy(_pump)
+
+    async def _relay():
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                room.release()
+                yield item
+        finally:
+            stopped.set()
+            room.release()
+
+    return _relay()
+
+
 # ---- API: serve images -------------------------------------------------
 @app.get("/api/image/{method_idx}/{frame_idx}")
-def get_image(method_idx: int, frame_idx: int):
-    if method_idx < 0 or method_idx >= METHOD_COUNT:
-        raise HTTPException(404, "Invalid method index")
-    paths = IMG_PATHS.get(method_idx, [])
-    if frame_idx < 0 or frame_idx >= len(paths):
-        raise HTTPException(404, "Invalid frame index")
-    p = paths[frame_idx]
+def get_image(request: Request, method_idx: int, frame_idx: int,
+              tier: str = Query("full"), width: Optional[int] = Query(None),
+              v: Optional[str] = Query(None)):
+    """The frame itself, or a reduced copy for tier=thumb|medium or width=N."""
+    p = _frame_path(method_idx, frame_idx)
     if not os.path.isfile(p):
         raise HTTPException(404, f"File not found: {p}")
-    return FileResponse(p, media_type="image/png")
+    if width is None and tier != "full":
+        if tier not in TIER_WIDTHS:
+            raise HTTPException(400, f"Unknown tier: {tier}")
+        width = TIER_WIDTHS[tier]
+    headers, not_modified = _http_cache(request, p, v, "image", width)
+    if not_modified is not None:
+        return not_modified
+    if width is not None and width > 0:
+        reduced = THUMBNAILS.get(p, width)
+        if reduced is not None:
+            media_type = "image/jpeg" if reduced.endswith(".jpg") else "image/png"
+            return FileResponse(reduced, media_type=media_type, headers=headers)
+    return FileResponse(p, media_type="image/png", headers=headers)
+
+
+# ---- API: deep-zoom tiles ------------------------------------------------
+@app.get("/api/tile/{method_idx}/{frame_idx}/{level}/{x}/{y}")
+def get_tile(request: Request, method_idx: int, frame_idx: int, level: int, x: int, y: int,
+             v: Optional[str] = Query(None)):
+    """One tile of the frame's pyramid; level 0 is full resolution."""
+    src = _frame_path(method_idx, frame_idx)
+    headers, not_modified = _http_cache(request, src, v, "tile", TILES.tile_size, level, x, y)
+    if not_modified is not None:
+        return not_modified
+    p = TILES.tile_path(src, level, x, y)
+    if p is None or not os.path.isfile(p):
+        raise HTTPException(404, "Invalid tile")
+    return FileResponse(p, media_type="image/png", headers=headers)
+
+
+# ---- API: predictive prefetch of neighbouring frames ---------------------
+PREFETCH_RADIUS: int = int(CONFIG.get("prefetch_radius", 2))
+
+
+def _warm_frame(path: str, widths: list[int], decode: bool) -> None:
+    if decode:
+        DECODED_IMAGES.get(path)
+    for width in widths:
+        THUMBNAILS.get(path, width, cache_decode=decode)
+
+
+PREFETCHER = FramePrefetcher(_warm_frame, workers=int(CONFIG.get("prefetch_workers", 1)))
+
+
+class PrefetchRequest(BaseModel):
+    frame_idx: int
+    method_indices: List[int]
+    tiers: List[str] = []
+    radius: Optional[int] = None
+
+
+@app.post("/api/prefetch")
+def prefetch(req: PrefetchRequest):
+    """Warm caches for frames around *frame_idx*, replacing earlier requests.
+
+    Nearest frames come first (next before previous).  Full decodes are only
+    warmed while they fit in half of the decoded-image cache so that the
+    frame on screen is never evicted by its neighbours.
+    """
+    radius = PREFETCH_RADIUS if req.radius is None else max(0, min(int(req.radius), 16))
+    widths = [TIER_WIDTHS[t] for t in req.tiers if t in TIER_WIDTHS]
+    methods = [m for m in dict.fromkeys(req.method_indices) if 0 <= m < METHOD_COUNT]
+
+    # Frames of one method normally share a size; estimate from the current one
+    frame_bytes: dict[int, int] = {}
+    for m in methods:
+        paths = IMG_PATHS.get(m, [])
+        size = IMAGE_SIZES.get(paths[req.frame_idx]) if 0 <= req.frame_idx < len(paths) else None
+        frame_bytes[m] = size[0] * size[1] * 3 if size else 0
+
+    decode_budget = DECODED_IMAGES.max_bytes // 2
+    jobs = []
+    for d in range(1, radius + 1):
+        for f in (req.frame_idx + d, req.frame_idx - d):
+            for m in methods:
+                paths = IMG_PATHS.get(m, [])
+                if f < 0 or f >= len(paths):
+                    continue
+                decode = 0 < frame_bytes[m] <= decode_budget
+                if decode:
+                    decode_budget -= frame_bytes[m]
+                if decode or widths:
+                    jobs.append((paths[f], widths, decode))
+    PREFETCHER.schedule(jobs)
+    return {"ok": True, "scheduled": len(jobs)}
 
 
 # ---- API: image dimensions (needed for accurate canvas sizing) ----------
-@app.get("/api/image-size/{method_idx}/{frame_idx}")
-def get_image_size(method_idx: int, frame_idx: int):
+def _frame_path(method_idx: int, frame_idx: int) -> str:
     if method_idx < 0 or method_idx >= METHOD_COUNT:
         raise HTTPException(404, "Invalid method index")
     paths = IMG_PATHS.get(method_idx, [])
     if frame_idx < 0 or frame_idx >= len(paths):
         raise HTTPException(404, "Invalid frame index")
-    img = cv2.imread(paths[frame_idx])
-    if img is None:
+    return paths[frame_idx]
+
+
+@app.get("/api/image-size/{method_idx}/{frame_idx}")
+def get_image_size(method_idx: int, frame_idx: int):
+    size = IMAGE_SIZES.get(_frame_path(method_idx, frame_idx))
+    if size is None:
         raise HTTPException(500, "Cannot read image")
-    h, w = img.shape[:2]
+    w, h = size
     return {"width": w, "height": h}
 
 
+class FrameMetaRequest(BaseModel):
+    items: List[List[int]]  # [[method_idx, frame_idx], ...]
+
+
+@app.post("/api/frame-meta")
+def frame_meta(req: FrameMetaRequest):
+    """Bulk image sizes and versions; unknown or unreadable entries get nulls."""
+    out = []
+    for item in req.items:
+        if len(item) != 2:
+            raise HTTPException(400, "Each item must be [method_idx, frame_idx]")
+        method_idx, frame_idx = item
+        try:
+            path = _frame_path(method_idx, frame_idx)
+        except HTTPException:
+            path = None
+        size = IMAGE_SIZES.get(path) if path else None
+        out.append({
+            "method_idx": method_idx,
+            "frame_idx": frame_idx,
+            "width": size[0] if size else None,
+            "height": size[1] if size else None,
+            "version": file_version(path) if size else None,
+        })
+    return {"items": out}
+
+
+@app.get("/api/cache-stats")
+def cache_stats():
+    return {
+        "decoded_images": DECODED_IMAGES.stats(),
+        "tiles": TILE_IMAGES.stats(),
+        "encoded_images": ENCODED_IMAGES.stats(),
+        "stitch_blocks": STITCH_BLOCKS.stats(),
+        "scheduler": SCHEDULER.stats(),
+        "jobs": JOBS.stats(),
+    }
+
+
 # ---- API: crop management -----------------------------------------------
 class CropItem(BaseModel):
     img_idx: int
@@ -243,6 +537,14 @@ class StitchExportRequest(BaseModel):
     font_size: int = 16
     big_image_width: int = 220
     method_aliases: dict[str, str] = {}
+    pdf_dpi: int = 0  # 0: lossless, embed blocks at source resolution
+    pdf_resample: str = "area"
+
+
+class StitchPreviewRequest(StitchExportRequest):
+    example: int = 0
+    scale: float = 1.0  # device pixels per CSS pixel
+    quality: Optional[int] = None
 
 
 class StitchConfigYamlRequest(BaseModel):
@@ -302,7 +604,11 @@ def _normalize_stitch_payload(data: dict) -> dict:
         "font_size": max(8, int(data.get("font_size", 16))),
         "big_image_width": max(60, int(data.get("big_image_width", 220))),
         "method_aliases": aliases,
+        "pdf_dpi": max(0, int(data.get("pdf_dpi", 0) or 0)),
+        "pdf_resample": str(data.get("pdf_resample", "area")),
     }
+    if out["pdf_resample"] not in RESAMPLE_FILTERS:
+        raise ValueError(f"pdf_resample 必须是 {', '.join(RESAMPLE_FILTERS)} 之一")
 
     colors = out["patch_border_colors"]
     if not isinstance(colors, list) or len(colors) == 0:
@@ -356,6 +662,8 @@ def _yaml_to_payload(yaml_text: str) -> dict:
         "font_size": data.get("font_size", 16),
         "big_image_width": data.get("big_image_width", 220),
         "method_aliases": data.get("method_aliases", {name: name for name in idx_to_name}),
+        "pdf_dpi": data.get("pdf_dpi", 0),
+        "pdf_resample": data.get("pdf_resample", "area"),
     }
     return _normalize_stitch_payload(payload)
 
@@ -378,61 +686,11 @@ def _payload_to_yaml_dict(payload: dict) -> dict:
         "font_size": payload["font_size"],
         "big_image_width": payload["big_image_width"],
         "method_aliases": payload["method_aliases"],
+        "pdf_dpi": payload["pdf_dpi"],
+        "pdf_resample": payload["pdf_resample"],
     }
 
 
-def _stack_h(images: list[np.ndarray], gap: int) -> np.ndarray:
-    if not images:
-        return np.zeros((1, 1, 3), dtype=np.uint8)
-    max_h = max(img.shape[0] for img in images)
-    total_w = sum(img.shape[1] for img in images) + gap * max(0, len(images) - 1)
-    canvas = np.full((max_h, total_w, 3), 255, dtype=np.uint8)
-    x = 0
-    for img in images:
-        h, w = img.shape[:2]
-        canvas[0:h, x:x + w] = img
-        x += w + gap
-    return canvas
-
-
-def _stack_v(images: list[np.ndarray], gap: int) -> np.ndarray:
-    if not images:
-        return np.zeros((1, 1, 3), dtype=np.uint8)
-    max_w = max(img.shape[1] for img in images)
-    total_h = sum(img.shape[0] for img in images) + gap * max(0, len(images) - 1)
-    canvas = np.full((total_h, max_w, 3), 255, dtype=np.uint8)
-    y = 0
-    for img in images:
-        h, w = img.shape[:2]
-        canvas[y:y + h, 0:w] = img
-        y += h + gap
-    return canvas
-
-
-def _add_border(img: np.ndarray, bgr: tuple[int, int, int], width: int) -> np.ndarray:
-    if width <= 0:
-        return img.copy()
-    return cv2.copyMakeBorder(img, width, width, width, width, cv2.BORDER_CONSTANT, value=bgr)
-
-
-def _draw_boxes(img: np.ndarray, boxes: list[list[int]], colors: list[str], width: int) -> np.ndarray:
-    out = img.copy()
-    if width <= 0:
-        return out
-    h, w = out.shape[:2]
-    for i, box in enumerate(boxes):
-        if not isinstance(box, list) or len(box) != 4:
-            continue
-        x1, y1, x2, y2 = box
-        x1c = max(0, min(int(x1), w - 1))
-        y1c = max(0, min(int(y1), h - 1))
-        x2c = max(x1c + 1, min(int(x2), w))
-        y2c = max(y1c + 1, min(int(y2), h))
-        bgr = _parse_color_bgr(colors[i % len(colors)])
-        cv2.rectangle(out, (x1c, y1c), (x2c, y2c), bgr, width)
-    return out
-
-
 _PDF_FONT_CACHE: dict[str, str] = {}
 
 
@@ -500,178 +758,23 @@ def _register_pdf_font(font_family_css: str) -> str:
     return "Helvetica"
 
 
-def _pdf_string_width(text: str, font_name: str, font_size: float) -> float:
-    try:
-        return float(pdfmetrics.stringWidth(text, font_name, font_size))
-    except Exception:
-        return float(len(text) * font_size * 0.5)
-
-
-def _layout_h(images: list[np.ndarray], gap: int) -> tuple[np.ndarray, list[int]]:
-    if not images:
-        return np.zeros((1, 1, 3), dtype=np.uint8), []
-    max_h = max(img.shape[0] for img in images)
-    total_w = sum(img.shape[1] for img in images) + gap * max(0, len(images) - 1)
-    canvas = np.full((max_h, total_w, 3), 255, dtype=np.uint8)
-    starts: list[int] = []
-    x = 0
-    for img in images:
-        h, w = img.shape[:2]
-        canvas[0:h, x:x + w] = img
-        starts.append(x)
-        x += w + gap
-    return canvas, starts
-
-
-def _layout_v(images: list[np.ndarray], gap: int) -> tuple[np.ndarray, list[int]]:
-    if not images:
-        return np.zeros((1, 1, 3), dtype=np.uint8), []
-    max_w = max(img.shape[1] for img in images)
-    total_h = sum(img.shape[0] for img in images) + gap * max(0, len(images) - 1)
-    canvas = np.full((total_h, max_w, 3), 255, dtype=np.uint8)
-    starts: list[int] = []
-    y = 0
-    for img in images:
-        h, w = img.shape[:2]
-        canvas[y:y + h, 0:w] = img
-        starts.append(y)
-        y += h + gap
-    return canvas, starts
+def _stitch_frame_sources(frame_indices: list[int], grouped: dict[int, list[list[int]]], slot_methods: list[int]):
+    """(slot_paths, boxes) per example for STITCH_RENDERER; missing frames are None."""
+    for frame_idx in frame_indices:
+        paths = []
+        for m_idx in slot_methods:
+            method_paths = IMG_PATHS.get(m_idx, [])
+            paths.append(method_paths[frame_idx] if 0 <= frame_idx < len(method_paths) else None)
+        yield paths, grouped.get(frame_idx, [])
 
 
-def _build_method_content_and_scale(
-    frame_idx: int,
-    method_idx: int,
-    boxes: list[list[int]],
-    payload: dict,
-    target_content_width: Optional[int] = None,
-) -> Optional[tuple[np.ndarray, float]]:
-    paths = IMG_PATHS.get(method_idx, [])
-    if frame_idx < 0 or frame_idx >= len(paths):
-        return None
-    full = cv2.imread(paths[frame_idx])
-    if full is None:
-        return None
-
-    colors = payload["patch_border_colors"]
-    patch_cnt = min(max(1, payload["patches_per_example"]), len(boxes))
-    use_boxes = boxes[:patch_cnt]
-    h, w = full.shape[:2]
-
-    preview_big_w = max(1, int(payload.get("big_image_width", 220)))
-    scale_ratio = max(1e-6, w / float(preview_big_w))
-
-    full_marked = _draw_boxes(full, use_boxes, colors, payload["full_box_border_width"])
+def _stitch_pdf_chunks(req: StitchExportRequest,
+                       progress: Optional[Callable[[int, int, int, int], None]] = None) -> Iterator[bytes]:
+    """Validate *req* and return a generator of the lossless PDF, one page per chunk.
 
-    raw_patches: list[np.ndarray] = []
-    for box in use_boxes:
-        x1, y1, x2, y2 = box
-        x1c = max(0, min(int(x1), w - 1))
-        y1c = max(0, min(int(y1), h - 1))
-        x2c = max(x1c + 1, min(int(x2), w))
-        y2c = max(y1c + 1, min(int(y2), h))
-        patch = full[y1c:y2c, x1c:x2c]
-        raw_patches.append(patch)
-
-    patch_inner_gap = max(0, int(round((payload["patch_big_gap"] // 2) * scale_ratio)))
-    patch_outer_gap = max(0, int(round(payload["patch_big_gap"] * scale_ratio)))
-    patch_border_w = max(0, int(payload.get("patch_border_width", 0)))
-    patches: list[np.ndarray] = []
-
-    if raw_patches:
-        gap_total = patch_inner_gap * max(0, patch_cnt - 1)
-        if payload["patch_position"] == "right":
-            axis_limit = h
-        else:
-            axis_limit = w
-
-        patch_axis_total = max(patch_cnt, axis_limit - gap_total)
-
-        patch_axis_base = patch_axis_total // patch_cnt
-        patch_axis_remain = patch_axis_total
-
-        for i, patch in enumerate(raw_patches):
-            ph, pw = patch.shape[:2]
-            axis_size = patch_axis_remain if i == patch_cnt - 1 else patch_axis_base
-            patch_axis_remain -= axis_size
-
-            if payload["patch_position"] == "right":
-                target_h = max(1, int(axis_size))
-                target_w = max(1, int(round(pw * target_h / max(ph, 1))))
-            else:
-                target_w = max(1, int(axis_size))
-                target_h = max(1, int(round(ph * target_w / max(pw, 1))))
-
-            interp = cv2.INTER_CUBIC if (target_w > pw or target_h > ph) else cv2.INTER_AREA
-            patch_resized = cv2.resize(patch, (target_w, target_h), interpolation=interp)
-
-            bgr = _parse_color_bgr(colors[i % len(colors)])
-            patches.append(_add_border(patch_resized, bgr, patch_border_w))
-
-    patch_strip = None
-    if patches:
-        if payload["patch_position"] == "right":
-            patch_strip = _stack_v(patches, patch_inner_gap)
-            if patch_strip.shape[0] > full_marked.shape[0] and patch_strip.shape[1] > 0:
-                ratio = full_marked.shape[0] / float(max(1, patch_strip.shape[0]))
-                dst_w = max(1, int(round(patch_strip.shape[1] * ratio)))
-                patch_strip = cv2.resize(patch_strip, (dst_w, full_marked.shape[0]), interpolation=cv2.INTER_AREA)
-        else:
-            patch_strip = _stack_h(patches, patch_inner_gap)
-            if patch_strip.shape[1] > full_marked.shape[1] and patch_strip.shape[0] > 0:
-                ratio = full_marked.shape[1] / float(max(1, patch_strip.shape[1]))
-                dst_h = max(1, int(round(patch_strip.shape[0] * ratio)))
-                patch_strip = cv2.resize(patch_strip, (full_marked.shape[1], dst_h), interpolation=cv2.INTER_AREA)
-
-    if patch_strip is None:
-        content = full_marked
-    elif payload["patch_position"] == "right":
-        content = _stack_h([full_marked, patch_strip], patch_outer_gap)
-    else:
-        content = _stack_v([full_marked, patch_strip], patch_outer_gap)
-
-    if target_content_width is not None and target_content_width > 0 and content.shape[1] > 0:
-        src_w = int(content.shape[1])
-        dst_w = int(target_content_width)
-        if src_w != dst_w:
-            resize_ratio = dst_w / float(src_w)
-            dst_h = max(1, int(round(content.shape[0] * resize_ratio)))
-            interp = cv2.INTER_CUBIC if resize_ratio > 1.0 else cv2.INTER_AREA
-            content = cv2.resize(content, (dst_w, dst_h), interpolation=interp)
-            scale_ratio *= resize_ratio
-
-    return content, scale_ratio
-
-
-def _method_block_original_res(
-    frame_idx: int,
-    method_idx: int,
-    boxes: list[list[int]],
-    payload: dict,
-    label_tag: str,
-    label_text: str,
-) -> Optional[np.ndarray]:
-    built = _build_method_content_and_scale(frame_idx, method_idx, boxes, payload)
-    if built is None:
-        return None
-    content, scale_ratio = built
-
-    text = f"({label_tag}) {label_text}"
-    scaled_font_px = payload["font_size"] * scale_ratio
-    scale = max(0.5, scaled_font_px / 24.0)
-    thickness = max(1, int(round(scale * 2)))
-    (tw, th), bl = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
-    label_pad = max(4, int(round(8 * scale_ratio)))
-    label_h = th + bl + label_pad
-    block = np.full((content.shape[0] + label_h, content.shape[1], 3), 255, dtype=np.uint8)
-    block[:content.shape[0], :content.shape[1]] = content
-    tx = max(0, (content.shape[1] - tw) // 2)
-    ty = content.shape[0] + th + max(1, label_pad // 4)
-    cv2.putText(block, text, (tx, ty), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), thickness, cv2.LINE_AA)
-    return block
-
-
-def _build_lossless_pdf_bytes(req: StitchExportRequest) -> bytes:
+    *progress* is called as (frames_done, frames_total, blocks_done,
+    blocks_total) after each example.
+    """
     payload = _normalize_stitch_payload(req.model_dump())
     if not CROP_PATCHES:
         raise ValueError("No saved crops. Please save crops first.")
@@ -690,105 +793,68 @@ def _build_lossless_pdf_bytes(req: StitchExportRequest) -> bytes:
     alias_map = payload.get("method_aliases", {})
     flat_order = [m for row in payload["method_grid"] for m in row]
     font_name = _register_pdf_font(payload.get("font_family", ""))
+    gap = payload["image_gap"]
 
-    pdf_buf = io.BytesIO()
-    pdf = pdf_canvas.Canvas(pdf_buf)
-    target_width_by_slot: dict[int, int] = {}
-
-    for frame_order, frame_idx in enumerate(frame_indices):
-        boxes = grouped.get(frame_idx, [])
-        row_imgs: list[np.ndarray] = []
-        row_starts: list[int] = []
-        page_labels: list[dict] = []
-        slot_idx = 0
-
-        for row in payload["method_grid"]:
-            method_contents: list[np.ndarray] = []
-            method_texts: list[str] = []
-            method_fonts: list[float] = []
-            for m_idx in row:
-                method_name = idx_to_name[m_idx]
-                alias = alias_map.get(method_name, method_name)
-                order_idx = flat_order.index(m_idx) if m_idx in flat_order else 0
-                tag = _index_to_alpha_tag(order_idx)
-                target_w = target_width_by_slot.get(slot_idx)
-                built = _build_method_content_and_scale(
-                    frame_idx,
-                    m_idx,
-                    boxes,
-                    payload,
-                    target_content_width=target_w,
-                )
-                slot_idx += 1
-                if built is None:
-                    continue
-                content, scale_ratio = built
-                if frame_order == 0 and target_w is None:
-                    target_width_by_slot[slot_idx - 1] = int(content.shape[1])
-                method_contents.append(content)
-                method_texts.append(f"({tag}) {alias}")
-                method_fonts.append(max(1.0, float(payload["font_size"]) * float(scale_ratio)))
-
-            if not method_contents:
-                continue
-
-            row_content, starts = _layout_h(method_contents, payload["image_gap"])
-            row_h, row_w = row_content.shape[:2]
-            row_label_h = max(8, int(round(max(method_fonts) * 1.4)))
-            row_img = np.full((row_h + row_label_h, row_w, 3), 255, dtype=np.uint8)
-            row_img[:row_h, :row_w] = row_content
-
-            row_top_in_page = 0
-            if row_imgs:
-                row_top_in_page = sum(img.shape[0] for img in row_imgs) + payload["image_gap"] * len(row_imgs)
-            row_starts.append(row_top_in_page)
-            row_imgs.append(row_img)
-
-            for idx, x0 in enumerate(starts):
-                page_labels.append({
-                    "text": method_texts[idx],
-                    "font_size": method_fonts[idx],
-                    "method_x": x0,
-                    "method_w": int(method_contents[idx].shape[1]),
-                    "row_top": row_top_in_page,
-                    "row_content_h": row_h,
-                    "row_label_h": row_label_h,
-                })
-
-        if not row_imgs:
-            continue
-
-        page_img, _ = _layout_v(row_imgs, payload["image_gap"])
-        h, w = page_img.shape[:2]
-        ok, png_buf = cv2.imencode(".png", page_img)
-        if not ok:
-            raise ValueError("PNG encoding failed for PDF page")
-
-        pdf.setPageSize((w, h))
-        pdf.drawImage(ImageReader(io.BytesIO(png_buf.tobytes())), 0, 0, width=w, height=h, mask="auto")
-
-        for item in page_labels:
-            text = str(item["text"])
-            font_size = float(item["font_size"])
-            method_x = float(item["method_x"])
-            method_w = float(item["method_w"])
-            row_top = float(item["row_top"])
-            row_content_h = float(item["row_content_h"])
-            row_label_h = float(item["row_label_h"])
-
-            text_w = _pdf_string_width(text, font_name, font_size)
-            text_x = method_x + max(0.0, (method_w - text_w) / 2.0)
-            baseline_top = row_top + row_content_h + row_label_h * 0.72
-            text_y = h - baseline_top
-
-            pdf.setFillColorRGB(0, 0, 0)
-            pdf.setFont(font_name, font_size)
-            pdf.drawString(text_x, text_y, text)
-
-        pdf.showPage()
-
-    pdf.save()
-    return pdf_buf.getvalue()
+    def _chunks() -> Iterator[bytes]:
+        pdf = PdfStreamWriter(font_name)
+        finished = False
+        try:
+            frames = STITCH_RENDERER.iter_frames(
+                _stitch_frame_sources(frame_indices, grouped, flat_order), payload, encoding="flate"
+            )
+            for done, blocks in enumerate(frames, 1):
+                page_images: list[tuple[float, float, FlateImage, float, float]] = []
+                page_texts: list[tuple[float, float, float, str]] = []
+                page_w = 0
+                row_top = 0
+                slot_idx = 0
+
+                for row in payload["method_grid"]:
+                    row_blocks: list[tuple[RenderedBlock, str, float]] = []
+                    for m_idx in row:
+                        method_name = idx_to_name[m_idx]
+                        alias = alias_map.get(method_name, method_name)
+                        order_idx = flat_order.index(m_idx) if m_idx in flat_order else 0
+                        tag = _index_to_alpha_tag(order_idx)
+                        block = blocks[slot_idx]
+                        slot_idx += 1
+                        if block is None:
+                            continue
+                        font_size = max(1.0, float(payload["font_size"]) * float(block.scale_ratio))
+                        row_blocks.append((block, f"({tag}) {alias}", font_size))
+
+                    if not row_blocks:
+                        continue
+
+                    if page_images:
+                        row_top += gap
+                    row_h = max(block.height for block, _, _ in row_blocks)
+                    row_label_h = max(8, int(round(max(size for _, _, size in row_blocks) * 1.4)))
+                    x0 = 0
+                    for block, text, font_size in row_blocks:
+                        pw, ph = block.data_size or (block.width, block.height)
+                        page_images.append((x0, row_top, FlateImage(pw, ph, block.data), block.width, block.height))
+                        text_w = pdf.string_width(text, font_size)
+                        text_x = x0 + max(0.0, (block.width - text_w) / 2.0)
+                        page_texts.append((text_x, row_top + row_h + row_label_h * 0.72, font_size, text))
+                        x0 += block.width + gap
+                    page_w = max(page_w, x0 - gap)
+                    row_top += row_h + row_label_h
+
+                if page_images:
+                    pdf.add_page(page_w, row_top, page_images, page_texts)
+                    yield pdf.drain()
+                if progress is not None:
+                    n = len(frame_indices)
+                    progress(done, n, done * len(flat_order), n * len(flat_order))
+
+            yield pdf.close()
+            finished = True
+        finally:
+            if not finished:
+                pdf.discard()
+
+    return _chunks()
 
 
 @app.post("/api/stitch-config/export-yaml")
@@ -815,35 +881,22 @@ def import_stitch_config_yaml(req: StitchConfigYamlRequest):
 
 
 @app.post("/api/stitch-export-pdf-lossless")
-def stitch_export_pdf_lossless(req: StitchExportRequest):
+async def stitch_export_pdf_lossless(req: StitchExportRequest):
     try:
-        pdf_bytes = _build_lossless_pdf_bytes(req)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        headers = {"Content-Disposition": f'attachment; filename="cherrypicker_stitch_lossless_{ts}.pdf"'}
-        return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
+        chunks = _stitch_pdf_chunks(req)
     except ValueError as e:
         raise HTTPException(400, str(e))
-    except Exception as e:
-        logger.exception("stitch-export-pdf-lossless failed")
-        raise HTTPException(500, str(e))
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    headers = {"Content-Disposition": f'attachment; filename="cherrypicker_stitch_lossless_{ts}.pdf"'}
+    return StreamingResponse(_stream_heavy(chunks, "stitch-export-pdf-lossless"),
+                             media_type="application/pdf", headers=headers)
 
 
-def _img_to_data_url(img: np.ndarray) -> str:
-    ok, buf = cv2.imencode(".png", img)
-    if not ok:
-        raise ValueError("Image encoding failed")
-    b64 = base64.b64encode(buf.tobytes()).decode("ascii")
+def _png_data_url(data: bytes) -> str:
+    b64 = base64.b64encode(data).decode("ascii")
     return f"data:image/png;base64,{b64}"
 
 
-def _parse_color_bgr(color_name: str) -> tuple[int, int, int]:
-    try:
-        rgb = webcolors.name_to_rgb(color_name)
-        return (int(rgb.blue), int(rgb.green), int(rgb.red))
-    except Exception:
-        return (0, 0, 255)
-
-
 def _index_to_alpha_tag(idx: int) -> str:
     n = idx
     out = ""
@@ -853,7 +906,14 @@ def _index_to_alpha_tag(idx: int) -> str:
     return out
 
 
-def _build_stitch_html(req: StitchExportRequest) -> str:
+def _stitch_html_chunks(req: StitchExportRequest,
+                        image_src: Optional[Callable[[RenderedBlock], str]] = None,
+                        progress: Optional[Callable[[int, int, int, int], None]] = None) -> Iterator[str]:
+    """Validate *req* and return a generator of the export, one example per chunk.
+
+    Blocks are inlined as data URLs unless *image_src* maps them to a URL.
+    *progress* is reported as in _stitch_pdf_chunks.
+    """
     payload = _normalize_stitch_payload(req.model_dump())
     if not CROP_PATCHES:
         raise ValueError("No saved crops. Please save crops first.")
@@ -874,160 +934,202 @@ def _build_stitch_html(req: StitchExportRequest) -> str:
     idx_to_name, _ = _method_name_index_maps()
     flat_method_order = [m for row in payload["method_grid"] for m in row]
 
-    html_parts = []
-    html_parts.append("<!DOCTYPE html><html><head><meta charset='UTF-8' />")
-    html_parts.append("<meta name='viewport' content='width=device-width, initial-scale=1.0' />")
-    html_parts.append("<title>CherryPicker Stitch Export</title>")
-    html_parts.append("<style>")
-    html_parts.append(
-        "body{margin:0;padding:18px;background:#fff;color:#111;}"
-        f".root{{display:flex;flex-direction:column;gap:{example_gap}px;}}"
-        ".example{padding:0;overflow-x:auto;}"
-        ".st-row{display:flex;flex-wrap:nowrap;align-items:flex-start;width:max-content;margin-bottom:10px;}"
-        ".method{display:flex;flex-direction:column;align-items:center;width:max-content;}"
-        ".method-img{display:block;height:auto;}"
-        ".method-label{font-weight:600;margin-top:6px;text-align:center;}"
-        "@media print{body{padding:8px;} .example{break-inside:avoid;}}"
-    )
-    html_parts.append("</style></head><body>")
-    html_parts.append(
-        f"<div class='root' style='font-family:{escape(payload['font_family'])};font-size:{font_size}px;'>"
-    )
-
-    target_width_by_slot: dict[int, int] = {}
-    for frame_order, frame_idx in enumerate(frame_indices):
-        boxes = grouped[frame_idx]
-        html_parts.append("<div class='example'>")
-        slot_idx = 0
-
-        for row in payload["method_grid"]:
-            html_parts.append(f"<div class='st-row' style='gap:{image_gap}px;'>")
-            for m_idx in row:
-                method_name = idx_to_name[m_idx]
-                alias_name = alias_map.get(method_name, method_name)
-                label_index = max(0, flat_method_order.index(m_idx)) if flat_method_order else 0
-                label_tag = _index_to_alpha_tag(label_index)
-
-                target_w = target_width_by_slot.get(slot_idx)
-                built = _build_method_content_and_scale(
-                    frame_idx,
-                    m_idx,
-                    boxes,
-                    payload,
-                    target_content_width=target_w,
-                )
-                slot_idx += 1
-                if built is None:
-                    continue
-
-                content, scale_ratio = built
-                if frame_order == 0 and target_w is None:
-                    target_width_by_slot[slot_idx - 1] = int(content.shape[1])
+    def _chunks() -> Iterator[str]:
+        html_parts = []
+        html_parts.append("<!DOCTYPE html><html><head><meta charset='UTF-8' />")
+        html_parts.append("<meta name='viewport' content='width=device-width, initial-scale=1.0' />")
+        html_parts.append("<title>CherryPicker Stitch Export</title>")
+        html_parts.append("<style>")
+        html_parts.append(
+            "body{margin:0;padding:18px;background:#fff;color:#111;}"
+            f".root{{display:flex;flex-direction:column;gap:{example_gap}px;}}"
+            ".example{padding:0;overflow-x:auto;}"
+            ".st-row{display:flex;flex-wrap:nowrap;align-items:flex-start;width:max-content;margin-bottom:10px;}"
+            ".method{display:flex;flex-direction:column;align-items:center;width:max-content;}"
+            ".method-img{display:block;height:auto;}"
+            ".method-label{font-weight:600;margin-top:6px;text-align:center;}"
+            "@media print{body{padding:8px;} .example{break-inside:avoid;}}"
+        )
+        html_parts.append("</style></head><body>")
+        html_parts.append(
+            f"<div class='root' style='font-family:{escape(payload['font_family'])};font-size:{font_size}px;'>"
+        )
+        yield "".join(html_parts)
 
-                content_url = _img_to_data_url(content)
-                label_px = max(8, int(round(font_size * scale_ratio)))
+        frames = STITCH_RENDERER.iter_frames(
+            _stitch_frame_sources(frame_indices, grouped, flat_method_order), payload, encoding="png"
+        )
+        for done, blocks in enumerate(frames, 1):
+            html_parts = ["<div class='example'>"]
+            slot_idx = 0
+
+            for row in payload["method_grid"]:
+                html_parts.append(f"<div class='st-row' style='gap:{image_gap}px;'>")
+                for m_idx in row:
+                    method_name = idx_to_name[m_idx]
+                    alias_name = alias_map.get(method_name, method_name)
+                    label_index = max(0, flat_method_order.index(m_idx)) if flat_method_order else 0
+                    label_tag = _index_to_alpha_tag(label_index)
+
+                    block = blocks[slot_idx]
+                    slot_idx += 1
+                    if block is None:
+                        continue
+
+                    content_url = image_src(block) if image_src else _png_data_url(block.data)
+                    label_px = max(8, int(round(font_size * block.scale_ratio)))
+
+                    html_parts.append("<div class='method'>")
+                    html_parts.append(
+                        f"<img class='method-img' src='{content_url}' alt='method-content' style='width:{block.width}px;' />"
+                    )
+                    html_parts.append(
+                        f"<div class='method-label' style='font-size:{label_px}px;'>({label_tag}) {escape(alias_name)}</div>"
+                    )
+                    html_parts.append("</div>")
 
-                html_parts.append("<div class='method'>")
-                html_parts.append(
-                    f"<img class='method-img' src='{content_url}' alt='method-content' style='width:{int(content.shape[1])}px;' />"
-                )
-                html_parts.append(
-                    f"<div class='method-label' style='font-size:{label_px}px;'>({label_tag}) {escape(alias_name)}</div>"
-                )
                 html_parts.append("</div>")
 
             html_parts.append("</div>")
+            yield "".join(html_parts)
+            if progress is not None:
+                n = len(frame_indices)
+                progress(done, n, done * len(flat_method_order), n * len(flat_method_order))
 
-        html_parts.append("</div>")
+        yield "</div></body></html>"
 
-    html_parts.append("</div></body></html>")
-    return "".join(html_parts)
+    return _chunks()
 
 
 @app.post("/api/stitch-export-html")
-def stitch_export_html(req: StitchExportRequest):
+async def stitch_export_html(req: StitchExportRequest):
     try:
-        html_text = _build_stitch_html(req)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"cherrypicker_stitch_{ts}.html"
-        headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
-        return Response(content=html_text, media_type="text/html; charset=utf-8", headers=headers)
+        chunks = _stitch_html_chunks(req)
     except ValueError as e:
         raise HTTPException(400, str(e))
-    except Exception as e:
-        logger.exception("stitch-export-html failed")
-        raise HTTPException(500, str(e))
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"cherrypicker_stitch_{ts}.html"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    return StreamingResponse(_stream_heavy(chunks, "stitch-export-html"),
+                             media_type="text/html; charset=utf-8", headers=headers)
 
 
 @app.post("/api/stitch-export-html/")
-def stitch_export_html_trailing(req: StitchExportRequest):
-    return stitch_export_html(req)
+async def stitch_export_html_trailing(req: StitchExportRequest):
+    return await stitch_export_html(req)
+
+
+def _stitch_zip_chunks(req: StitchExportRequest,
+                       progress: Optional[Callable[[int, int, int, int], None]] = None) -> Iterator[bytes]:
+    """Zip of index.html plus one PNG per distinct block, streamed as produced."""
+    archive = ZipStream()
+    written: set[str] = set()
+
+    def _image_src(block: RenderedBlock) -> str:
+        name = f"images/{hashlib.sha1(block.data).hexdigest()[:20]}.png"
+        if name not in written:
+            written.add(name)
+            archive.add(name, block.data)
+        return name
+
+    html = _stitch_html_chunks(req, image_src=_image_src, progress=progress)
+
+    def _chunks() -> Iterator[bytes]:
+        html_parts = []
+        for part in html:
+            html_parts.append(part)
+            data = archive.drain()
+            if data:
+                yield data
+        archive.add("index.html", "".join(html_parts).encode("utf-8"), compress=True)
+        yield archive.close()
+    return _chunks()
+
+
+@app.post("/api/stitch-export-zip")
+async def stitch_export_zip(req: StitchExportRequest):
+    try:
+        chunks = _stitch_zip_chunks(req)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    headers = {"Content-Disposition": f'attachment; filename="cherrypicker_stitch_{ts}.zip"'}
+    return StreamingResponse(_stream_heavy(chunks, "stitch-export-zip"),
+                             media_type="application/zip", headers=headers)
 
 
 @app.get("/api/image-boxed/{method_idx}/{frame_idx}")
 def image_boxed(
+    request: Request,
     method_idx: int,
     frame_idx: int,
     boxes_json: str = Query("[]"),
     colors: str = Query(""),
     border_width: int = Query(2),
+    v: Optional[str] = Query(None),
+    quality: Optional[int] = Query(None, ge=1, le=100),
 ):
-    if method_idx < 0 or method_idx >= METHOD_COUNT:
-        raise HTTPException(404, "Invalid method index")
-    paths = IMG_PATHS.get(method_idx, [])
-    if frame_idx < 0 or frame_idx >= len(paths):
-        raise HTTPException(404, "Invalid frame index")
+    path = _frame_path(method_idx, frame_idx)
 
-    img = cv2.imread(paths[frame_idx])
-    if img is None:
-        raise HTTPException(500, "Cannot read image")
+    def _render():
+        cached = DECODED_IMAGES.get(path)
+        if cached is None:
+            raise HTTPException(500, "Cannot read image")
+        img = cached.copy()
 
-    try:
-        parsed_boxes = json.loads(boxes_json)
-        if not isinstance(parsed_boxes, list):
+        try:
+            parsed_boxes = json.loads(boxes_json)
+            if not isinstance(parsed_boxes, list):
+                parsed_boxes = []
+        except Exception:
             parsed_boxes = []
-    except Exception:
-        parsed_boxes = []
 
-    color_names = [x.strip() for x in colors.split(",") if x.strip()]
-    if not color_names:
-        color_names = ["red"]
+        color_names = [x.strip() for x in colors.split(",") if x.strip()]
+        if not color_names:
+            color_names = ["red"]
 
-    h, w = img.shape[:2]
-    bw = max(0, int(border_width))
-    for i, box in enumerate(parsed_boxes):
-        if not isinstance(box, list) or len(box) != 4:
-            continue
-        x1, y1, x2, y2 = box
-        x1c = max(0, min(int(x1), w - 1))
-        y1c = max(0, min(int(y1), h - 1))
-        x2c = max(x1c + 1, min(int(x2), w))
-        y2c = max(y1c + 1, min(int(y2), h))
-        bgr = _parse_color_bgr(color_names[i % len(color_names)])
-        if bw > 0:
-            cv2.rectangle(img, (x1c, y1c), (x2c, y2c), bgr, bw)
-
-    ok, buf = cv2.imencode(".png", img)
-    if not ok:
-        raise HTTPException(500, "Encoding failed")
-    return Response(content=buf.tobytes(), media_type="image/png")
+        h, w = img.shape[:2]
+        bw = max(0, int(border_width))
+        for i, box in enumerate(parsed_boxes):
+            if not isinstance(box, list) or len(box) != 4:
+                continue
+            x1, y1, x2, y2 = box
+            x1c = max(0, min(int(x1), w - 1))
+            y1c = max(0, min(int(y1), h - 1))
+            x2c = max(x1c + 1, min(int(x2), w))
+            y2c = max(y1c + 1, min(int(y2), h))
+            bgr = parse_color_bgr(color_names[i % len(color_names)])
+            if bw > 0:
+                cv2.rectangle(img, (x1c, y1c), (x2c, y2c), bgr, bw)
+        return img, {}
+
+    return _encoded_response(request, "image-boxed", path, v, quality,
+                             (boxes_json, colors, border_width), _render)
 
 
 # ---- API: generate cropped images & PPT ---------------------------------
 @app.post("/api/make-crops")
-def api_make_crops():
+async def api_make_crops():
+    job = _submit_heavy(lambda: crop_images(CONFIG, pool=CROP_POOL))
     try:
-        crop_images(CONFIG)
+        await job
         return {"ok": True}
     except Exception as e:
         logger.exception("make-crops failed")
         raise HTTPException(500, str(e))
 
+def _make_ppt(progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """Build the PPT from the saved crops in memory, no crop directory needed."""
+    ppt_path = CONFIG.get("output_ppt_path", "output.pptx")
+    make_ppt_from_crops(CONFIG, list(CROP_PATCHES), IMG_PATHS, IMAGE_SIZES.get, ppt_path,
+                        progress=progress, pool=CROP_POOL)
+    return ppt_path
+
 @app.post("/api/make-ppt")
-def api_make_ppt():
+async def api_make_ppt():
+    job = _submit_heavy(_make_ppt)
     try:
-        make_ppt(CONFIG)
-        ppt_path = CONFIG.get("output_ppt_path", "output.pptx")
+        ppt_path = await job
         return {"ok": True, "path": ppt_path}
     except Exception as e:
         logger.exception("make-ppt failed")
@@ -1042,18 +1144,125 @@ def download_ppt():
                         media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation")
 
 
+# ---- API: background jobs -----------------------------------------------
+# Same work as the endpoints above, but the request returns a job id at once
+# and the job keeps running if the client goes away.
+_STITCH_JOB_FORMATS = {
+    "html": (_stitch_html_chunks, "cherrypicker_stitch_{ts}.html", "text/html; charset=utf-8"),
+    "zip": (_stitch_zip_chunks, "cherrypicker_stitch_{ts}.zip", "application/zip"),
+    "pdf-lossless": (_stitch_pdf_chunks, "cherrypicker_stitch_lossless_{ts}.pdf", "application/pdf"),
+}
+
+
+def _submit_job(job: Job, work: Callable[[], object]) -> dict:
+    try:
+        JOBS.submit(job, work)
+    except SchedulerBusy:
+        raise HTTPException(503, "Server busy with other exports, try again later")
+    return job.status()
+
+
+def _encode_utf8(parts: Iterator[str]) -> Iterator[bytes]:
+    """Encode *parts*; closing this generator closes *parts* too."""
+    try:
+        for part in parts:
+            yield part.encode("utf-8")
+    finally:
+        parts.close()
+
+
+@app.post("/api/jobs/stitch-export-{fmt}")
+def submit_stitch_export_job(fmt: str, req: StitchExportRequest):
+    if fmt not in _STITCH_JOB_FORMATS:
+        raise HTTPException(404, f"Unknown export format: {fmt}")
+    build, filename, media_type = _STITCH_JOB_FORMATS[fmt]
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    job = Job(f"stitch-export-{fmt}", filename.format(ts=ts), media_type)
+    try:
+        chunks = build(req, progress=job.progress)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if fmt == "html":
+        chunks = _encode_utf8(chunks)
+    return _submit_job(job, lambda: chunks)
+
+
+@app.post("/api/jobs/make-crops")
+def submit_make_crops_job():
+    job = Job("make-crops")
+    return _submit_job(job, lambda: crop_images(CONFIG, progress=job.progress, pool=CROP_POOL))
+
+
+@app.post("/api/jobs/make-ppt")
+def submit_make_ppt_job():
+    ppt_path = CONFIG.get("output_ppt_path", "output.pptx")
+    job = Job("make-ppt", os.path.basename(ppt_path),
+              "application/vnd.openxmlformats-officedocument.presentationml.presentation")
+    return _submit_job(job, lambda: _make_ppt(progress=job.progress))
+
+
+@app.get("/api/jobs")
+def list_jobs():
+    return {"jobs": JOBS.list()}
+
+
+def _get_job(job_id: str) -> Job:
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found (it may have been evicted)")
+    return job
+
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    return _get_job(job_id).status()
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    _get_job(job_id)
+    return JOBS.cancel(job_id).status()
+
+
+@app.delete("/api/jobs/{job_id}")
+def delete_job(job_id: str):
+    _get_job(job_id)
+    JOBS.remove(job_id)
+    return {"ok": True}
+
+
+@app.get("/api/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    job = _get_job(job_id)
+    if job.state != DONE:
+        raise HTTPException(409, f"Job is {job.state}")
+    path = job.result_path
+    if path is None or not os.path.isfile(path):
+        raise HTTPException(404, "Job has no result")
+    return FileResponse(path, filename=job.filename, media_type=job.media_type)
+
+
 # ---- API: serve a cropped patch preview on-the-fly ----------------------
-@app.get("/api/crop-preview/{method_idx}/{frame_idx}")
-def crop_preview(method_idx: int, frame_idx: int,
-                 x1: int = Query(...), y1: int = Query(...),
-                 x2: int = Query(...), y2: int = Query(...)):
-    """Return a cropped region of an image as PNG (for live preview)."""
-    if method_idx < 0 or method_idx >= METHOD_COUNT:
-        raise HTTPException(404, "Invalid method index")
-    paths = IMG_PATHS.get(method_idx, [])
-    if frame_idx < 0 or frame_idx >= len(paths):
-        raise HTTPException(404, "Invalid frame index")
-    img = cv2.imread(paths[frame_idx])
+def _read_crop(path: str, x1: int, y1: int, x2: int, y2: int) -> np.ndarray:
+    """Full-resolution pixels of the box, clamped to the image."""
+    img = DECODED_IMAGES.peek(path)
+    if img is None and TILE_PYRAMID:
+        # Only the tiles under the crop box are decoded
+        size = IMAGE_SIZES.get(path)
+        if size is None:
+            raise HTTPException(500, "Cannot read image")
+        w, h = size
+        x1c, y1c = max(0, x1), max(0, y1)
+        x2c, y2c = min(w, x2), min(h, y2)
+        if x2c <= x1c or y2c <= y1c:
+            raise HTTPException(400, "Invalid crop region")
+        patch = TILES.read_region(path, x1c, y1c, x2c, y2c)
+        if patch is None:
+            raise HTTPException(500, "Cannot read image")
+        return patch
+
+    if img is None:
+        img = DECODED_IMAGES.get(path)
     if img is None:
         raise HTTPException(500, "Cannot read image")
     h, w = img.shape[:2]
@@ -1061,12 +1270,197 @@ def crop_preview(method_idx: int, frame_idx: int,
     x2c, y2c = min(w, x2), min(h, y2)
     if x2c <= x1c or y2c <= y1c:
         raise HTTPException(400, "Invalid crop region")
-    patch = img[y1c:y2c, x1c:x2c]
-    # Encode to PNG in memory and return directly
-    ok, buf = cv2.imencode(".png", patch)
-    if not ok:
-        raise HTTPException(500, "Encoding failed")
-    return Response(content=buf.tobytes(), media_type="image/png")
+    return img[y1c:y2c, x1c:x2c]
+
+
+@app.get("/api/crop-preview/{method_idx}/{frame_idx}")
+def crop_preview(request: Request, method_idx: int, frame_idx: int,
+                 x1: int = Query(...), y1: int = Query(...),
+                 x2: int = Query(...), y2: int = Query(...),
+                 v: Optional[str] = Query(None),
+                 quality: Optional[int] = Query(None, ge=1, le=100)):
+    """Return a cropped region of an image (for live preview), lossless PNG by default."""
+    path = _frame_path(method_idx, frame_idx)
+    return _encoded_response(request, "crop-preview", path, v, quality, (x1, y1, x2, y2),
+                             lambda: (_read_crop(path, x1, y1, x2, y2), {}))
+
+
+@app.get("/api/crop-preview-batch/{frame_idx}")
+def crop_preview_batch(request: Request, frame_idx: int,
+                       x1: int = Query(...), y1: int = Query(...),
+                       x2: int = Query(...), y2: int = Query(...),
+                       methods: str = Query(...),
+                       v: Optional[str] = Query(None),
+                       quality: Optional[int] = Query(None, ge=1, le=100)):
+    """Crops of one frame for several methods as a single sprite sheet image.
+
+    Patches are stacked vertically in the order of *methods* (comma-separated
+    indices).  The ``X-Sprite-Layout`` header holds a JSON list of
+    ``{method_idx, x, y, w, h}``; methods whose crop failed are left out.
+    """
+    try:
+        method_list = [int(m) for m in methods.split(",") if m.strip()]
+    except ValueError:
+        raise HTTPException(400, "methods must be comma-separated indices")
+    if not method_list:
+        raise HTTPException(400, "No methods given")
+    paths = [_frame_path(m, frame_idx) for m in method_list]
+
+    def _crop_or_none(path: str) -> Optional[np.ndarray]:
+        try:
+            return _read_crop(path, x1, y1, x2, y2)
+        except HTTPException:
+            return None
+
+    def _render():
+        patches = SCHEDULER.map(INTERACTIVE, _crop_or_none, paths)
+        valid = [p for p in patches if p is not None]
+        if not valid:
+            raise HTTPException(400, "Invalid crop region")
+
+        sheet = np.zeros((sum(p.shape[0] for p in valid), max(p.shape[1] for p in valid), 3), dtype=np.uint8)
+        layout = []
+        y = 0
+        for m, patch in zip(method_list, patches):
+            if patch is None:
+                continue
+            ph, pw = patch.shape[:2]
+            sheet[y:y + ph, 0:pw] = patch
+            layout.append({"method_idx": m, "x": 0, "y": y, "w": pw, "h": ph})
+            y += ph
+        return sheet, {"X-Sprite-Layout": json.dumps(layout, separators=(",", ":"))}
+
+    return _encoded_response(request, "crop-preview-batch", paths, v, quality,
+                             (x1, y1, x2, y2, methods), _render)
+
+
+# ---- API: draft stitch preview --------------------------------------------
+# Label band under each block and margin under each row, as in style.css
+_PREVIEW_LABEL_MARGIN = 6
+_PREVIEW_ROW_MARGIN = 10
+
+
+def _preview_draft_block(path: str, size: tuple[int, int], boxes: list[list[int]], layout, payload: dict,
+                         scale: float) -> Optional[np.ndarray]:
+    need_w = max(1, round(layout.big[2] * scale))
+    reduced_path = THUMBNAILS.get(path, need_w) or path
+    reduced = DECODED_IMAGES.get(reduced_path)
+    if reduced is None:
+        return None
+    patches = []
+    for box in boxes[:len(layout.patches)]:
+        try:
+            patches.append(_read_crop(path, *(int(v) for v in box)))
+        except HTTPException:
+            patches.append(np.full((1, 1, 3), 255, dtype=np.uint8))
+    return render_draft_block(reduced, size, patches, boxes, layout, payload, scale)
+
+
+@app.post("/api/stitch-preview")
+def stitch_preview(request: Request, req: StitchPreviewRequest):
+    """One example of the stitch preview as a single display-resolution image.
+
+    Blocks are laid out like the preview page lays out its DOM; the
+    ``X-Stitch-Layout`` header holds ``{width, height, blocks}`` in CSS
+    pixels with ``{x, y, w, h, label}`` per block, so that the page can put
+    real text labels under them.  Frames are taken from the thumbnail ladder
+    and boxes and borders are drawn after downscaling.  The encoded image is
+    cached under the fields that move pixels only; labels are filled in per
+    request, so editing aliases or fonts does not re-render.
+    """
+    try:
+        payload = _normalize_stitch_payload(req.model_dump())
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    grouped: dict[int, list[list[int]]] = {}
+    for p in CROP_PATCHES:
+        grouped.setdefault(p["img_idx"], []).append(p["crop_box"])
+    frame_indices = sorted(grouped.keys())
+    if not 0 <= req.example < len(frame_indices):
+        raise HTTPException(404, "No such example")
+    scale = min(4.0, max(0.25, float(req.scale)))
+
+    idx_to_name, _ = _method_name_index_maps()
+    alias_map = payload.get("method_aliases", {})
+    flat_order = [m for row in payload["method_grid"] for m in row]
+
+    def _slots(frame_idx: int) -> list[tuple[Optional[str], Optional[tuple[int, int]]]]:
+        out = []
+        for m_idx in flat_order:
+            paths = IMG_PATHS.get(m_idx, [])
+            path = paths[frame_idx] if 0 <= frame_idx < len(paths) else None
+            out.append((path, IMAGE_SIZES.get(path) if path else None))
+        return out
+
+    first_frame = frame_indices[0]
+    targets = [
+        draft_layout(size, grouped[first_frame], payload).natural_width if size else None
+        for _, size in _slots(first_frame)
+    ]
+    frame_idx = frame_indices[req.example]
+    boxes = grouped[frame_idx]
+    slots = _slots(frame_idx)
+    paths = [p for p, _ in slots if p is not None]
+
+    def _render():
+        layouts = [
+            draft_layout(size, boxes, payload, targets[i]) if size else None
+            for i, (_, size) in enumerate(slots)
+        ]
+        pixels = SCHEDULER.map(INTERACTIVE, lambda i: _preview_draft_block(
+            slots[i][0], slots[i][1], boxes, layouts[i], payload, scale) if layouts[i] else None,
+            range(len(slots)))
+
+        placed = []
+        width = 0.0
+        y = 0.0
+        slot_idx = 0
+        label_h = _PREVIEW_LABEL_MARGIN + payload["font_size"] * 1.25
+        for row in payload["method_grid"]:
+            x = 0.0
+            row_h = 0.0
+            for m_idx in row:
+                layout, img = layouts[slot_idx], pixels[slot_idx]
+                slot_idx += 1
+                if layout is None or img is None:
+                    continue
+                placed.append(({"x": x, "y": y, "w": layout.width, "h": layout.height, "slot": slot_idx - 1}, img))
+                x += layout.width + payload["image_gap"]
+                row_h = max(row_h, layout.height)
+            width = max(width, x - payload["image_gap"])
+            y += row_h + label_h + _PREVIEW_ROW_MARGIN
+        if not placed:
+            raise HTTPException(404, "No frames for this example")
+
+        canvas = np.full((max(1, round(y * scale)), max(1, round(width * scale)), 3), 255, dtype=np.uint8)
+        for geo, img in placed:
+            x0, y0 = round(geo["x"] * scale), round(geo["y"] * scale)
+            h = min(img.shape[0], canvas.shape[0] - y0)
+            w = min(img.shape[1], canvas.shape[1] - x0)
+            canvas[y0:y0 + h, x0:x0 + w] = img[:h, :w]
+        layout_json = {
+            "width": width,
+            "height": y,
+            "blocks": [{k: (round(v, 2) if isinstance(v, float) else v) for k, v in geo.items()} for geo, _ in placed],
+        }
+        return canvas, {"X-Stitch-Layout": json.dumps(layout_json, separators=(",", ":"))}
+
+    pixel_fields = json.dumps([
+        payload["method_grid"], payload["image_gap"], payload["font_size"],
+        [payload.get(k) for k in PIXEL_FIELDS], boxes, targets, scale,
+    ], sort_keys=True, default=str)
+    response = _encoded_response(request, "stitch-preview", paths, None, req.quality, (pixel_fields,), _render)
+
+    cached_layout = response.headers.get("X-Stitch-Layout")
+    if cached_layout:
+        layout_json = json.loads(cached_layout)
+        for block in layout_json["blocks"]:
+            m_idx = flat_order[block.pop("slot")]
+            method_name = idx_to_name[m_idx]
+            tag = _index_to_alpha_tag(flat_order.index(m_idx))
+            block["label"] = f"({tag}) {alias_map.get(method_name, method_name)}"
+        response.headers["X-Stitch-Layout"] = json.dumps(layout_json, separators=(",", ":"))
+    return response
 
 
 # ---------------------------------------------------------------------------
@@ -0,0 +1,126 @@
+"""
+Persistent, incremental index of the image files under each method directory.
+
+Scanning result trees with recursive glob on every startup is slow on large
+(network) file systems.  The index stores, per method directory, a tree of
+directory mtimes and the image files (with their sizes) found in each
+directory.  On the next start only directories whose mtime changed are listed
+again with os.scandir; unchanged subtrees are reused from the index.  Methods
+are scanned in parallel.
+
+Notes:
+- File order and matching mirror the previous glob-based scan: hidden entries
+  are skipped, extensions are matched with the platform's case rules and the
+  final list is sorted by full path.
+- A file rewritten in place does not change its directory's mtime, so its
+  recorded size may be stale; the path list itself is always correct.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger("cherrypicker.index")
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp")
+INDEX_VERSION = 1
+
+
+def _index_file(cache_dir: str, root: str) -> str:
+    key = hashlib.sha1(os.path.abspath(root).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, "frame_index", f"{key}.json")
+
+
+def _load_index(index_file: str, root: str) -> Optional[dict]:
+    if not os.path.isfile(index_file):
+        return None
+    try:
+        with open(index_file, "r", encoding="utf-8") as fd:
+            data = json.load(fd)
+    except (OSError, ValueError):
+        logger.warning("Ignoring unreadable frame index: %s", index_file)
+        return None
+    if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+        return None
+    if data.get("root") != os.path.abspath(root):
+        return None
+    return data.get("tree")
+
+
+def _save_index(index_file: str, root: str, tree: dict) -> None:
+    os.makedirs(os.path.dirname(index_file), exist_ok=True)
+    tmp = f"{index_file}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fd:
+        json.dump({"version": INDEX_VERSION, "root": os.path.abspath(root), "tree": tree}, fd)
+    os.replace(tmp, index_file)
+
+
+def _scan_dir(path: str, cached: Optional[dict]) -> dict:
+    """Return the index node for *path*, listing it only if its mtime changed."""
+    mtime_ns = os.stat(path).st_mtime_ns
+    if cached is not None and cached.get("mtime_ns") == mtime_ns:
+        dirs: dict[str, dict] = {}
+        for name, sub in cached.get("dirs", {}).items():
+            try:
+                dirs[name] = _scan_dir(os.path.join(path, name), sub)
+            except OSError:
+                continue
+        return {"mtime_ns": mtime_ns, "files": cached.get("files", {}), "dirs": dirs}
+
+    old_dirs = cached.get("dirs", {}) if cached is not None else {}
+    files: dict[str, int] = {}
+    dirs = {}
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir():
+                    dirs[entry.name] = _scan_dir(entry.path, old_dirs.get(entry.name))
+                elif entry.is_file() and os.path.normcase(entry.name).endswith(IMAGE_EXTS):
+                    files[entry.name] = entry.stat().st_size
+            except OSError:
+                continue
+    return {"mtime_ns": mtime_ns, "files": files, "dirs": dirs}
+
+
+def _flatten(node: dict, path: str, exts: tuple[str, ...], out: list[str]) -> None:
+    for name in node["files"]:
+        if os.path.normcase(name).endswith(exts):
+            out.append(os.path.join(path, name))
+    for name, sub in node["dirs"].items():
+        _flatten(sub, os.path.join(path, name), exts, out)
+
+
+def scan_method_dir(root: str, cache_dir: Optional[str], exts: tuple[str, ...] = IMAGE_EXTS) -> list[str]:
+    """Sorted image paths under *root*, refreshing the on-disk index if needed."""
+    if not os.path.isdir(root):
+        logger.warning("Method directory not found: %s", root)
+        return []
+
+    index_file = _index_file(cache_dir, root) if cache_dir else None
+    cached = _load_index(index_file, root) if index_file else None
+    tree = _scan_dir(root, cached)
+    if index_file and tree != cached:
+        try:
+            _save_index(index_file, root, tree)
+        except OSError as e:
+            logger.warning("Cannot write frame index %s: %s", index_file, e)
+
+    paths: list[str] = []
+    _flatten(tree, root, exts, paths)
+    return sorted(paths)
+
+
+def load_image_paths(config: dict, exts: tuple[str, ...] = IMAGE_EXTS) -> dict[int, list[str]]:
+    """Image paths of every configured method, scanned in parallel."""
+    cache_dir = config.get("cache_path", ".cherrypicker_cache")
+    roots = [m["path"] for m in config["methods"]]
+    if not roots:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(16, len(roots))) as pool:
+        results = list(pool.map(lambda root: scan_method_dir(root, cache_dir, exts), roots))
+    return dict(enumerate(results))
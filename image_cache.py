@@ -0,0 +1,127 @@
+"""
+Process-wide caches for decoded images.
+
+ByteBudgetLRU is a thread-safe LRU bounded by the total size of its values.
+DecodedImageCache builds on it to share cv2.imread results between all
+endpoints, keyed by (path, mtime) so that rewritten files are re-read.
+
+Decoded arrays are returned read-only; callers that draw on an image must
+copy it first.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import cv2
+import numpy as np
+
+
+class ByteBudgetLRU:
+    """Thread-safe LRU mapping evicting least-recently-used items over *max_bytes*."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, int(max_bytes))
+        self._items: "OrderedDict[Hashable, tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Like get() but without touching the counters or the LRU order."""
+        with self._lock:
+            item = self._items.get(key)
+            return None if item is None else item[0]
+
+    def put(self, key: Hashable, value: Any, nbytes: int) -> None:
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and self._items:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._bytes -= evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class DecodedImageCache:
+    """Shared cv2.imread cache; concurrent misses on one file decode it once."""
+
+    def __init__(self, max_bytes: int):
+        self._lru = ByteBudgetLRU(max_bytes)
+        self._lock = threading.Lock()
+        self._key_locks: dict[tuple, threading.Lock] = {}
+
+    @property
+    def max_bytes(self) -> int:
+        return self._lru.max_bytes
+
+    def get(self, path: str, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        key = (path, mtime_ns, flags)
+        img = self._lru.get(key)
+        if img is not None:
+            return img
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                img = self._lru.peek(key)
+                if img is None:
+                    img = cv2.imread(path, flags)
+                    if img is None:
+                        return None
+                    img.setflags(write=False)
+                    self._lru.put(key, img, img.nbytes)
+        finally:
+            with self._lock:
+                self._key_locks.pop(key, None)
+        return img
+
+    def peek(self, path: str, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+        """The cached decode of *path* if present; never reads the file."""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        return self._lru.peek((path, mtime_ns, flags))
+
+    def clear(self) -> None:
+        self._lru.clear()
+
+    def stats(self) -> dict:
+        return self._lru.stats()
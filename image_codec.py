@@ -0,0 +1,119 @@
+"""
+Encoding of rendered previews into PNG, WebP or JPEG bytes.
+
+Every image endpoint has an encoding policy (see DEFAULT_POLICY).  The
+lossless policies keep pixels exact: "png" pins zlib level 1 with the RLE
+strategy and the SUB filter (recent cv2 defaults, and the fastest lossless
+option it offers; any explicit compression level switches zlib to its
+default strategy and is several times slower), while "webp-lossless" gives
+smaller files at more than ten times the encode cost.  The lossy
+policies are "jpeg", by far the cheapest to encode, and "webp", which is
+smaller but slower and only used when the client's Accept header lists
+image/webp (JPEG otherwise).  A ``quality`` request parameter always asks for
+a lossy preview at that quality, WebP only under the WebP policies.
+
+Exports that embed pictures at a known physical size (the PPT and the
+lossless PDF) can ask for a target DPI instead of source resolution;
+downsample() resamples once with one of RESAMPLE_FILTERS and never enlarges.
+"""
+
+from typing import Optional
+
+import cv2
+import numpy as np
+
+ENCODINGS = ("png", "webp-lossless", "webp", "jpeg")
+POLICIES = ("png", "webp-lossless", "jpeg", "webp")
+
+DEFAULT_POLICY = {
+    "crop-preview": "png",
+    "crop-preview-batch": "png",
+    "image-boxed": "jpeg",
+    "stitch-preview": "jpeg",
+}
+DEFAULT_QUALITY = 85
+
+RESAMPLE_FILTERS = {
+    "area": cv2.INTER_AREA,
+    "lanczos": cv2.INTER_LANCZOS4,
+    "cubic": cv2.INTER_CUBIC,
+    "linear": cv2.INTER_LINEAR,
+    "nearest": cv2.INTER_NEAREST,
+}
+
+_MEDIA_TYPES = {
+    "png": "image/png",
+    "webp-lossless": "image/webp",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+_EXTENSIONS = {"png": ".png", "webp-lossless": ".webp", "webp": ".webp", "jpeg": ".jpg"}
+
+_FAST_PNG_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 1, cv2.IMWRITE_PNG_STRATEGY, cv2.IMWRITE_PNG_STRATEGY_RLE]
+if hasattr(cv2, "IMWRITE_PNG_FILTER"):  # OpenCV >= 4.11
+    _FAST_PNG_PARAMS += [cv2.IMWRITE_PNG_FILTER, cv2.IMWRITE_PNG_FILTER_SUB]
+
+
+def accepts_webp(accept: Optional[str]) -> bool:
+    """Whether an Accept header lists image/webp with a non-zero q value."""
+    for part in (accept or "").split(","):
+        fields = [f.strip() for f in part.split(";")]
+        if fields[0].lower() != "image/webp":
+            continue
+        for f in fields[1:]:
+            if f.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                return False
+        return True
+    return False
+
+
+def negotiate_encoding(policy: str, accept: Optional[str], quality: Optional[int] = None,
+                       default_quality: int = DEFAULT_QUALITY) -> tuple[str, Optional[int]]:
+    """(encoding, quality) for a response under *policy*.
+
+    Lossless encodings return a quality of None.  WebP is only chosen when
+    *accept* allows it; lossless WebP falls back to PNG otherwise.
+    """
+    webp = policy in ("webp", "webp-lossless") and accepts_webp(accept)
+    if quality is not None or policy in ("jpeg", "webp"):
+        q = int(quality if quality is not None else default_quality)
+        return ("webp" if webp else "jpeg"), max(1, min(100, q))
+    if webp:
+        return "webp-lossless", None
+    return "png", None
+
+
+def encode_image(img: np.ndarray, encoding: str = "png", quality: Optional[int] = None) -> tuple[bytes, str]:
+    """Encode a BGR image; returns (bytes, media type)."""
+    if encoding == "png":
+        params = _FAST_PNG_PARAMS
+    elif encoding == "webp-lossless":
+        params = [cv2.IMWRITE_WEBP_QUALITY, 101]
+    elif encoding == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, int(quality or DEFAULT_QUALITY)]
+    elif encoding == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(quality or DEFAULT_QUALITY)]
+    else:
+        raise ValueError(f"Unknown encoding: {encoding}")
+    ok, buf = cv2.imencode(_EXTENSIONS[encoding], img, params)
+    if not ok:
+        raise ValueError("Image encoding failed")
+    return buf.tobytes(), _MEDIA_TYPES[encoding]
+
+
+def dpi_pixels(length_mm: float, dpi: float) -> int:
+    """Pixels needed to cover *length_mm* at *dpi*."""
+    return max(1, int(round(length_mm / 25.4 * dpi)))
+
+
+def downsample(img: np.ndarray, width: int, height: int, resample: str = "area") -> np.ndarray:
+    """*img* resized to at most *width* x *height*; returned unchanged if not larger.
+
+    Each axis is shrunk only when it exceeds its target, so a picture that is
+    already small enough keeps its exact pixels.
+    """
+    h, w = img.shape[:2]
+    tw, th = max(1, min(int(width), w)), max(1, min(int(height), h))
+    if (tw, th) == (w, h):
+        return img
+    return cv2.resize(img, (tw, th), interpolation=RESAMPLE_FILTERS[resample])
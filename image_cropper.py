@@ -9,17 +9,34 @@ Bug fixes vs original:
 - Guard against empty or missing crop_info file
 - shutil.rmtree only when directory exists
 - Clamp crop coordinates to image bounds
+
+Runs are incremental: a manifest in the output directory records, for every
+file written, a hash of its inputs (source path, mtime and size, the crop
+boxes and colours drawn into it, border widths).  Only outputs whose hash
+changed or whose file is missing are produced again.  Each (frame, method)
+is decoded and encoded on a pool of worker processes (threads where fork is
+unavailable) and the PNG files are written by a small pool of I/O threads.
 """
 
+import hashlib
+import json
 import os
 import shutil
 import logging
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, as_completed
+from typing import Callable, Optional
 
 import cv2
 import yaml
 
+from image_codec import downsample
+from workers import make_executor
+
 logger = logging.getLogger("cherrypicker.cropper")
 
+MANIFEST_NAME = ".crop_manifest.json"
+FULL = -1  # output index of the boxed full image
+
 
 def _parse_colour_bgr(name: str):
     """Convert a CSS colour name to BGR tuple. Falls back to red."""
@@ -31,7 +48,94 @@ def _parse_colour_bgr(name: str):
         return (0, 0, 255)
 
 
-def crop_images(configs: dict) -> None:
+def _load_manifest(out_dir: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), "r", encoding="utf-8") as fd:
+            data = json.load(fd)
+        return data if isinstance(data, dict) else None
+    except (OSError, ValueError):
+        return None
+
+
+def _save_manifest(out_dir: str, manifest: dict) -> None:
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fd:
+        json.dump(manifest, fd, indent=0, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _output_key(stamp: list, boxes: list, colours: list, *widths: int) -> str:
+    raw = json.dumps([stamp, boxes, colours, widths])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def render_outputs(src_path: str, crop_boxes: list, crop_colors: list, pbw: int, bbw: int,
+                   wanted: set, sizes: Optional[dict] = None, resample: str = "area") -> Optional[list]:
+    """PNG bytes of the *wanted* outputs of one (frame, method) as [(index, data)].
+
+    Crops are cut from the image as the boxes are drawn on it, so a crop
+    shows the boxes before it; that is why every output depends on the
+    boxes up to and including its own.  Outputs listed in *sizes* (index ->
+    (width, height)) are downsampled to that size before encoding.
+    """
+    sizes = sizes or {}
+    image = cv2.imread(src_path)
+    if image is None:
+        return None
+
+    h_img, w_img = image.shape[:2]
+    out = []
+    for i, box in enumerate(crop_boxes):
+        x1, y1, x2, y2 = box
+        # Clamp to image bounds
+        x1 = max(0, min(x1, w_img))
+        y1 = max(0, min(y1, h_img))
+        x2 = max(x1 + 1, min(x2, w_img))
+        y2 = max(y1 + 1, min(y2, h_img))
+
+        color = _parse_colour_bgr(crop_colors[i % len(crop_colors)])
+        if i in wanted:
+            crop_img = image[y1:y2, x1:x2]
+            if pbw > 0:
+                crop_img = cv2.copyMakeBorder(
+                    crop_img, pbw, pbw, pbw, pbw,
+                    cv2.BORDER_CONSTANT, value=color,
+                )
+            if i in sizes:
+                crop_img = downsample(crop_img, *sizes[i], resample)
+            ok, buf = cv2.imencode(".png", crop_img)
+            if ok:
+                out.append((i, buf.tobytes()))
+
+        if bbw > 0:
+            cv2.rectangle(image, (x1, y1), (x2, y2), color, bbw)
+
+    if FULL in wanted:
+        if FULL in sizes:
+            image = downsample(image, *sizes[FULL], resample)
+        ok, buf = cv2.imencode(".png", image)
+        if ok:
+            out.append((FULL, buf.tobytes()))
+    return out
+
+
+def _write_file(path: str, data: bytes) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fd:
+        fd.write(data)
+    os.replace(tmp, path)
+
+
+def crop_images(configs: dict, progress: Optional[Callable[[int, int], None]] = None,
+                pool: Optional[Executor] = None) -> None:
+    """Write the crops and boxed full images of every saved crop.
+
+    *progress*, if given, is called with (frames_done, frames_total) after
+    each frame; an exception it raises aborts the run.  Frames are rendered on
+    *pool* (see workers.make_executor) or, without one, on a pool of
+    ``crop_processes`` workers made for this run.
+    """
     crop_info_file = configs["output_info_path"]
     if not os.path.isfile(crop_info_file):
         logger.warning("Crop info file not found: %s – nothing to do.", crop_info_file)
@@ -68,57 +172,113 @@ def crop_images(configs: dict) -> None:
 
     out_dir = configs["output_crop_path"]
     clear_previous = configs.get("clear_previous", False)
-    if clear_previous and os.path.isdir(out_dir):
+    old_manifest = _load_manifest(out_dir)
+    if clear_previous and old_manifest is None and os.path.isdir(out_dir):
+        # Nothing is known about these files, so nothing can be reused
         shutil.rmtree(out_dir)
     os.makedirs(out_dir, exist_ok=True)
+    old_manifest = old_manifest or {}
 
     pbw = configs.get("patch_border_width", 2)
     bbw = configs.get("box_border_width", 2)
 
+    # Work out which outputs are stale, per (frame, method)
+    units = []  # (img_idx, src_path, crop_boxes, {index: (out_path, rel, key)})
+    expected: dict[str, str] = {}
+    stale_rels: set[str] = set()
     for img_idx, info in crop_dict.items():
         crop_boxes = sorted(info["patches"], key=lambda b: b[0])
         img_paths = info["img_paths"]
 
         for m in range(min(method_cnt, len(img_paths))):
-            image = cv2.imread(img_paths[m])
-            if image is None:
-                logger.warning("Cannot read image: %s", img_paths[m])
+            src = img_paths[m]
+            try:
+                st = os.stat(src)
+            except OSError:
+                logger.warning("Cannot read image: %s", src)
                 continue
+            stamp = [os.path.abspath(src), st.st_mtime_ns, st.st_size]
+            name = method_names[m]
+            outputs = {}
+            for i in range(len(crop_boxes)):
+                colours = [crop_colors[j % len(crop_colors)] for j in range(i + 1)]
+                rel = f"{name}/img{img_idx:06d}_crop{i:02d}_{name}.png"
+                outputs[i] = (rel, _output_key(stamp, crop_boxes[:i + 1], colours, pbw, bbw))
+            colours = [crop_colors[j % len(crop_colors)] for j in range(len(crop_boxes))]
+            outputs[FULL] = (f"{name}/img{img_idx:06d}_full_{name}.png",
+                             _output_key(stamp, crop_boxes, colours, bbw))
 
-            h_img, w_img = image.shape[:2]
+            stale = {}
+            for i, (rel, key) in outputs.items():
+                expected[rel] = key
+                out_path = os.path.join(out_dir, *rel.split("/"))
+                if old_manifest.get(rel) != key or not os.path.isfile(out_path):
+                    stale[i] = (out_path, rel, key)
+                    stale_rels.add(rel)
+            if stale:
+                os.makedirs(os.path.join(out_dir, name), exist_ok=True)
+                units.append((img_idx, src, crop_boxes, stale))
 
-            for i, box in enumerate(crop_boxes):
-                x1, y1, x2, y2 = box
-                # Clamp to image bounds
-                x1 = max(0, min(x1, w_img))
-                y1 = max(0, min(y1, h_img))
-                x2 = max(x1 + 1, min(x2, w_img))
-                y2 = max(y1 + 1, min(y2, h_img))
+    manifest = {rel: key for rel, key in expected.items() if rel not in stale_rels}
+    if clear_previous:
+        for rel in old_manifest:
+            if rel not in expected:
+                try:
+                    os.remove(os.path.join(out_dir, *rel.split("/")))
+                except OSError:
+                    pass
+    else:
+        manifest.update({rel: key for rel, key in old_manifest.items() if rel not in expected})
 
-                color = _parse_colour_bgr(crop_colors[i % len(crop_colors)])
-                crop_img = image[y1:y2, x1:x2].copy()
+    pending_per_frame: dict = {}
+    for img_idx, _, _, _ in units:
+        pending_per_frame[img_idx] = pending_per_frame.get(img_idx, 0) + 1
+    frames_done = len(crop_dict) - len(pending_per_frame)
+    logger.info("Cropping %d of %d frames (%d outputs up to date)",
+                len(pending_per_frame), len(crop_dict), len(manifest))
+    if progress is not None:
+        progress(frames_done, len(crop_dict))
 
-                if pbw > 0:
-                    crop_img = cv2.copyMakeBorder(
-                        crop_img, pbw, pbw, pbw, pbw,
-                        cv2.BORDER_CONSTANT, value=color,
-                    )
+    own_pool = pool is None
+    if own_pool:
+        pool = make_executor(int(configs.get("crop_processes", min(4, os.cpu_count() or 1))), "crop")
+    io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="crop-io")
+    writes: list[tuple[Future, str, str]] = []
+    futures: dict = {}
+    try:
+        if pool is None:
+            results = ((unit, render_outputs(unit[1], unit[2], crop_colors, pbw, bbw, set(unit[3])))
+                       for unit in units)
+        else:
+            futures = {
+                pool.submit(render_outputs, src, boxes, crop_colors, pbw, bbw, set(stale)): (img_idx, src, boxes, stale)
+                for img_idx, src, boxes, stale in units
+            }
+            results = ((futures[f], f.result()) for f in as_completed(futures))
 
-                out_path = os.path.join(
-                    out_dir, method_names[m],
-                    f"img{img_idx:06d}_crop{i:02d}_{method_names[m]}.png",
-                )
-                os.makedirs(os.path.dirname(out_path), exist_ok=True)
-                cv2.imwrite(out_path, crop_img)
-
-                if bbw > 0:
-                    cv2.rectangle(image, (x1, y1), (x2, y2), color, bbw)
-
-            full_path = os.path.join(
-                out_dir, method_names[m],
-                f"img{img_idx:06d}_full_{method_names[m]}.png",
-            )
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            cv2.imwrite(full_path, image)
+        for (img_idx, src, _, stale), rendered in results:
+            if rendered is None:
+                logger.warning("Cannot read image: %s", src)
+            else:
+                for i, data in rendered:
+                    out_path, rel, key = stale[i]
+                    writes.append((io_pool.submit(_write_file, out_path, data), rel, key))
+            pending_per_frame[img_idx] -= 1
+            if pending_per_frame[img_idx] == 0:
+                frames_done += 1
+                if progress is not None:
+                    progress(frames_done, len(crop_dict))
+    finally:
+        for fut in futures:
+            fut.cancel()
+        if own_pool and pool is not None:
+            pool.shutdown()
+        io_pool.shutdown(wait=True)
+        for fut, rel, key in writes:
+            if fut.exception() is None:
+                manifest[rel] = key
+            else:
+                logger.warning("Cannot write %s: %s", rel, fut.exception())
+        _save_manifest(out_dir, manifest)
 
     logger.info("Crop images generated in %s", out_dir)
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""
+Image dimensions read from file headers instead of full decodes.
+
+PNG (IHDR), JPEG (SOFn, honouring the EXIF orientation that cv2.imread
+applies) and BMP headers are parsed directly; anything else falls back to a
+cv2.imread.  Results are kept in a process-wide index keyed by path and
+validated against the file's mtime and size on every lookup.  file_version()
+gives the matching short version string used in cacheable image URLs.
+"""
+
+import hashlib
+import logging
+import os
+import struct
+import threading
+from typing import Optional
+
+import cv2
+
+logger = logging.getLogger("cherrypicker.meta")
+
+# SOF markers that carry the frame size (excludes DHT C4, JPG C8, DAC CC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field
+_JPEG_STANDALONE = {0x01, 0xD8} | set(range(0xD0, 0xD8))
+
+
+def _png_size(fd) -> Optional[tuple[int, int]]:
+    head = fd.read(24)
+    if len(head) < 24 or head[:8] != b"\x89PNG\r\n\x1a\n" or head[12:16] != b"IHDR":
+        return None
+    w, h = struct.unpack(">II", head[16:24])
+    return w, h
+
+
+def _bmp_size(fd) -> Optional[tuple[int, int]]:
+    head = fd.read(26)
+    if len(head) < 26 or head[:2] != b"BM":
+        return None
+    dib_size = struct.unpack("<I", head[14:18])[0]
+    if dib_size == 12:  # BITMAPCOREHEADER
+        w, h = struct.unpack("<HH", head[18:22])
+    else:
+        w, h = struct.unpack("<ii", head[18:26])
+    return abs(w), abs(h)
+
+
+def _exif_orientation(data: bytes) -> int:
+    """Orientation tag of an APP1 Exif payload, or 1 when absent."""
+    if len(data) < 14 or data[:6] != b"Exif\x00\x00":
+        return 1
+    tiff = data[6:]
+    order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if order is None:
+        return 1
+    try:
+        ifd = struct.unpack(order + "I", tiff[4:8])[0]
+        count = struct.unpack(order + "H", tiff[ifd:ifd + 2])[0]
+        for i in range(count):
+            entry = ifd + 2 + 12 * i
+            tag = struct.unpack(order + "H", tiff[entry:entry + 2])[0]
+            if tag == 0x0112:
+                return struct.unpack(order + "H", tiff[entry + 8:entry + 10])[0]
+    except struct.error:
+        pass
+    return 1
+
+
+def _jpeg_size(fd) -> Optional[tuple[int, int]]:
+    if fd.read(2) != b"\xff\xd8":
+        return None
+    orientation = 1
+    while True:
+        byte = fd.read(1)
+        if not byte:
+            return None
+        if byte != b"\xff":
+            continue
+        marker = fd.read(1)
+        while marker == b"\xff":
+            marker = fd.read(1)
+        if not marker:
+            return None
+        code = marker[0]
+        if code in _JPEG_STANDALONE:
+            continue
+        if code == 0xD9:  # EOI before any frame header
+            return None
+        raw_len = fd.read(2)
+        if len(raw_len) < 2:
+            return None
+        seg_len = struct.unpack(">H", raw_len)[0]
+        if seg_len < 2:
+            return None
+        if code in _JPEG_SOF:
+            seg = fd.read(5)
+            if len(seg) < 5:
+                return None
+            h, w = struct.unpack(">HH", seg[1:5])
+            if orientation in (5, 6, 7, 8):
+                w, h = h, w
+            return w, h
+        if code == 0xE1 and orientation == 1:
+            orientation = _exif_orientation(fd.read(seg_len - 2))
+        else:
+            fd.seek(seg_len - 2, os.SEEK_CUR)
+
+
+def read_image_size(path: str) -> Optional[tuple[int, int]]:
+    """(width, height) of the image at *path*, or None if it cannot be read."""
+    try:
+        with open(path, "rb") as fd:
+            for parser in (_png_size, _jpeg_size, _bmp_size):
+                fd.seek(0)
+                size = parser(fd)
+                if size is not None and size[0] > 0 and size[1] > 0:
+                    return size
+    except (OSError, struct.error):
+        return None
+
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    return w, h
+
+
+def file_version(path: str) -> Optional[str]:
+    """Short content version of *path* derived from its path, mtime and size."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    raw = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class ImageSizeIndex:
+    """Thread-safe cache of image dimensions keyed by path, mtime and size."""
+
+    def __init__(self):
+        self._entries: dict[str, tuple[int, int, tuple[int, int]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[tuple[int, int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry[2]
+
+        size = read_image_size(path)
+        if size is None:
+            logger.warning("Cannot read image size: %s", path)
+            return None
+        with self._lock:
+            self._entries[path] = (st.st_mtime_ns, st.st_size, size)
+        return size
@@ -0,0 +1,223 @@
+"""
+Long-running exports as background jobs.
+
+A Job is submitted to the heavy lane of a PriorityScheduler and keeps
+running whether or not the client that started it is still connected.  Its
+work reports progress through Job.progress(), which is also where a
+cancellation requested through cancel() takes effect.  Streamed results are
+written to a file under the job directory and can be downloaded until the
+job is evicted from the history.
+"""
+
+import contextlib
+import logging
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from workers import HEAVY, PriorityScheduler
+
+logger = logging.getLogger("cherrypicker.jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work once the job has been cancelled."""
+
+
+class Job:
+    def __init__(self, kind: str, filename: Optional[str] = None, media_type: str = "application/octet-stream"):
+        self.id = secrets.token_hex(8)
+        self.kind = kind
+        self.filename = filename
+        self.media_type = media_type
+        self.state = QUEUED
+        self.error: Optional[str] = None
+        self.frames_done = 0
+        self.frames_total = 0
+        self.blocks_done = 0
+        self.blocks_total = 0
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result_path: Optional[str] = None
+        self.owns_result = False
+        self._cancel = threading.Event()
+        self._future: Optional[Future] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check(self) -> None:
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+
+    def progress(self, frames_done: int, frames_total: int,
+                 blocks_done: Optional[int] = None, blocks_total: Optional[int] = None) -> None:
+        """Record how far the work has got; raises JobCancelled once cancelled."""
+        self.frames_done = frames_done
+        self.frames_total = frames_total
+        if blocks_done is not None:
+            self.blocks_done = blocks_done
+        if blocks_total is not None:
+            self.blocks_total = blocks_total
+        self.check()
+
+    def eta(self) -> Optional[float]:
+        """Seconds left, extrapolated from the frames done so far."""
+        if self.state != RUNNING or not self.frames_done or self.started is None:
+            return None
+        elapsed = time.time() - self.started
+        return elapsed * max(0, self.frames_total - self.frames_done) / self.frames_done
+
+    def status(self) -> dict:
+        end = self.finished if self.finished is not None else time.time()
+        eta = self.eta()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "frames_done": self.frames_done,
+            "frames_total": self.frames_total,
+            "blocks_done": self.blocks_done,
+            "blocks_total": self.blocks_total,
+            "elapsed": round(end - self.started, 2) if self.started is not None else 0.0,
+            "eta": round(eta, 1) if eta is not None else None,
+            "error": self.error,
+            "filename": self.filename,
+            "has_result": self.state == DONE and self.result_path is not None,
+        }
+
+
+class JobManager:
+    """Runs jobs on *scheduler*'s heavy lane and keeps the last *history* finished ones."""
+
+    def __init__(self, scheduler: PriorityScheduler, job_dir: str, history: int = 20):
+        self.scheduler = scheduler
+        self.job_dir = job_dir
+        self.history = max(1, int(history))
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Results of a previous server run cannot be downloaded any more
+        shutil.rmtree(job_dir, ignore_errors=True)
+        os.makedirs(job_dir, exist_ok=True)
+
+    def submit(self, job: Job, work: Callable[[], object]) -> Job:
+        """Queue *work* for *job*.
+
+        *work* may return None (no artifact), the path of a file it produced,
+        or an iterable of bytes that is written to a file owned by the job.
+        Raises SchedulerBusy when the heavy queue is full.
+        """
+        job._future = self.scheduler.submit(HEAVY, self._run, job, work)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        return job
+
+    def _run(self, job: Job, work: Callable[[], object]) -> None:
+        if job.cancelled:
+            self._finish(job, CANCELLED)
+            return
+        job.started = time.time()
+        job.state = RUNNING
+        try:
+            result = work()
+            if isinstance(result, str):
+                job.result_path = result
+            elif result is not None:
+                job.result_path = self._spool(job, result)
+                job.owns_result = True
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+            return
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job.id, job.kind)
+            job.error = str(e)
+            self._finish(job, FAILED)
+            return
+        self._finish(job, CANCELLED if job.cancelled else DONE)
+
+    def _spool(self, job: Job, chunks) -> str:
+        fd, path = tempfile.mkstemp(prefix=f"{job.id}_", dir=self.job_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    job.check()
+                    f.write(chunk)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            raise
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+        return path
+
+    def _finish(self, job: Job, state: str) -> None:
+        job.finished = time.time()
+        if state == CANCELLED:
+            self._drop_result(job)
+        job.state = state
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def _drop_result(job: Job) -> None:
+        if job.owns_result and job.result_path is not None:
+            with contextlib.suppress(OSError):
+                os.remove(job.result_path)
+        job.result_path = None
+
+    def _evict(self) -> None:
+        """Forget the oldest finished jobs beyond the history; caller holds the lock."""
+        finished = [j for j in self._jobs.values() if j.finished is not None]
+        for job in finished[: max(0, len(finished) - self.history)]:
+            del self._jobs[job.id]
+            self._drop_result(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Stop *job_id*: a queued job never starts, a running one stops at its next progress report."""
+        job = self.get(job_id)
+        if job is None or job.finished is not None:
+            return job
+        job._cancel.set()
+        if job._future is not None and job._future.cancel():
+            self._finish(job, CANCELLED)
+        return job
+
+    def remove(self, job_id: str) -> Optional[Job]:
+        """Cancel *job_id* and forget it, deleting its result."""
+        job = self.cancel(job_id)
+        if job is not None and job.finished is not None:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            self._drop_result(job)
+        return job
+
+    def list(self) -> list[dict]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [j.status() for j in jobs]
+
+    def stats(self) -> dict:
+        with self._lock:
+            states = [j.state for j in self._jobs.values()]
+        return {s: states.count(s) for s in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
@@ -3,7 +3,6 @@ import json
 import glob
 import os
 import sys
-import numpy as np
 import cv2
 from PyQt5.QtWidgets import QApplication, QMainWindow, QFileDialog, QMessageBox, QLabel, QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QCheckBox, QSizePolicy, QGridLayout, QPushButton, QMessageBox, QComboBox
 from PyQt5.QtGui import QImage, QPixmap, QPainter, QPen, QIcon
@@ -12,9 +11,11 @@ from PyQt5.QtCore import Qt, QPoint, QTimer
 from visualizer import make_variance_map, make_ranking_map
 from image_cropper import crop_images
 from ppt_maker import make_ppt
+from workers import make_executor
 
 
 PLACEHOLDER_PATH = "placeholder.png"
+CROP_POOL = None  # forked in __main__ before Qt starts its threads
 class SingleImageDisplay(QWidget):
     def __init__(self, parent=None, app=None):
         self.app = app
@@ -554,7 +555,7 @@ class MyApp(QMainWindow):
         self.left_part.addWidget(self.save_crop_button)
 
         self.make_all_crops_button = QPushButton("Make All Crops (Hotkey: Enter) - Use this second", self)
-        self.make_all_crops_button.clicked.connect(lambda: crop_images(self.config))
+        self.make_all_crops_button.clicked.connect(lambda: crop_images(self.config, pool=CROP_POOL))
         self.make_all_crops_button.setShortcut("Return")
         self.left_part.addWidget(self.make_all_crops_button)
 
@@ -704,9 +705,10 @@ if __name__ == '__main__':
     if config.get("make_variance_map", False):
         config = make_variance_map(config)
     if config.get("make_ranking_map", False):
-        config = make_ranking_map(config, lambda x, y: -np.abs(x-y).sum(axis=2))
+        config = make_ranking_map(config)  # per-pixel L1 to GT
 
     PLACEHOLDER_PATH = config.get("placeholder_path", PLACEHOLDER_PATH)
+    CROP_POOL = make_executor(int(config.get("crop_processes", min(4, os.cpu_count() or 1))), "crop")
 
     app = QApplication([])
     app.setStyleSheet("QLabel, QCheckBox{font-size: 12pt;}")
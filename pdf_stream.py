@@ -0,0 +1,194 @@
+"""
+Incremental PDF writer for the lossless stitch export.
+
+Every object is serialised as soon as it is complete and handed out by
+drain(), like zip_stream.ZipStream; only object offsets are kept for the
+cross-reference table, so memory is bounded by one page whatever the page
+count.  Images are embedded straight
+from pixel buffers as Flate-compressed RGB XObjects filtered with the PNG
+"Sub" predictor (the filter and zlib settings of image_codec's fast PNG), so
+no PNG is encoded and decoded again on the way.  Text uses a standard Type 1
+font, or a reportlab TTFont whose used glyphs are embedded as 256-character
+subsets when the document is closed.
+"""
+
+import zlib
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import FF_NONSYMBOLIC, FF_SYMBOLIC, SUBSETN, TTFont, makeToUnicodeCMap
+
+
+class FlateImage(NamedTuple):
+    width: int
+    height: int
+    data: bytes
+
+
+def flate_image(img: np.ndarray) -> FlateImage:
+    """Compress a BGR image into the stream of an RGB image XObject."""
+    h, w = img.shape[:2]
+    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    rows = np.empty((h, 1 + w * 3), dtype=np.uint8)
+    rows[:, 0] = 1  # PNG filter type Sub on every row
+    rows[:, 1:4] = rgb[:, 0]
+    rows[:, 4:] = rgb[:, 1:].reshape(h, -1) - rgb[:, :-1].reshape(h, -1)  # wraps mod 256
+    comp = zlib.compressobj(1, zlib.DEFLATED, 15, 9, zlib.Z_RLE)
+    return FlateImage(w, h, comp.compress(rows.tobytes()) + comp.flush())
+
+
+def _pdf_number(v: float) -> bytes:
+    text = f"{v:.3f}".rstrip("0").rstrip(".")
+    return (text if text not in ("", "-0") else "0").encode("ascii")
+
+
+class PdfStreamWriter:
+    """Builds a PDF one page at a time; drain() the bytes as they are produced."""
+
+    def __init__(self, font_name: str = "Helvetica"):
+        self._parts: list[bytes] = []
+        self._pos = 0
+        self._offsets: dict[int, int] = {}
+        self._next_num = 1
+        self._catalog = self._alloc()
+        self._pages = self._alloc()
+        self._font_dict = self._alloc()
+        self._page_nums: list[int] = []
+        self.font_name = font_name
+        font = pdfmetrics.getFont(font_name)
+        self._ttf = font if isinstance(font, TTFont) else None
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _alloc(self) -> int:
+        num = self._next_num
+        self._next_num += 1
+        return num
+
+    def _write(self, data: bytes) -> None:
+        self._parts.append(data)
+        self._pos += len(data)
+
+    def drain(self) -> bytes:
+        """Document bytes produced since the previous drain()."""
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+    def _object(self, num: int, body: bytes, stream: bytes = None) -> None:
+        self._offsets[num] = self._pos
+        if stream is None:
+            self._write(b"%d 0 obj\n%s\nendobj\n" % (num, body))
+        else:
+            self._write(b"%d 0 obj\n%s\nstream\n" % (num, body))
+            self._write(stream)
+            self._write(b"\nendstream\nendobj\n")
+
+    def string_width(self, text: str, font_size: float) -> float:
+        return float(pdfmetrics.stringWidth(text, self.font_name, font_size))
+
+    def _text_ops(self, x: float, y: float, size: float, text: str) -> bytes:
+        ops = [b"BT ", _pdf_number(x), b" ", _pdf_number(y), b" Td "]
+        if self._ttf is None:
+            data = text.encode("cp1252", errors="replace")
+            ops += [b"/F0 ", _pdf_number(size), b" Tf <", data.hex().encode("ascii"), b"> Tj "]
+        else:
+            for subset, chunk in self._ttf.splitString(text, self):
+                ops += [b"/F%d " % subset, _pdf_number(size), b" Tf <", chunk.hex().encode("ascii"), b"> Tj "]
+        ops.append(b"ET\n")
+        return b"".join(ops)
+
+    def add_page(
+        self,
+        width: float,
+        height: float,
+        images: list[tuple[float, float, FlateImage, float, float]],
+        texts: list[tuple[float, float, float, str]],
+    ) -> None:
+        """Add a page of *width* x *height* points.
+
+        *images* holds ``(x, top, image, draw_w, draw_h)``, the image scaled
+        to draw_w x draw_h points, and *texts* holds ``(x, baseline_top,
+        font_size, text)``; both measure from the top-left corner of the page.
+        """
+        xobjects = []
+        ops = []
+        for i, (x, top, img, draw_w, draw_h) in enumerate(images):
+            num = self._alloc()
+            self._object(num, b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+                              b"/BitsPerComponent 8 /Filter /FlateDecode "
+                              b"/DecodeParms << /Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns %d >> "
+                              b"/Length %d >>" % (img.width, img.height, img.width, len(img.data)), img.data)
+            xobjects.append(b"/Im%d %d 0 R" % (i, num))
+            ops.append(b"q %s 0 0 %s %s %s cm /Im%d Do Q\n" % (
+                _pdf_number(draw_w), _pdf_number(draw_h), _pdf_number(x), _pdf_number(height - top - draw_h), i))
+        if texts:
+            ops.append(b"0 g\n")
+        for x, baseline_top, size, text in texts:
+            ops.append(self._text_ops(x, height - baseline_top, size, text))
+
+        content = zlib.compress(b"".join(ops))
+        content_num = self._alloc()
+        self._object(content_num, b"<< /Filter /FlateDecode /Length %d >>" % len(content), content)
+        page_num = self._alloc()
+        self._object(page_num, b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %s %s] /Contents %d 0 R "
+                               b"/Resources << /ProcSet [/PDF /Text /ImageC] /Font %d 0 R /XObject << %s >> >> >>" % (
+            self._pages, _pdf_number(width), _pdf_number(height), content_num, self._font_dict, b" ".join(xobjects)))
+        self._page_nums.append(page_num)
+
+    def _write_fonts(self) -> None:
+        entries = []
+        if self._ttf is None:
+            num = self._alloc()
+            self._object(num, b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>"
+                         % self.font_name.encode("ascii"))
+            entries.append(b"/F0 %d 0 R" % num)
+        else:
+            face = self._ttf.face
+            state = self._ttf.state.pop(self, None)
+            for n, subset in enumerate(state.subsets if state is not None else []):
+                base_name = b"".join((SUBSETN(n), b"+", face.name, face.subfontNameX))
+                subset_ttf = face.makeSubset(subset)
+                font_file = zlib.compress(subset_ttf)
+                file_num = self._alloc()
+                self._object(file_num, b"<< /Filter /FlateDecode /Length %d /Length1 %d >>"
+                             % (len(font_file), len(subset_ttf)), font_file)
+                flags = (face.flags & ~FF_NONSYMBOLIC) | FF_SYMBOLIC
+                desc_num = self._alloc()
+                self._object(desc_num, b"<< /Type /FontDescriptor /FontName /%s /Flags %d /FontBBox [%s] "
+                                       b"/ItalicAngle %s /Ascent %s /Descent %s /CapHeight %s /StemV %s "
+                                       b"/MissingWidth %s /FontFile2 %d 0 R >>" % (
+                    base_name, flags, b" ".join(_pdf_number(v) for v in face.bbox), _pdf_number(face.italicAngle),
+                    _pdf_number(face.ascent), _pdf_number(face.descent), _pdf_number(face.capHeight),
+                    _pdf_number(face.stemV), _pdf_number(face.defaultWidth), file_num))
+                cmap = zlib.compress(makeToUnicodeCMap(base_name.decode("latin-1"), subset).encode("latin-1"))
+                cmap_num = self._alloc()
+                self._object(cmap_num, b"<< /Filter /FlateDecode /Length %d >>" % len(cmap), cmap)
+                widths = b" ".join(_pdf_number(face.getCharWidth(c)) for c in subset)
+                font_num = self._alloc()
+                self._object(font_num, b"<< /Type /Font /Subtype /TrueType /BaseFont /%s /FirstChar 0 /LastChar %d "
+                                       b"/Widths [%s] /FontDescriptor %d 0 R /ToUnicode %d 0 R >>" % (
+                    base_name, len(subset) - 1, widths, desc_num, cmap_num))
+                entries.append(b"/F%d %d 0 R" % (n, font_num))
+        self._object(self._font_dict, b"<< %s >>" % b" ".join(entries))
+
+    def discard(self) -> None:
+        """Release the font subset state of an unfinished document."""
+        if self._ttf is not None:
+            self._ttf.state.pop(self, None)
+
+    def close(self) -> bytes:
+        """Finish the document and return its remaining bytes."""
+        self._write_fonts()
+        kids = b" ".join(b"%d 0 R" % n for n in self._page_nums)
+        self._object(self._pages, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._page_nums)))
+        self._object(self._catalog, b"<< /Type /Catalog /Pages %d 0 R >>" % self._pages)
+
+        xref_pos = self._pos
+        lines = [b"xref\n0 %d\n0000000000 65535 f \n" % self._next_num]
+        lines += [b"%010d 00000 n \n" % self._offsets[n] for n in range(1, self._next_num)]
+        self._write(b"".join(lines))
+        self._write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                    % (self._next_num, self._catalog, xref_pos))
+        return self.drain()
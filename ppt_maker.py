@@ -8,27 +8,69 @@ Bug fixes vs original:
 - Use sorted(seqs.keys()) for deterministic ordering
 - Avoid crash when placeholder image is missing
 - Better logging instead of bare print
+
+make_ppt() reads the files written by crop_images(); make_ppt_from_crops()
+builds the same presentation straight from the crop list and the frame
+index, rendering the pictures in memory (see image_cropper.render_outputs)
+and taking their sizes from the image-size index.
 """
 
 import glob
+import io
 import logging
 import os
+from concurrent.futures import Executor, Future
+from typing import Callable, Iterable, Iterator, Optional
 
 import cv2
 from pptx import Presentation
 from pptx.util import Mm
 
+from image_codec import RESAMPLE_FILTERS, dpi_pixels
+from image_cropper import FULL, render_outputs
+from workers import make_executor
+
 logger = logging.getLogger("cherrypicker.ppt")
 
+# A picture is a file path or an in-memory stream; None leaves its slot empty
+Picture = Optional[object]
+# One slide: per method, the (big, smalls) pictures of its examples
+Page = list[list[tuple[Picture, list[Picture]]]]
 
-def make_ppt(config: dict) -> None:
-    root_path = config["output_crop_path"]
-    if not os.path.isdir(root_path):
-        raise FileNotFoundError(
-            f"Crop output directory not found: {root_path}. Run 'Make All Crops' first."
-        )
 
-    method_names = [m["name"] for m in config["methods"]]
+def _picture_sizes(config: dict, big_size: tuple[int, int], small_size: tuple[int, int]) -> tuple[float, ...]:
+    """Placed (big_w, big_h, small_w, small_h) in mm for pictures of the given pixel sizes."""
+    SMALL_CNT = config.get("small_cnt", 3)
+    GROUPS_PER_PAGE = config.get("groups_per_page", 5)
+    SLIDE_W = config.get("slide_w", 210)
+    GROUP_HORI_GAP_RATIO = config.get("group_hori_gap_ratio", 0.05)
+    SMALL_HORI_GAP_RATIO = config.get("small_hori_gap_ratio", 0.05)
+    AREA_W = SLIDE_W * 0.8
+
+    bigwpix, bighpix = big_size
+    smallwpix, smallhpix = small_size
+
+    group_w = AREA_W / GROUPS_PER_PAGE
+    bigw = group_w / (1 + GROUP_HORI_GAP_RATIO)
+    bigh = bigw * bighpix / max(bigwpix, 1)
+    smallw = bigw / (SMALL_CNT + (SMALL_CNT - 1) * SMALL_HORI_GAP_RATIO) if SMALL_CNT else bigw
+    smallh = smallw * smallhpix / max(smallwpix, 1)
+    return bigw, bigh, smallw, smallh
+
+
+def _pages(groups: list[list[tuple[Picture, list[Picture]]]], per_page: int) -> Iterator[Page]:
+    """Split *groups* (per method: one (big, smalls) per example) into slides."""
+    for start in range(0, len(groups[0]), per_page):
+        yield [method_groups[start:start + per_page] for method_groups in groups]
+
+
+def _write_presentation(config: dict, method_names: list[str], pages: Iterable[Page],
+                        big_size: tuple[int, int], small_size: tuple[int, int], output) -> None:
+    """Lay out *pages*, one slide each, and save to *output*.
+
+    Pages are taken one at a time, so a generator may produce the pictures
+    of a slide just before it is laid out.
+    """
     method_cnt = len(method_names)
 
     SMALL_CNT = config.get("small_cnt", 3)
@@ -36,7 +78,6 @@ def make_ppt(config: dict) -> None:
     SLIDE_W = config.get("slide_w", 210)
     SLIDE_H = config.get("slide_h", 297)
 
-    GROUP_HORI_GAP_RATIO = config.get("group_hori_gap_ratio", 0.05)
     GROUP_VERT_GAP_RATIO = config.get("group_vert_gap_ratio", 0.07)
     SMALL_HORI_GAP_RATIO = config.get("small_hori_gap_ratio", 0.05)
     SMALL_VERT_GAP_RATIO = config.get("small_vert_gap_ratio", 0.05)
@@ -44,6 +85,64 @@ def make_ppt(config: dict) -> None:
     AREA_W = SLIDE_W * 0.8
     AREA_H = SLIDE_H * 0.95  # FIX: was SLIDE_W * 0.95 (typo)
 
+    # ---- Compute layout dimensions from first images --------------------
+    group_w = AREA_W / GROUPS_PER_PAGE
+    bigw, bigh, smallw, smallh = _picture_sizes(config, big_size, small_size)
+    group_h = (bigh + smallh * (1 + SMALL_VERT_GAP_RATIO)) * (1 + GROUP_VERT_GAP_RATIO)
+
+    # ---- Build the presentation -----------------------------------------
+    prs = Presentation()
+    prs.slide_width = Mm(SLIDE_W)
+    prs.slide_height = Mm(SLIDE_H)
+    blank_layout = prs.slide_layouts[6]
+
+    for page in pages:
+        slide = prs.slides.add_slide(blank_layout)
+
+        for row_i in range(method_cnt):
+            big_top = (SLIDE_H - AREA_H) / 2 + group_h * row_i
+            small_top = big_top + bigh + smallh * SMALL_VERT_GAP_RATIO
+
+            # Method name label
+            text_left = 0
+            text_top = (big_top + small_top) / 2
+            text_width = (SLIDE_W - AREA_W) / 2
+            text_height = small_top - big_top
+            txbox = slide.shapes.add_textbox(
+                Mm(text_left), Mm(text_top), Mm(text_width), Mm(text_height)
+            )
+            p = txbox.text_frame.add_paragraph()
+            p.text = method_names[row_i]
+
+            for group_i, (big, smalls) in enumerate(page[row_i]):
+                big_left = (SLIDE_W - AREA_W) / 2 + group_w * group_i
+                if big is not None:
+                    slide.shapes.add_picture(
+                        big, Mm(big_left), Mm(big_top),
+                        width=Mm(bigw), height=Mm(bigh),
+                    )
+                for small_i in range(SMALL_CNT):
+                    small_left = big_left + (1 + SMALL_HORI_GAP_RATIO) * smallw * small_i
+                    small = smalls[small_i] if small_i < len(smalls) else None
+                    if small is not None:
+                        slide.shapes.add_picture(
+                            small, Mm(small_left), Mm(small_top),
+                            width=Mm(smallw), height=Mm(smallh),
+                        )
+
+    prs.save(output)
+
+
+def make_ppt(config: dict) -> None:
+    root_path = config["output_crop_path"]
+    if not os.path.isdir(root_path):
+        raise FileNotFoundError(
+            f"Crop output directory not found: {root_path}. Run 'Make All Crops' first."
+        )
+
+    method_names = [m["name"] for m in config["methods"]]
+
+    SMALL_CNT = config.get("small_cnt", 3)
     placeholder = config.get("placeholder_path", "placeholder.png")
 
     # ---- Collect image paths per method ---------------------------------
@@ -102,9 +201,6 @@ def make_ppt(config: dict) -> None:
                 f"Image count mismatch: expected {group_cnt * stride}, got {len(pthlist)}"
             )
 
-    page_cnt = (group_cnt + GROUPS_PER_PAGE - 1) // GROUPS_PER_PAGE
-
-    # ---- Compute layout dimensions from first images --------------------
     big_sample = cv2.imread(img_paths[0][0])
     if big_sample is None:
         raise FileNotFoundError(f"Cannot read big image: {img_paths[0][0]}")
@@ -115,59 +211,156 @@ def make_ppt(config: dict) -> None:
         raise FileNotFoundError(f"Cannot read small image: {img_paths[0][1]}")
     smallhpix, smallwpix = small_sample.shape[:2]
 
-    group_w = AREA_W / GROUPS_PER_PAGE
-    bigw = group_w / (1 + GROUP_HORI_GAP_RATIO)
-    bigh = bigw * bighpix / max(bigwpix, 1)
-    smallw = bigw / (SMALL_CNT + (SMALL_CNT - 1) * SMALL_HORI_GAP_RATIO) if SMALL_CNT else bigw
-    smallh = smallw * smallhpix / max(smallwpix, 1)
-    group_h = (bigh + smallh * (1 + SMALL_VERT_GAP_RATIO)) * (1 + GROUP_VERT_GAP_RATIO)
+    def _existing(path: str) -> Picture:
+        return path if os.path.isfile(path) else None
 
-    # ---- Build the presentation -----------------------------------------
-    prs = Presentation()
-    prs.slide_width = Mm(SLIDE_W)
-    prs.slide_height = Mm(SLIDE_H)
-    blank_layout = prs.slide_layouts[6]
+    groups = [
+        [
+            (_existing(pthlist[g * stride]), [_existing(p) for p in pthlist[g * stride + 1:(g + 1) * stride]])
+            for g in range(group_cnt)
+        ]
+        for pthlist in img_paths
+    ]
 
-    for pagenum in range(page_cnt):
-        slide = prs.slides.add_slide(blank_layout)
+    output_path = config["output_ppt_path"]
+    _write_presentation(config, method_names, _pages(groups, config.get("groups_per_page", 5)),
+                        (bigwpix, bighpix), (smallwpix, smallhpix), output_path)
+    logger.info("PPT saved to %s", output_path)
 
-        for row_i in range(method_cnt):
-            big_top = (SLIDE_H - AREA_H) / 2 + group_h * row_i
-            small_top = big_top + bigh + smallh * SMALL_VERT_GAP_RATIO
 
-            # Method name label
-            text_left = 0
-            text_top = (big_top + small_top) / 2
-            text_width = (SLIDE_W - AREA_W) / 2
-            text_height = small_top - big_top
-            txbox = slide.shapes.add_textbox(
-                Mm(text_left), Mm(text_top), Mm(text_width), Mm(text_height)
-            )
-            p = txbox.text_frame.add_paragraph()
-            p.text = method_names[row_i]
+def make_ppt_from_crops(
+    config: dict,
+    crop_patches: list[dict],
+    frame_paths: dict[int, list[str]],
+    image_size: Callable[[str], Optional[tuple[int, int]]],
+    output,
+    progress: Optional[Callable[[int, int], None]] = None,
+    pool: Optional[Executor] = None,
+) -> None:
+    """Build the presentation of make_ppt() without the crop directory.
 
-            start = pagenum * GROUPS_PER_PAGE * stride
-            end = min(start + GROUPS_PER_PAGE * stride, len(img_paths[row_i]))
-            imglist = img_paths[row_i][start:end]
-            page_groupcnt = len(imglist) // stride
+    *crop_patches* are the saved crops (``img_idx``, ``crop_box``),
+    *frame_paths* maps a method index to its frame paths and *image_size*
+    returns a frame's (width, height).  The pictures of every (frame,
+    method) are rendered in parallel and handed to python-pptx as PNG
+    streams, a slide at a time while the next one renders, so only the
+    pictures python-pptx keeps until saving stay in memory; *output* is a
+    path or a writable binary file.  *progress* is called with (rendered,
+    total) after each (frame, method).  Rendering runs
+    on *pool* (see workers.make_executor) or, without one, on a pool of
+    ``crop_processes`` workers made for this call.
 
-            for group_i in range(page_groupcnt):
-                big_left = (SLIDE_W - AREA_W) / 2 + group_w * group_i
-                big_path = imglist[group_i * stride]
-                if os.path.isfile(big_path):
-                    slide.shapes.add_picture(
-                        big_path, Mm(big_left), Mm(big_top),
-                        width=Mm(bigw), height=Mm(bigh),
-                    )
-                for small_i in range(SMALL_CNT):
-                    small_left = big_left + (1 + SMALL_HORI_GAP_RATIO) * smallw * small_i
-                    small_path = imglist[group_i * stride + small_i + 1]
-                    if os.path.isfile(small_path):
-                        slide.shapes.add_picture(
-                            small_path, Mm(small_left), Mm(small_top),
-                            width=Mm(smallw), height=Mm(smallh),
-                        )
+    With ``ppt_dpi`` set in *config*, every picture is downsampled to its
+    placed size on the slide at that DPI (filter ``ppt_resample``, see
+    image_codec.RESAMPLE_FILTERS); 0 or "lossless" embeds source pixels.
+    """
+    method_names = [m["name"] for m in config["methods"]]
+    SMALL_CNT = config.get("small_cnt", 3)
+    crop_colors = config.get(
+        "crop_box_colors",
+        ["red", "green", "blue", "yellow", "cyan", "magenta", "white", "black"],
+    )
+    pbw = config.get("patch_border_width", 2)
+    bbw = config.get("box_border_width", 2)
+    # Examples with fewer crops than small_cnt are padded as in make_ppt()
+    placeholder = config.get("placeholder_path", "placeholder.png")
+    pad: Picture = placeholder if os.path.isfile(placeholder) else None
 
-    output_path = config["output_ppt_path"]
-    prs.save(output_path)
-    logger.info("PPT saved to %s", output_path)
\ No newline at end of file
+    boxes_by_frame: dict[int, list] = {}
+    for patch in crop_patches:
+        boxes_by_frame.setdefault(patch["img_idx"], []).append(patch["crop_box"])
+    frames = sorted(boxes_by_frame)
+    if not frames:
+        raise ValueError("No saved crops. Please save crops first.")
+
+    units = []  # (method index, group index, source path, sorted boxes)
+    for g, img_idx in enumerate(frames):
+        crop_boxes = sorted(boxes_by_frame[img_idx], key=lambda b: b[0])
+        for m in range(len(method_names)):
+            paths = frame_paths.get(m, [])
+            if 0 <= img_idx < len(paths):
+                units.append((m, g, paths[img_idx], crop_boxes))
+
+    # Picture sizes as make_ppt() would read them back from the first files
+    first_paths = frame_paths.get(0, [])
+    if not 0 <= frames[0] < len(first_paths):
+        raise FileNotFoundError(f"Cannot read big image: no frame {frames[0]} for method {method_names[0]}")
+    first_path = first_paths[frames[0]]
+    big_size = image_size(first_path)
+    if big_size is None:
+        raise FileNotFoundError(f"Cannot read big image: {first_path}")
+    first_box = sorted(boxes_by_frame[frames[0]], key=lambda b: b[0])[0]
+    x1 = max(0, min(first_box[0], big_size[0]))
+    y1 = max(0, min(first_box[1], big_size[1]))
+    x2 = max(x1 + 1, min(first_box[2], big_size[0]))
+    y2 = max(y1 + 1, min(first_box[3], big_size[1]))
+    small_size = (x2 - x1 + 2 * max(0, pbw), y2 - y1 + 2 * max(0, pbw))
+
+    def _wanted(boxes: list) -> set:
+        return {FULL, *range(min(SMALL_CNT, len(boxes)))}
+
+    dpi = config.get("ppt_dpi", 0)
+    dpi = 0 if dpi in (None, "lossless") else float(dpi)
+    resample = config.get("ppt_resample", "area")
+    if resample not in RESAMPLE_FILTERS:
+        raise ValueError(f"Unknown ppt_resample filter: {resample}")
+    sizes = None
+    if dpi > 0:
+        bigw, bigh, smallw, smallh = _picture_sizes(config, big_size, small_size)
+        big_px = (dpi_pixels(bigw, dpi), dpi_pixels(bigh, dpi))
+        small_px = (dpi_pixels(smallw, dpi), dpi_pixels(smallh, dpi))
+        sizes = {FULL: big_px, **{i: small_px for i in range(SMALL_CNT)}}
+
+    per_page = config.get("groups_per_page", 5)
+    page_units = [[u for u in units if start <= u[1] < start + per_page]
+                  for start in range(0, len(frames), per_page)]
+
+    own_pool = pool is None
+    if own_pool:
+        pool = make_executor(int(config.get("crop_processes", min(4, os.cpu_count() or 1))), "ppt")
+    pending: list[Future] = []
+
+    def _submit(page: list) -> Optional[list[Future]]:
+        if pool is None:
+            return None
+        futures = [pool.submit(render_outputs, src, boxes, crop_colors, pbw, bbw, _wanted(boxes), sizes, resample)
+                   for _, _, src, boxes in page]
+        pending.extend(futures)
+        return futures
+
+    def _render_pages() -> Iterator[Page]:
+        done = 0
+        ahead = _submit(page_units[0]) if page_units else None
+        for p, page in enumerate(page_units):
+            futures = ahead
+            # Keep the workers busy with the next slide while this one is laid out
+            ahead = _submit(page_units[p + 1]) if p + 1 < len(page_units) else None
+            first = p * per_page
+            groups: Page = [[(None, []) for _ in frames[first:first + per_page]] for _ in method_names]
+            for n, (m, g, src, boxes) in enumerate(page):
+                if futures is None:
+                    outputs = render_outputs(src, boxes, crop_colors, pbw, bbw, _wanted(boxes), sizes, resample)
+                else:
+                    outputs = futures[n].result()
+                done += 1
+                if progress is not None:
+                    progress(done, len(units))
+                if outputs is None:
+                    logger.warning("Cannot read image: %s", src)
+                    continue
+                pictures = dict(outputs)
+                smalls = [io.BytesIO(pictures[i]) if i in pictures else pad for i in range(SMALL_CNT)]
+                big = io.BytesIO(pictures[FULL]) if FULL in pictures else None
+                groups[m][g - first] = (big, smalls)
+            if futures is not None:
+                del pending[:len(futures)]
+            yield groups
+
+    try:
+        _write_presentation(config, method_names, _render_pages(), big_size, small_size, output)
+    finally:
+        for fut in pending:
+            fut.cancel()
+        if own_pool and pool is not None:
+            pool.shutdown()
+    logger.info("PPT with %d examples built from %d crops", len(frames), len(crop_patches))
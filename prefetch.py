@@ -0,0 +1,50 @@
+"""
+Background warming of caches for the frames the user is likely to view next.
+
+FramePrefetcher runs a caller-supplied warm function on a small pool of
+low-priority threads.  Every schedule() call supersedes the previous one:
+queued jobs are cancelled and jobs that were already picked up but belong to
+an older generation return without doing any work.
+"""
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from workers import lower_thread_priority
+
+logger = logging.getLogger("cherrypicker.prefetch")
+
+
+class FramePrefetcher:
+    def __init__(self, warm: Callable[..., None], workers: int = 1):
+        self._warm = warm
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, workers),
+            thread_name_prefix="prefetch",
+            initializer=lower_thread_priority,
+        )
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._futures: list[Future] = []
+
+    def _run(self, generation: int, args: tuple) -> None:
+        if generation != self._generation:
+            return
+        try:
+            self._warm(*args)
+        except Exception:
+            logger.exception("Prefetch of %s failed", args)
+
+    def schedule(self, jobs: list[tuple]) -> None:
+        """Drop all pending work and queue *jobs* (warm() argument tuples) in order."""
+        with self._lock:
+            self._generation += 1
+            for fut in self._futures:
+                fut.cancel()
+            generation = self._generation
+            self._futures = [self._pool.submit(self._run, generation, args) for args in jobs]
+
+    def cancel(self) -> None:
+        self.schedule([])
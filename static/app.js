@@ -16,7 +16,7 @@ let drawMethodIdx = 0;
 let uiMode = "pick";
 let pickModeRightPanelWidth = "";
 let stitchRenderToken = 0;
-const imageSizeCache = new Map();
+const frameMetaCache = new Map();  // "method-frame" → {width, height, version}
 
 // crop region (in original image pixels)
 let cropX = 0, cropY = 0, cropW = 100, cropH = 100;
@@ -28,6 +28,9 @@ let cropRatio = 1.0;
 let canvasImg = null;          // Image object loaded for draw-box
 let imgNatW = 1, imgNatH = 1; // natural image dimensions
 let canvasScale = 1;           // display scale factor
+let canvasTileLevel = -1;      // pyramid level shown in the draw-box (tile mode)
+const shownTiers = new Set();  // resolution tiers requested by the current view
+const previewBitmaps = new Map(); // methodIdx → {frame, version, bitmap, scale} for live crop previews
 let isDragging = false;
 let dragStartX = 0, dragStartY = 0;
 
@@ -50,6 +53,8 @@ const stitchState = {
   fontFamily: "Arial, sans-serif",
   fontSize: 16,
   bigWidth: 220,
+  pdfDpi: 0,
+  pdfResample: "area",
 };
 
 // ---------------------------------------------------------------------------
@@ -90,6 +95,8 @@ const elStitchImageGap = $("#stitch-image-gap");
 const elStitchFontFamily = $("#stitch-font-family");
 const elStitchFontSize = $("#stitch-font-size");
 const elStitchBigWidth = $("#stitch-big-width");
+const elStitchPdfDpi = $("#stitch-pdf-dpi");
+const elStitchPdfResample = $("#stitch-pdf-resample");
 const elStitchMethodAlias = $("#stitch-method-alias");
 const elBtnSaveStitchConfig = $("#btn-save-stitch-config");
 const elBtnLoadStitchConfig = $("#btn-load-stitch-config");
@@ -112,13 +119,26 @@ function toast(msg, type = "info", duration = 2500) {
 // ---------------------------------------------------------------------------
 // Loading overlay
 // ---------------------------------------------------------------------------
-function showLoading() {
+function showLoading(onCancel = null) {
   if (document.querySelector(".loading-overlay")) return;
   const ov = document.createElement("div");
   ov.className = "loading-overlay";
   ov.innerHTML = '<div class="spinner"></div>';
+  if (onCancel) {
+    const text = document.createElement("div");
+    text.className = "loading-text";
+    const btn = document.createElement("button");
+    btn.className = "loading-cancel";
+    btn.textContent = "取消";
+    btn.addEventListener("click", () => { btn.disabled = true; onCancel(); });
+    ov.append(text, btn);
+  }
   document.body.appendChild(ov);
 }
+function setLoadingText(msg) {
+  const el = document.querySelector(".loading-overlay .loading-text");
+  if (el) el.textContent = msg;
+}
 function hideLoading() {
   const ov = document.querySelector(".loading-overlay");
   if (ov) ov.remove();
@@ -136,6 +156,46 @@ async function api(path, opts = {}) {
   return res.json();
 }
 
+// Background jobs keep running on the server if this tab goes away; the
+// overlay shows their progress and offers to cancel them.
+function formatJobProgress(st) {
+  if (st.state === "queued") return "排队中…";
+  let msg = st.frames_total ? `${st.frames_done} / ${st.frames_total} 帧` : "处理中…";
+  if (st.blocks_total) msg += ` · ${st.blocks_done} / ${st.blocks_total} 块`;
+  if (st.eta != null) msg += ` · 剩余约 ${Math.ceil(st.eta)} 秒`;
+  return msg;
+}
+
+async function runJob(path, payload = null) {
+  const opts = { method: "POST" };
+  if (payload) {
+    opts.headers = { "Content-Type": "application/json" };
+    opts.body = JSON.stringify(payload);
+  }
+  let st = await api(path, opts);
+  const jobId = st.id;
+  showLoading(() => { api(`/api/jobs/${jobId}/cancel`, { method: "POST" }).catch(() => {}); });
+  try {
+    while (st.state === "queued" || st.state === "running") {
+      setLoadingText(formatJobProgress(st));
+      await new Promise((r) => setTimeout(r, 500));
+      st = await api(`/api/jobs/${jobId}`);
+    }
+  } finally {
+    hideLoading();
+  }
+  if (st.state === "failed") throw new Error(st.error || "job failed");
+  if (st.state === "cancelled") throw new Error("已取消");
+  return st;
+}
+
+function downloadJobResult(st) {
+  const a = document.createElement("a");
+  a.href = `/api/jobs/${st.id}/result`;
+  a.download = st.filename || "";
+  a.click();
+}
+
 function parseMethodLayout(text) {
   const nameToIdx = new Map(CFG.methods.map((m, i) => [m.name.toLowerCase(), i]));
   const rows = [];
@@ -284,6 +344,12 @@ function indexToAlphaTag(idx) {
   return out;
 }
 
+function escapeHtml(text) {
+  const div = document.createElement("div");
+  div.textContent = text;
+  return div.innerHTML;
+}
+
 function getGroupedCrops() {
   const groups = new Map();
   cropPatches.forEach((item) => {
@@ -310,6 +376,8 @@ function collectStitchSettings() {
   stitchState.fontFamily = (elStitchFontFamily.value || "Arial, sans-serif").trim();
   stitchState.fontSize = Math.max(8, parseInt(elStitchFontSize.value) || 16);
   stitchState.bigWidth = Math.max(60, parseInt(elStitchBigWidth.value) || 220);
+  stitchState.pdfDpi = Math.max(0, parseInt(elStitchPdfDpi.value) || 0);
+  stitchState.pdfResample = elStitchPdfResample.value || "area";
   stitchState.methodAliasText = elStitchMethodAlias.value;
 }
 
@@ -334,15 +402,66 @@ function getStitchPayload() {
     font_size: stitchState.fontSize,
     big_image_width: stitchState.bigWidth,
     method_aliases: parseMethodAliasMap(stitchState.methodAliasText),
+    pdf_dpi: stitchState.pdfDpi,
+    pdf_resample: stitchState.pdfResample,
   };
 }
 
+// Fetch sizes and content versions for [method, frame] pairs in one request.
+// `force` re-fetches cached pairs so that rewritten files get new versions.
+async function fetchFrameMeta(pairs, force = false) {
+  const missing = [];
+  const seen = new Set();
+  pairs.forEach(([methodIdx, frameIdx]) => {
+    const key = `${methodIdx}-${frameIdx}`;
+    if ((!force && frameMetaCache.has(key)) || seen.has(key)) return;
+    seen.add(key);
+    missing.push([methodIdx, frameIdx]);
+  });
+  if (missing.length === 0) return;
+  const data = await api("/api/frame-meta", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ items: missing }),
+  });
+  (data.items || []).forEach((item) => {
+    const key = `${item.method_idx}-${item.frame_idx}`;
+    if (item.width > 0 && item.height > 0) {
+      frameMetaCache.set(key, { width: item.width, height: item.height, version: item.version });
+    } else {
+      frameMetaCache.delete(key);
+    }
+  });
+}
+
 async function getImageSizeCached(methodIdx, frameIdx) {
   const key = `${methodIdx}-${frameIdx}`;
-  if (imageSizeCache.has(key)) return imageSizeCache.get(key);
-  const size = await api(`/api/image-size/${methodIdx}/${frameIdx}`);
-  imageSizeCache.set(key, size);
-  return size;
+  if (!frameMetaCache.has(key)) await fetchFrameMeta([[methodIdx, frameIdx]]);
+  const meta = frameMetaCache.get(key);
+  if (!meta) throw new Error(`No image for method ${methodIdx}, frame ${frameIdx}`);
+  return meta;
+}
+
+// Content version for cacheable image URLs ("" if not known yet)
+function frameVersion(methodIdx, frameIdx) {
+  const meta = frameMetaCache.get(`${methodIdx}-${frameIdx}`);
+  return meta ? meta.version : "";
+}
+
+// Object URLs of the draft images currently shown in the stitch preview.
+let stitchPreviewUrls = [];
+
+// Each example is rendered server-side as one display-resolution image; the
+// X-Stitch-Layout header places the method labels on top of it.
+async function fetchStitchPreviewExample(payload, exampleIdx) {
+  const res = await fetch("/api/stitch-preview", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ ...payload, example: exampleIdx, scale: window.devicePixelRatio || 1 }),
+  });
+  if (!res.ok) throw new Error(await res.text());
+  const layout = JSON.parse(res.headers.get("X-Stitch-Layout") || "{}");
+  return { layout, url: URL.createObjectURL(await res.blob()) };
 }
 
 async function refreshStitchPreview() {
@@ -359,144 +478,37 @@ async function refreshStitchPreview() {
     return;
   }
 
-  const borderColors = payload.patch_border_colors.length > 0 ? payload.patch_border_colors : ["red"];
-  const aliasMap = payload.method_aliases || {};
   const limit = payload.example_limit > 0 ? Math.min(payload.example_limit, groups.length) : groups.length;
-  const patchInnerGap = Math.max(0, Math.floor(payload.patch_big_gap / 2));
-  const flatMethodOrder = payload.method_grid.flat();
-  const slotTargetContentWidth = new Map();
-
-  const estimateBottomContentWidth = (bigW, patchCnt, borderW, innerGap) => {
-    if (patchCnt <= 0) return Math.max(1, bigW);
-    const gapTotal = innerGap * Math.max(0, patchCnt - 1);
-    const patchAxisTotal = Math.max(patchCnt, bigW - gapTotal);
-    const patchStripW = patchAxisTotal + gapTotal + (2 * borderW * patchCnt);
-    return Math.max(bigW, patchStripW);
-  };
-
-  const estimateRightContentWidth = (bigW, bigH, boxes, patchCnt, borderW, innerGap, outerGap) => {
-    if (patchCnt <= 0) return Math.max(1, bigW);
-    const gapTotal = innerGap * Math.max(0, patchCnt - 1);
-    const patchAxisTotal = Math.max(patchCnt, bigH - gapTotal);
-    const axisBase = Math.floor(patchAxisTotal / patchCnt);
-    let axisRemain = patchAxisTotal;
-    let stripW = 1;
-    for (let i = 0; i < patchCnt; i++) {
-      const axisSize = (i === patchCnt - 1) ? axisRemain : axisBase;
-      axisRemain -= axisSize;
-      const box = boxes[i] || [0, 0, 1, 1];
-      const bw = Math.max(1, Math.abs((box[2] ?? 1) - (box[0] ?? 0)));
-      const bh = Math.max(1, Math.abs((box[3] ?? 1) - (box[1] ?? 0)));
-      const patchW = Math.max(1, Math.round(axisSize * bw / bh));
-      stripW = Math.max(stripW, patchW + 2 * borderW);
-    }
-    return Math.max(1, bigW + outerGap + stripW);
-  };
-
-  const estimateContentWidth = (bigW, bigH, boxes, patchCnt, position, borderW, innerGap, outerGap) => {
-    if (position === "right") {
-      return estimateRightContentWidth(bigW, bigH, boxes, patchCnt, borderW, innerGap, outerGap);
-    }
-    return estimateBottomContentWidth(bigW, patchCnt, borderW, innerGap);
-  };
+  const results = await Promise.all(
+    Array.from({ length: limit }, (_, gi) => fetchStitchPreviewExample(payload, gi).catch((e) => {
+      console.error(e);
+      return null;
+    })),
+  );
+  const urls = results.filter(Boolean).map((r) => r.url);
+  if (myToken !== stitchRenderToken) {
+    urls.forEach((u) => URL.revokeObjectURL(u));
+    return;
+  }
 
   elStitchPreview.style.setProperty("--example-gap", `${payload.example_gap}px`);
-
   const htmlParts = [];
-  for (let gi = 0; gi < limit; gi++) {
-    const group = groups[gi];
+  results.forEach((r) => {
+    if (!r) return;
+    const { layout, url } = r;
     htmlParts.push(`<div class="st-example" style="font-family:${payload.font_family};font-size:${payload.font_size}px;">`);
-    let slotIdx = 0;
-
-    for (let r = 0; r < payload.method_grid.length; r++) {
-      const row = payload.method_grid[r];
-      htmlParts.push(`<div class="st-row" style="gap:${payload.image_gap}px;">`);
-
-      for (let m = 0; m < row.length; m++) {
-        const mIdx = row[m];
-        const mName = CFG.methods[mIdx]?.name || `Method-${mIdx}`;
-        const showName = aliasMap[mName] || mName;
-        const labelIndex = Math.max(0, flatMethodOrder.indexOf(mIdx));
-        const labelTag = indexToAlphaTag(labelIndex);
-        const patchCnt = Math.min(payload.patches_per_example, group.boxes.length);
-        const usedBoxes = group.boxes.slice(0, patchCnt);
-        const usedColors = usedBoxes.map((_, idx) => borderColors[idx % borderColors.length]);
-        const slotKey = slotIdx;
-        slotIdx += 1;
-        const boxesJson = encodeURIComponent(JSON.stringify(usedBoxes));
-        const colorsText = encodeURIComponent(usedColors.join(","));
-
-        let baseBigHeight = payload.big_image_width;
-        try {
-          const s = await getImageSizeCached(mIdx, group.imgIdx);
-          if (s && s.width > 0) {
-            baseBigHeight = Math.max(1, Math.round(payload.big_image_width * s.height / s.width));
-          }
-        } catch (e) {
-          baseBigHeight = payload.big_image_width;
-        }
-
-        const currentContentW = estimateContentWidth(
-          payload.big_image_width,
-          baseBigHeight,
-          usedBoxes,
-          patchCnt,
-          payload.patch_position,
-          payload.patch_border_width,
-          patchInnerGap,
-          payload.patch_big_gap,
-        );
-
-        if (gi === 0 && !slotTargetContentWidth.has(slotKey)) {
-          slotTargetContentWidth.set(slotKey, currentContentW);
-        }
-        const targetContentW = slotTargetContentWidth.get(slotKey) || currentContentW;
-        const widthScale = currentContentW > 0 ? (targetContentW / currentContentW) : 1;
-        const scaledBigWidth = Math.max(1, Math.round(payload.big_image_width * widthScale));
-        const scaledBigHeight = Math.max(1, Math.round(baseBigHeight * widthScale));
-        const scaledPatchGap = Math.max(0, Math.round(payload.patch_big_gap * widthScale));
-        const scaledPatchInnerGap = Math.max(0, Math.round(patchInnerGap * widthScale));
-
-        const fullUrl = `/api/image-boxed/${mIdx}/${group.imgIdx}?boxes_json=${boxesJson}&colors=${colorsText}&border_width=${payload.full_box_border_width}&t=${Date.now()}`;
-
-        if (myToken !== stitchRenderToken) return;
-
-        htmlParts.push(`<div class="st-method">`);
-        htmlParts.push(`<div class="st-image-wrap ${payload.patch_position}" style="gap:${scaledPatchGap}px;">`);
-        htmlParts.push(`<img class="st-main-image" style="width:${scaledBigWidth}px;" src="${fullUrl}" alt="full" />`);
-        htmlParts.push(`<div class="st-patches ${payload.patch_position}" style="gap:${scaledPatchInnerGap}px;">`);
-
-        const gapTotal = scaledPatchInnerGap * Math.max(0, patchCnt - 1);
-        const patchAxisTotal = payload.patch_position === "bottom"
-          ? Math.max(patchCnt, scaledBigWidth - gapTotal)
-          : Math.max(patchCnt, scaledBigHeight - gapTotal);
-        const axisBase = Math.floor(patchAxisTotal / Math.max(1, patchCnt));
-        let axisRemain = patchAxisTotal;
-
-        for (let pi = 0; pi < patchCnt; pi++) {
-          const box = group.boxes[pi];
-          const c = borderColors[pi % borderColors.length];
-          const patchUrl = `/api/crop-preview/${mIdx}/${group.imgIdx}?x1=${box[0]}&y1=${box[1]}&x2=${box[2]}&y2=${box[3]}&t=${Date.now()}`;
-          const axisSize = (pi === patchCnt - 1) ? axisRemain : axisBase;
-          axisRemain -= axisSize;
-          const style = payload.patch_position === "bottom"
-            ? `width:${axisSize}px;height:auto;border:${payload.patch_border_width}px solid ${c};`
-            : `height:${axisSize}px;width:auto;border:${payload.patch_border_width}px solid ${c};`;
-          htmlParts.push(`<img class="st-patch" style="${style}" src="${patchUrl}" alt="patch" />`);
-        }
-
-        htmlParts.push(`</div></div>`);
-        htmlParts.push(`<div class="st-method-label">(${labelTag}) ${showName}</div>`);
-        htmlParts.push(`</div>`);
-      }
-
-      htmlParts.push(`</div>`);
-    }
-
-    htmlParts.push(`</div>`);
-  }
+    htmlParts.push(`<div class="st-draft" style="width:${layout.width}px;height:${layout.height}px;">`);
+    htmlParts.push(`<img class="st-draft-image" style="width:${layout.width}px;" src="${url}" alt="example" />`);
+    (layout.blocks || []).forEach((b) => {
+      htmlParts.push(
+        `<div class="st-method-label st-draft-label" style="left:${b.x}px;top:${b.y + b.h}px;width:${b.w}px;">${escapeHtml(b.label)}</div>`,
+      );
+    });
+    htmlParts.push(`</div></div>`);
+  });
 
-  if (myToken !== stitchRenderToken) return;
+  stitchPreviewUrls.forEach((u) => URL.revokeObjectURL(u));
+  stitchPreviewUrls = urls;
   elStitchPreview.innerHTML = htmlParts.join("");
 }
 
@@ -569,6 +581,8 @@ async function init() {
   elStitchFontFamily.value = stitchState.fontFamily;
   elStitchFontSize.value = stitchState.fontSize;
   elStitchBigWidth.value = stitchState.bigWidth;
+  elStitchPdfDpi.value = stitchState.pdfDpi;
+  elStitchPdfResample.value = stitchState.pdfResample;
 
   bindStitchInputListeners();
   bindStitchConfigActions();
@@ -642,27 +656,12 @@ async function exportStitchPDFLossless() {
     toast("请先填写有效的方法排列。", "error");
     return;
   }
-  showLoading();
   try {
-    const res = await fetch("/api/stitch-export-pdf-lossless", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(payload),
-    });
-    if (!res.ok) throw new Error(await res.text());
-    const blob = await res.blob();
-    const url = URL.createObjectURL(blob);
-    const a = document.createElement("a");
-    a.href = url;
-    a.download = "cherrypicker_stitch_lossless.pdf";
-    a.click();
-    URL.revokeObjectURL(url);
+    downloadJobResult(await runJob("/api/jobs/stitch-export-pdf-lossless", payload));
     toast("无损 PDF 已导出", "success");
   } catch (e) {
     setStitchAlert(`无损 PDF 导出失败: ${e.message}`);
     toast("无损 PDF 导出失败", "error");
-  } finally {
-    hideLoading();
   }
 }
 
@@ -744,6 +743,8 @@ function applyImportedStitchConfig(data) {
   elStitchFontFamily.value = payload.font_family ?? elStitchFontFamily.value;
   elStitchFontSize.value = payload.font_size ?? elStitchFontSize.value;
   elStitchBigWidth.value = payload.big_image_width ?? elStitchBigWidth.value;
+  elStitchPdfDpi.value = payload.pdf_dpi ?? elStitchPdfDpi.value;
+  elStitchPdfResample.value = payload.pdf_resample ?? elStitchPdfResample.value;
   elStitchMethodAlias.value = JSON.stringify(payload.method_aliases || {}, null, 2);
 
   validateCurrentStitchFormat();
@@ -819,7 +820,159 @@ function setFrame(idx) {
 // Refresh everything
 // ---------------------------------------------------------------------------
 async function refreshAll() {
+  const pairs = [...new Set([...displayMethods, drawMethodIdx])].map((m) => [m, frameIdx]);
+  try {
+    await fetchFrameMeta(pairs, true);
+  } catch (e) {
+    console.error(e);
+  }
+  shownTiers.clear();
   await Promise.all([loadDrawBox(), refreshDisplays()]);
+  requestPrefetch();
+}
+
+// Ask the server to warm the neighbouring frames of the methods on screen
+function requestPrefetch() {
+  const methods = [...new Set([...displayMethods, drawMethodIdx])];
+  fetch("/api/prefetch", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ frame_idx: frameIdx, method_indices: methods, tiers: [...shownTiers] }),
+  }).catch((e) => console.error(e));
+}
+
+// ---------------------------------------------------------------------------
+// Tile pyramid viewer (only used when the server enables tile_pyramid)
+// ---------------------------------------------------------------------------
+function tileLevelCount(width, height) {
+  const ts = CFG.tile_size;
+  let levels = 1;
+  while (Math.max(Math.ceil(width / 2 ** (levels - 1)), Math.ceil(height / 2 ** (levels - 1))) > ts) levels++;
+  return levels;
+}
+
+// Coarsest level that still has at least `scale` × full resolution
+function tileLevelFor(width, height, scale) {
+  const maxLevel = tileLevelCount(width, height) - 1;
+  const s = scale * (window.devicePixelRatio || 1);
+  let level = 0;
+  while (level < maxLevel && s * 2 ** (level + 1) <= 1) level++;
+  return level;
+}
+
+function loadImageElement(url) {
+  return new Promise((resolve, reject) => {
+    const img = new Image();
+    img.onload = () => resolve(img);
+    img.onerror = () => reject(new Error(`Failed to load ${url}`));
+    img.src = url;
+  });
+}
+
+// Part of `el` inside the window and its clipping ancestors, mapped onto a
+// width × height image stretched over the element; null when none is visible
+function visibleImageRect(el, width, height) {
+  const r = el.getBoundingClientRect();
+  if (r.width <= 0 || r.height <= 0) return null;
+  let x0 = Math.max(r.left, 0), y0 = Math.max(r.top, 0);
+  let x1 = Math.min(r.right, window.innerWidth), y1 = Math.min(r.bottom, window.innerHeight);
+  for (let p = el.parentElement; p && p !== document.body; p = p.parentElement) {
+    if (getComputedStyle(p).overflow === "visible") continue;
+    const pr = p.getBoundingClientRect();
+    x0 = Math.max(x0, pr.left); y0 = Math.max(y0, pr.top);
+    x1 = Math.min(x1, pr.right); y1 = Math.min(y1, pr.bottom);
+  }
+  if (x1 <= x0 || y1 <= y0) return null;
+  const sx = width / r.width, sy = height / r.height;
+  return { x0: (x0 - r.left) * sx, y0: (y0 - r.top) * sy, x1: (x1 - r.left) * sx, y1: (y1 - r.top) * sy };
+}
+
+const tiledViews = new Map();   // on-screen element → tiled canvas it shows
+
+// Fetch the tiles of `target` that overlap its view element and are not loaded yet
+async function fetchVisibleTiles(target) {
+  const st = target.tileState;
+  if (!st.view.isConnected) {
+    tiledViews.delete(st.view);
+    return;
+  }
+  const rect = visibleImageRect(st.view, st.levelW, st.levelH);
+  if (!rect) return;
+  const ts = CFG.tile_size;
+  const tctx = target.getContext("2d");
+  const jobs = [];
+  for (let ty = Math.floor(rect.y0 / ts); ty * ts < Math.min(rect.y1, st.levelH); ty++) {
+    for (let tx = Math.floor(rect.x0 / ts); tx * ts < Math.min(rect.x1, st.levelW); tx++) {
+      const key = `${tx}_${ty}`;
+      if (st.loaded.has(key)) continue;
+      st.loaded.add(key);
+      jobs.push(loadImageElement(`/api/tile/${st.methodIdx}/${st.frame}/${st.level}/${tx}/${ty}?v=${st.version}`)
+        .then((img) => {
+          if (target.tileState === st) tctx.drawImage(img, tx * ts, ty * ts);
+        }, (e) => {
+          st.loaded.delete(key);
+          throw e;
+        }));
+    }
+  }
+  if (!jobs.length) return;
+  await Promise.all(jobs);
+  if (target.tileState === st && st.onTiles) st.onTiles();
+}
+
+// Draw the tiles of the level matching `scale` that are visible through
+// `view` (the element the image is stretched over) into `target`; the rest
+// are fetched as scrolling or resizing brings them into view
+async function loadTiledImage(methodIdx, frame, scale, target = document.createElement("canvas"),
+                              view = target, onTiles = null) {
+  const size = await getImageSizeCached(methodIdx, frame);
+  const level = tileLevelFor(size.width, size.height, scale);
+  const levelW = Math.max(1, Math.ceil(size.width / 2 ** level));
+  const levelH = Math.max(1, Math.ceil(size.height / 2 ** level));
+  target.width = levelW;
+  target.height = levelH;
+  target.tileState = {
+    methodIdx, frame, level, levelW, levelH, view, onTiles,
+    version: size.version, loaded: new Set(),
+  };
+  tiledViews.set(view, target);
+  await fetchVisibleTiles(target);
+  return { canvas: target, width: size.width, height: size.height, level };
+}
+
+let tileFetchQueued = false;
+function queueVisibleTiles() {
+  if (tileFetchQueued) return;
+  tileFetchQueued = true;
+  requestAnimationFrame(() => {
+    tileFetchQueued = false;
+    for (const target of [...tiledViews.values()]) {
+      fetchVisibleTiles(target).catch((e) => console.error(e));
+    }
+  });
+}
+document.addEventListener("scroll", queueVisibleTiles, true);
+window.addEventListener("resize", queueVisibleTiles);
+
+// Smallest server-side resolution tier covering `cssWidth` CSS pixels
+function imageTierFor(cssWidth) {
+  const px = cssWidth * (window.devicePixelRatio || 1);
+  const tiers = Object.entries(CFG.image_tiers || {}).sort((a, b) => a[1] - b[1]);
+  for (const [name, w] of tiers) {
+    if (px <= w) return name;
+  }
+  return "full";
+}
+
+async function fillTiledDisplay(el, methodIdx, frame) {
+  try {
+    const size = await getImageSizeCached(methodIdx, frame);
+    const cellW = Math.max(1, el.parentElement.clientWidth / 2);
+    if (frame !== frameIdx) return;
+    await loadTiledImage(methodIdx, frame, cellW / size.width, el);
+  } catch (e) {
+    console.error(e);
+  }
 }
 
 // ---------------------------------------------------------------------------
@@ -827,13 +980,46 @@ async function refreshAll() {
 // ---------------------------------------------------------------------------
 async function loadDrawBox() {
   const methodIdx = drawMethodIdx;
-  const url = `/api/image/${methodIdx}/${frameIdx}?t=${Date.now()}`;
+  if (CFG.tile_pyramid) {
+    const frame = frameIdx;
+    try {
+      const size = await getImageSizeCached(methodIdx, frame);
+      imgNatW = size.width;
+      imgNatH = size.height;
+      fitCanvas();
+      const target = document.createElement("canvas");
+      const tiled = await loadTiledImage(methodIdx, frame, canvasScale, target, elCanvas, () => {
+        if (canvasImg === target) drawCanvas();
+      });
+      if (methodIdx !== drawMethodIdx || frame !== frameIdx) return;
+      canvasImg = tiled.canvas;
+      canvasTileLevel = tiled.level;
+      drawCanvas();
+    } catch (e) {
+      toast("Failed to load draw-box image", "error");
+    }
+    return;
+  }
+  let tier = "full";
+  try {
+    const size = await getImageSizeCached(methodIdx, frameIdx);
+    imgNatW = size.width;
+    imgNatH = size.height;
+    fitCanvas();
+    tier = imageTierFor(elCanvas.width);
+    shownTiers.add(tier);
+  } catch (e) {
+    console.error(e);
+  }
+  const url = `/api/image/${methodIdx}/${frameIdx}?tier=${tier}&v=${frameVersion(methodIdx, frameIdx)}`;
   return new Promise((resolve) => {
     const img = new Image();
     img.onload = () => {
       canvasImg = img;
-      imgNatW = img.naturalWidth;
-      imgNatH = img.naturalHeight;
+      if (tier === "full") {
+        imgNatW = img.naturalWidth;
+        imgNatH = img.naturalHeight;
+      }
       fitCanvas();
       drawCanvas();
       resolve();
@@ -919,7 +1105,8 @@ function setCropRegion(x, y, w, h, fromInput = false) {
   }
 
   drawCanvas();
-  refreshCropPreviews();
+  if (isDragging) drawLivePreviews();
+  else refreshCropPreviews();
 }
 
 function applyCropFromInputs() {
@@ -980,8 +1167,14 @@ elCanvas.addEventListener("mousemove", (e) => {
   setCropRegion(x, y, cropW, cropH);
 });
 
-elCanvas.addEventListener("mouseup", () => { isDragging = false; });
-elCanvas.addEventListener("mouseleave", () => { isDragging = false; });
+// Dragging is previewed locally; fetch the exact patches once it ends
+function endDrag() {
+  if (!isDragging) return;
+  isDragging = false;
+  refreshCropPreviews();
+}
+elCanvas.addEventListener("mouseup", endDrag);
+elCanvas.addEventListener("mouseleave", endDrag);
 elCanvas.addEventListener("contextmenu", (e) => e.preventDefault());
 
 // ---------------------------------------------------------------------------
@@ -1028,6 +1221,7 @@ $("#btn-save-crop").addEventListener("click", saveCrop);
 $("#btn-make-crops").addEventListener("click", makeCrops);
 $("#btn-clear-crops").addEventListener("click", clearCrops);
 $("#btn-export-html").addEventListener("click", exportStitchHTML);
+$("#btn-export-zip").addEventListener("click", exportStitchZip);
 $("#btn-export-pdf").addEventListener("click", exportStitchPDF);
 elBtnToggleMode.addEventListener("click", () => setMode(uiMode === "pick" ? "stitch" : "pick"));
 
@@ -1069,6 +1263,12 @@ function computeGridColumns() {
 }
 
 async function refreshDisplays() {
+  try {
+    await fetchFrameMeta(displayMethods.map((m) => [m, frameIdx]));
+  } catch (e) {
+    console.error(e);
+  }
+
   // Compute optimal columns and apply
   const cols = computeGridColumns();
   elDisplayGrid.style.gridTemplateColumns = `repeat(${cols}, 1fr)`;
@@ -1080,26 +1280,135 @@ async function refreshDisplays() {
     cell.className = "display-cell";
     cell.id = `cell-${i}`;
     const mName = CFG.methods[mIdx]?.name || "?";
+    const fullHtml = CFG.tile_pyramid
+      ? `<canvas class="full-img"></canvas>`
+      : `<img class="full-img" alt="full" />`;
     cell.innerHTML = `
       <div class="method-name">${mName}</div>
       <div class="images-row">
-        <img class="full-img" src="/api/image/${mIdx}/${frameIdx}?t=${Date.now()}" alt="full" />
-        <img class="crop-img" src="" alt="crop" />
+        ${fullHtml}
+        <canvas class="crop-img"></canvas>
       </div>`;
     elDisplayGrid.appendChild(cell);
+    const fullEl = cell.querySelector(".full-img");
+    if (CFG.tile_pyramid) {
+      fillTiledDisplay(fullEl, mIdx, frameIdx);
+    } else {
+      const tier = imageTierFor(cell.querySelector(".images-row").clientWidth / 2);
+      shownTiers.add(tier);
+      fullEl.src = `/api/image/${mIdx}/${frameIdx}?tier=${tier}&v=${frameVersion(mIdx, frameIdx)}`;
+    }
   });
   refreshCropPreviews();
+  loadPreviewBitmaps();
+}
+
+// One batched request per crop change; bursts while a request is in flight
+// collapse into a single follow-up request for the latest box.
+let cropPreviewInFlight = false;
+let cropPreviewPending = false;
+
+async function refreshCropPreviews() {
+  if (cropPreviewInFlight) {
+    cropPreviewPending = true;
+    return;
+  }
+  cropPreviewInFlight = true;
+  try {
+    await loadCropPreviewBatch();
+  } catch (e) {
+    console.error(e);
+  } finally {
+    cropPreviewInFlight = false;
+    if (cropPreviewPending) {
+      cropPreviewPending = false;
+      refreshCropPreviews();
+    }
+  }
+}
+
+async function loadCropPreviewBatch() {
+  if (displayMethods.length === 0 || cropW <= 0 || cropH <= 0) return;
+  const frame = frameIdx;
+  const methods = [...displayMethods];
+  const v = methods.map((m) => frameVersion(m, frame)).join("-");
+  const url = `/api/crop-preview-batch/${frame}?x1=${cropX}&y1=${cropY}&x2=${cropX + cropW}&y2=${cropY + cropH}`
+    + `&methods=${methods.join(",")}&v=${v}`;
+  const res = await fetch(url);
+  if (!res.ok) throw new Error(await res.text());
+  const layout = JSON.parse(res.headers.get("X-Sprite-Layout") || "[]");
+  const sheet = await createImageBitmap(await res.blob());
+  if (frame !== frameIdx || isDragging) {
+    sheet.close();
+    return;
+  }
+  layout.forEach((item) => {
+    displayMethods.forEach((mIdx, i) => {
+      if (mIdx !== item.method_idx) return;
+      const canvas = $(`#cell-${i} .crop-img`);
+      if (!canvas) return;
+      canvas.width = item.w;
+      canvas.height = item.h;
+      canvas.getContext("2d").drawImage(sheet, item.x, item.y, item.w, item.h, 0, 0, item.w, item.h);
+    });
+  });
+  sheet.close();
 }
 
-function refreshCropPreviews() {
+// Keep each displayed method's current frame as a decoded ImageBitmap
+// (medium tier when available) so that drags can be previewed locally.
+async function loadPreviewBitmaps() {
+  const frame = frameIdx;
+  const tier = "medium" in (CFG.image_tiers || {}) ? "medium" : "full";
+  shownTiers.add(tier);
+  // Free the bitmaps of methods no longer on display
+  for (const [mIdx, entry] of previewBitmaps) {
+    if (!displayMethods.includes(mIdx)) {
+      entry.bitmap.close();
+      previewBitmaps.delete(mIdx);
+    }
+  }
+  await Promise.all(displayMethods.map(async (mIdx) => {
+    const version = frameVersion(mIdx, frame);
+    const cur = previewBitmaps.get(mIdx);
+    if (cur && cur.frame === frame && cur.version === version) return;
+    try {
+      const size = await getImageSizeCached(mIdx, frame);
+      const res = await fetch(`/api/image/${mIdx}/${frame}?tier=${tier}&v=${version}`);
+      if (!res.ok) return;
+      const bitmap = await createImageBitmap(await res.blob());
+      if (frame !== frameIdx || !displayMethods.includes(mIdx)) {
+        bitmap.close();
+        return;
+      }
+      const old = previewBitmaps.get(mIdx);
+      if (old) old.bitmap.close();
+      previewBitmaps.set(mIdx, { frame, version, bitmap, scale: bitmap.width / size.width });
+    } catch (e) {
+      console.error(e);
+    }
+  }));
+}
+
+// Live preview: blit the crop box out of the cached bitmaps (no network)
+function drawLivePreviews() {
+  let missing = false;
   displayMethods.forEach((mIdx, i) => {
-    const cell = $(`#cell-${i}`);
-    if (!cell) return;
-    const cropImg = cell.querySelector(".crop-img");
-    if (cropW > 0 && cropH > 0) {
-      cropImg.src = `/api/crop-preview/${mIdx}/${frameIdx}?x1=${cropX}&y1=${cropY}&x2=${cropX + cropW}&y2=${cropY + cropH}&t=${Date.now()}`;
+    const canvas = $(`#cell-${i} .crop-img`);
+    if (!canvas) return;
+    const entry = previewBitmaps.get(mIdx);
+    if (!entry || entry.frame !== frameIdx) {
+      missing = true;
+      return;
     }
+    if (canvas.width !== cropW || canvas.height !== cropH) {
+      canvas.width = cropW;
+      canvas.height = cropH;
+    }
+    const s = entry.scale;
+    canvas.getContext("2d").drawImage(entry.bitmap, cropX * s, cropY * s, cropW * s, cropH * s, 0, 0, cropW, cropH);
   });
+  if (missing) refreshCropPreviews();
 }
 
 // ---------------------------------------------------------------------------
@@ -1182,14 +1491,11 @@ async function clearCrops() {
 // Generate crops / stitch export
 // ---------------------------------------------------------------------------
 async function makeCrops() {
-  showLoading();
   try {
-    await api("/api/make-crops", { method: "POST" });
+    await runJob("/api/jobs/make-crops");
     toast("All crops generated!", "success");
   } catch (e) {
     toast("Crop generation failed: " + e.message, "error", 5000);
-  } finally {
-    hideLoading();
   }
 }
 
@@ -1199,28 +1505,25 @@ async function exportStitchHTML() {
     toast("请先填写有效的方法排列。", "error");
     return;
   }
-  showLoading();
   try {
-    const res = await fetch("/api/stitch-export-html", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(payload),
-    });
-    if (!res.ok) {
-      throw new Error(await res.text());
-    }
-    const blob = await res.blob();
-    const url = URL.createObjectURL(blob);
-    const a = document.createElement("a");
-    a.href = url;
-    a.download = "cherrypicker_stitch.html";
-    a.click();
-    URL.revokeObjectURL(url);
+    downloadJobResult(await runJob("/api/jobs/stitch-export-html", payload));
     toast("HTML 已导出", "success");
   } catch (e) {
     toast("导出 HTML 失败: " + e.message, "error", 5000);
-  } finally {
-    hideLoading();
+  }
+}
+
+async function exportStitchZip() {
+  const payload = getStitchPayload();
+  if (!payload.method_grid.length) {
+    toast("请先填写有效的方法排列。", "error");
+    return;
+  }
+  try {
+    downloadJobResult(await runJob("/api/jobs/stitch-export-zip", payload));
+    toast("ZIP 已导出", "success");
+  } catch (e) {
+    toast("导出 ZIP 失败: " + e.message, "error", 5000);
   }
 }
 
@@ -1262,6 +1565,9 @@ window.addEventListener("resize", () => {
   if (uiMode === "pick") {
     fitCanvas();
     drawCanvas();
+    if (CFG.tile_pyramid && tileLevelFor(imgNatW, imgNatH, canvasScale) !== canvasTileLevel) {
+      loadDrawBox();
+    }
     const cols = computeGridColumns();
     elDisplayGrid.style.gridTemplateColumns = `repeat(${cols}, 1fr)`;
   } else {
@@ -0,0 +1,517 @@
+"""
+Pure rendering of stitch-export blocks, shared by the HTML and PDF exports.
+
+A block is one method's full frame with the crop boxes drawn on it plus the
+strip of enlarged patches.  Everything here depends only on its arguments
+(no app state), so BlockRenderer can run the per-(frame, method slot)
+renders on a pool of worker processes.  The first frame is rendered on its
+own to calibrate the block width of every slot; later frames are resized to
+those widths, exactly as the serial loop did, so the output is identical
+whatever the number of workers.
+
+The PDF export can embed blocks at a target DPI: a block is taken to be
+placed at the size the HTML export shows it (1 CSS px = 1/96 in), so at
+``pdf_dpi`` it keeps at most big_image_width / 96 * pdf_dpi pixels across
+the full frame.  Its layout size does not change, only the embedded pixels.
+
+Rendered blocks are memoized under block_cache_key(), which covers only the
+inputs that change a block's pixels.  Re-exporting after editing labels,
+fonts or gaps therefore only redoes the layout.
+
+The stitch preview uses draft blocks instead: draft_layout() places a block
+in CSS pixels the way the preview page always has, and render_draft_block()
+fills it at display resolution from an already reduced frame, drawing boxes
+and borders after the downscale.
+"""
+
+import hashlib
+import json
+import os
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
+
+import cv2
+import numpy as np
+import webcolors
+
+from image_cache import ByteBudgetLRU
+from image_codec import downsample, encode_image
+from pdf_stream import flate_image
+from workers import make_executor
+
+# Payload fields read by build_method_content; everything else is layout only
+PIXEL_FIELDS = (
+    "patches_per_example",
+    "patch_position",
+    "patch_border_colors",
+    "patch_border_width",
+    "full_box_border_width",
+    "patch_big_gap",
+    "big_image_width",
+)
+# Fields that only change the pixels of "flate" (lossless PDF) blocks
+FLATE_FIELDS = ("pdf_dpi", "pdf_resample")
+
+
+def parse_color_bgr(color_name: str) -> tuple[int, int, int]:
+    try:
+        rgb = webcolors.name_to_rgb(color_name)
+        return (int(rgb.blue), int(rgb.green), int(rgb.red))
+    except Exception:
+        return (0, 0, 255)
+
+
+def add_border(img: np.ndarray, bgr: tuple[int, int, int], width: int) -> np.ndarray:
+    if width <= 0:
+        return img.copy()
+    return cv2.copyMakeBorder(img, width, width, width, width, cv2.BORDER_CONSTANT, value=bgr)
+
+
+def draw_boxes(img: np.ndarray, boxes: list[list[int]], colors: list[str], width: int) -> np.ndarray:
+    out = img.copy()
+    if width <= 0:
+        return out
+    h, w = out.shape[:2]
+    for i, box in enumerate(boxes):
+        if not isinstance(box, list) or len(box) != 4:
+            continue
+        x1, y1, x2, y2 = box
+        x1c = max(0, min(int(x1), w - 1))
+        y1c = max(0, min(int(y1), h - 1))
+        x2c = max(x1c + 1, min(int(x2), w))
+        y2c = max(y1c + 1, min(int(y2), h))
+        bgr = parse_color_bgr(colors[i % len(colors)])
+        cv2.rectangle(out, (x1c, y1c), (x2c, y2c), bgr, width)
+    return out
+
+
+def _clamped_box(box: list[int], w: int, h: int) -> tuple[int, int, int, int]:
+    x1, y1, x2, y2 = box
+    x1c = max(0, min(int(x1), w - 1))
+    y1c = max(0, min(int(y1), h - 1))
+    x2c = max(x1c + 1, min(int(x2), w))
+    y2c = max(y1c + 1, min(int(y2), h))
+    return x1c, y1c, x2c, y2c
+
+
+def _resize_into(canvas: np.ndarray, src: np.ndarray, x0: int, y0: int, x1: int, y1: int) -> Optional[np.ndarray]:
+    """Resample *src* straight into ``canvas[y0:y1, x0:x1]``; returns that view."""
+    if x1 <= x0 or y1 <= y0:
+        return None
+    slot = canvas[y0:y1, x0:x1]
+    sh, sw = src.shape[:2]
+    if (sh, sw) == (y1 - y0, x1 - x0):
+        slot[...] = src
+    else:
+        interp = cv2.INTER_CUBIC if (x1 - x0 > sw or y1 - y0 > sh) else cv2.INTER_AREA
+        cv2.resize(src, (x1 - x0, y1 - y0), dst=slot, interpolation=interp)
+    return slot
+
+
+def build_method_content(
+    full: np.ndarray,
+    boxes: list[list[int]],
+    payload: dict,
+    target_content_width: Optional[int] = None,
+) -> tuple[np.ndarray, float]:
+    """One method's stitched block: the boxed full image plus its patch strip.
+
+    Returns the block and the ratio between its pixels and the preview's CSS
+    pixels, after the optional resize to *target_content_width*.
+
+    The natural layout (full frame, patches sized along the frame's edge, the
+    strip shrunk to fit it) is worked out first and composited into one
+    canvas: the frame, its boxes and the patch cells are written in place,
+    and an overlong strip is resampled straight into its slot.  The resizes
+    are the ones of the stacked composition (each patch, then the whole
+    strip, then the whole block to the target width) with the same filters,
+    so the pixels do not change.
+    """
+    colors = payload["patch_border_colors"]
+    patch_cnt = min(max(1, payload["patches_per_example"]), len(boxes))
+    use_boxes = boxes[:patch_cnt]
+    h, w = full.shape[:2]
+    right = payload["patch_position"] == "right"
+
+    preview_big_w = max(1, int(payload.get("big_image_width", 220)))
+    scale_ratio = max(1e-6, w / float(preview_big_w))
+
+    crops = [_clamped_box(box, w, h) for box in use_boxes]
+    patch_inner_gap = max(0, int(round((payload["patch_big_gap"] // 2) * scale_ratio)))
+    patch_outer_gap = max(0, int(round(payload["patch_big_gap"] * scale_ratio)))
+    border = max(0, int(payload.get("patch_border_width", 0)))
+
+    # Natural geometry: patch cells (with border) along the strip axis
+    cells: list[tuple[int, int, int, int]] = []  # x, y, w, h within the strip
+    if crops:
+        gap_total = patch_inner_gap * max(0, patch_cnt - 1)
+        patch_axis_total = max(patch_cnt, (h if right else w) - gap_total)
+        patch_axis_base = patch_axis_total // patch_cnt
+        patch_axis_remain = patch_axis_total
+        pos = 0
+        for i, (x1, y1, x2, y2) in enumerate(crops):
+            pw, ph = x2 - x1, y2 - y1
+            axis_size = patch_axis_remain if i == patch_cnt - 1 else patch_axis_base
+            patch_axis_remain -= axis_size
+            if right:
+                target_h = max(1, int(axis_size))
+                target_w = max(1, int(round(pw * target_h / max(ph, 1))))
+                cells.append((0, pos, target_w + 2 * border, target_h + 2 * border))
+                pos += target_h + 2 * border + patch_inner_gap
+            else:
+                target_w = max(1, int(axis_size))
+                target_h = max(1, int(round(ph * target_w / max(pw, 1))))
+                cells.append((pos, 0, target_w + 2 * border, target_h + 2 * border))
+                pos += target_w + 2 * border + patch_inner_gap
+
+    # The strip is shrunk to the frame's edge when longer, then placed
+    if right:
+        cells_w = max((c[2] for c in cells), default=0)
+        cells_h = sum(c[3] for c in cells) + patch_inner_gap * max(0, len(cells) - 1)
+        strip_w, strip_h = cells_w, cells_h
+        if cells_h > h:
+            strip_w, strip_h = max(1, int(round(cells_w * h / float(cells_h)))), h
+        strip_x, strip_y = w + patch_outer_gap, 0
+        nat_w = w + patch_outer_gap + strip_w if cells else w
+        nat_h = max(h, strip_h)
+    else:
+        cells_w = sum(c[2] for c in cells) + patch_inner_gap * max(0, len(cells) - 1)
+        cells_h = max((c[3] for c in cells), default=0)
+        strip_w, strip_h = cells_w, cells_h
+        if cells_w > w:
+            strip_w, strip_h = w, max(1, int(round(cells_h * w / float(cells_w))))
+        strip_x, strip_y = 0, h + patch_outer_gap
+        nat_w = max(w, strip_w)
+        nat_h = h + patch_outer_gap + strip_h if cells else h
+
+    canvas = np.full((nat_h, nat_w, 3), 255, dtype=np.uint8)
+    big = canvas[:h, :w]
+    big[...] = full
+    box_w = payload["full_box_border_width"]
+    if box_w > 0:
+        for i, (x1, y1, x2, y2) in enumerate(crops):
+            cv2.rectangle(big, (x1, y1), (x2, y2), parse_color_bgr(colors[i % len(colors)]), box_w)
+
+    if cells:
+        fits = (strip_w, strip_h) == (cells_w, cells_h)
+        # Cells go straight into the block when the strip fits, else into a
+        # strip of their own that is then shrunk into its slot
+        strip = canvas if fits else np.full((cells_h, cells_w, 3), 255, dtype=np.uint8)
+        ox, oy = (strip_x, strip_y) if fits else (0, 0)
+        for i, ((x1, y1, x2, y2), (cx, cy, cw, ch)) in enumerate(zip(crops, cells)):
+            x0, y0 = ox + cx, oy + cy
+            if border:
+                strip[y0:y0 + ch, x0:x0 + cw] = parse_color_bgr(colors[i % len(colors)])
+            _resize_into(strip, full[y1:y2, x1:x2], x0 + border, y0 + border, x0 + cw - border, y0 + ch - border)
+        if not fits:
+            cv2.resize(strip, (strip_w, strip_h), dst=canvas[strip_y:strip_y + strip_h, strip_x:strip_x + strip_w],
+                       interpolation=cv2.INTER_AREA)
+
+    # Final scale to the slot's target width
+    if target_content_width is not None and target_content_width > 0 and nat_w != int(target_content_width):
+        r = int(target_content_width) / float(nat_w)
+        out_h = max(1, int(round(nat_h * r)))
+        interp = cv2.INTER_CUBIC if r > 1.0 else cv2.INTER_AREA
+        canvas = cv2.resize(canvas, (int(target_content_width), out_h), interpolation=interp)
+        scale_ratio *= r
+
+    return canvas, scale_ratio
+
+
+class DraftLayout(NamedTuple):
+    natural_width: float  # before scaling to the slot's target width
+    width: float
+    height: float
+    big: tuple[float, float, float, float]  # x, y, w, h in CSS pixels
+    patches: list[tuple[float, float, float, float]]  # border boxes
+
+
+def _box_dims(box: list[int], size: tuple[int, int]) -> tuple[int, int]:
+    x1, y1, x2, y2 = _clamped_box(box, *size)
+    return x2 - x1, y2 - y1
+
+
+def draft_layout(
+    size: tuple[int, int],
+    boxes: list[list[int]],
+    payload: dict,
+    target_width: Optional[float] = None,
+) -> DraftLayout:
+    """Geometry of a preview block for a frame of *size* (w, h).
+
+    The natural width is estimated as the preview page did before it was
+    rendered server-side, so slots calibrate to the same widths.
+    """
+    src_w, src_h = size
+    patch_cnt = min(max(1, payload["patches_per_example"]), len(boxes))
+    dims = [_box_dims(b, size) for b in boxes[:patch_cnt]]
+    big_w = max(1, int(payload["big_image_width"]))
+    base_big_h = max(1, round(big_w * src_h / src_w))
+    border = max(0, int(payload["patch_border_width"]))
+    inner_gap = max(0, payload["patch_big_gap"] // 2)
+    right = payload["patch_position"] == "right"
+
+    natural = float(big_w)
+    if patch_cnt > 0:
+        gap_total = inner_gap * (patch_cnt - 1)
+        if right:
+            axis_total = max(patch_cnt, base_big_h - gap_total)
+            strip_w = 1
+            for i, (bw, bh) in enumerate(dims):
+                axis = axis_total - (axis_total // patch_cnt) * (patch_cnt - 1) if i == patch_cnt - 1 else axis_total // patch_cnt
+                strip_w = max(strip_w, max(1, round(axis * bw / bh)) + 2 * border)
+            natural = float(big_w + payload["patch_big_gap"] + strip_w)
+        else:
+            axis_total = max(patch_cnt, big_w - gap_total)
+            natural = float(max(big_w, axis_total + gap_total + 2 * border * patch_cnt))
+
+    scale = (target_width / natural) if target_width else 1.0
+    sbw = max(1, round(big_w * scale))
+    sbh = max(1, round(base_big_h * scale))
+    outer_gap = max(0, round(payload["patch_big_gap"] * scale))
+    gap = max(0, round(inner_gap * scale))
+    big_h = sbw * src_h / src_w
+
+    patches = []
+    if patch_cnt > 0:
+        gap_total = gap * (patch_cnt - 1)
+        axis_total = max(patch_cnt, (sbh if right else sbw) - gap_total)
+        axis_base = axis_total // patch_cnt
+        remain = axis_total
+        pos = 0.0
+        for i, (bw, bh) in enumerate(dims):
+            axis = remain if i == patch_cnt - 1 else axis_base
+            remain -= axis
+            inner = max(0, axis - 2 * border)
+            if right:
+                w = inner * bw / bh + 2 * border
+                patches.append((sbw + outer_gap, pos, w, float(axis)))
+            else:
+                h = inner * bh / bw + 2 * border
+                patches.append((pos, big_h + outer_gap, float(axis), h))
+            pos += axis + gap
+
+    if right:
+        width = sbw + (outer_gap + max(p[2] for p in patches) if patches else 0)
+        height = max([big_h] + [p[1] + p[3] for p in patches])
+    else:
+        width = max([float(sbw)] + [p[0] + p[2] for p in patches])
+        height = big_h + (outer_gap + max(p[3] for p in patches) if patches else 0)
+    return DraftLayout(natural, float(width), float(height), (0.0, 0.0, float(sbw), big_h), patches)
+
+
+def _resize_to(img: np.ndarray, w: int, h: int) -> np.ndarray:
+    if img.shape[1] == w and img.shape[0] == h:
+        return img
+    interp = cv2.INTER_AREA if w < img.shape[1] else cv2.INTER_LINEAR
+    return cv2.resize(img, (w, h), interpolation=interp)
+
+
+def render_draft_block(
+    reduced: np.ndarray,
+    size: tuple[int, int],
+    patches: list[np.ndarray],
+    boxes: list[list[int]],
+    layout: DraftLayout,
+    payload: dict,
+    scale: float,
+) -> np.ndarray:
+    """Pixels of a draft block at *scale* device pixels per CSS pixel.
+
+    *reduced* is the frame at any resolution (*size* is the original one)
+    and *patches* the crops of the used boxes; both are resized to their
+    final size before anything is drawn on them.
+    """
+    colors = payload["patch_border_colors"] or ["red"]
+    out = np.full((max(1, round(layout.height * scale)), max(1, round(layout.width * scale)), 3), 255, dtype=np.uint8)
+
+    _, _, bw, bh = layout.big
+    big = _resize_to(reduced, max(1, round(bw * scale)), max(1, round(bh * scale))).copy()
+    fx = big.shape[1] / float(size[0])
+    fy = big.shape[0] / float(size[1])
+    box_w = payload["full_box_border_width"]
+    if box_w > 0:
+        thickness = max(1, round(box_w * fx))
+        scaled = [[round(b[0] * fx), round(b[1] * fy), round(b[2] * fx), round(b[3] * fy)]
+                  for b in boxes[:len(layout.patches)]]
+        big = draw_boxes(big, scaled, colors, thickness)
+    h, w = big.shape[:2]
+    out[:min(h, out.shape[0]), :min(w, out.shape[1])] = big[:out.shape[0], :out.shape[1]]
+
+    border = payload["patch_border_width"]
+    border_px = max(1, round(border * scale)) if border > 0 else 0
+    for i, ((x, y, pw, ph), patch) in enumerate(zip(layout.patches, patches)):
+        x0, y0 = round(x * scale), round(y * scale)
+        tw = max(1, round(pw * scale) - 2 * border_px)
+        th = max(1, round(ph * scale) - 2 * border_px)
+        cell = add_border(_resize_to(patch, tw, th), parse_color_bgr(colors[i % len(colors)]), border_px)
+        ch = min(cell.shape[0], out.shape[0] - y0)
+        cw = min(cell.shape[1], out.shape[1] - x0)
+        if ch > 0 and cw > 0:
+            out[y0:y0 + ch, x0:x0 + cw] = cell[:ch, :cw]
+    return out
+
+
+class RenderedBlock(NamedTuple):
+    width: int
+    height: int
+    scale_ratio: float
+    content: Optional[np.ndarray]  # set unless the block was encoded
+    data: Optional[bytes]  # PNG file or PDF image stream, see render_block()
+    data_size: Optional[tuple[int, int]] = None  # pixel size of data if downsampled from width x height
+
+
+def render_block(
+    path: Optional[str],
+    boxes: list[list[int]],
+    payload: dict,
+    target_content_width: Optional[int],
+    encoding: Optional[str],
+    read_image: Optional[Callable[[str], Optional[np.ndarray]]] = None,
+) -> Optional[RenderedBlock]:
+    """Read *path* and build its block; None if the frame cannot be read.
+
+    With *encoding* "png" the block comes back as a PNG file, with "flate"
+    as the stream of a PDF image XObject (pdf_stream.flate_image), reduced to
+    ``pdf_dpi`` when the payload sets one; otherwise as pixels.
+    """
+    if path is None:
+        return None
+    full = read_image(path) if read_image is not None else cv2.imread(path)
+    if full is None:
+        return None
+    content, scale_ratio = build_method_content(full, boxes, payload, target_content_width)
+    h, w = content.shape[:2]
+    if encoding == "png":
+        return RenderedBlock(w, h, scale_ratio, None, encode_image(content, "png")[0])
+    if encoding == "flate":
+        dpi = payload.get("pdf_dpi", 0)
+        if dpi > 0:
+            factor = dpi / (96.0 * scale_ratio)
+            reduced = downsample(content, round(w * factor), round(h * factor), payload.get("pdf_resample", "area"))
+            if reduced is not content:
+                rh, rw = reduced.shape[:2]
+                return RenderedBlock(w, h, scale_ratio, None, flate_image(reduced).data, (rw, rh))
+        return RenderedBlock(w, h, scale_ratio, None, flate_image(content).data)
+    return RenderedBlock(w, h, scale_ratio, content, None)
+
+
+def block_cache_key(
+    path: Optional[str],
+    boxes: list[list[int]],
+    payload: dict,
+    target_content_width: Optional[int],
+    encoding: Optional[str],
+) -> Optional[str]:
+    """Memo key of a block, or None when *path* cannot be stat'ed."""
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    patch_cnt = min(max(1, payload["patches_per_example"]), len(boxes))
+    raw = json.dumps([
+        os.path.abspath(path), st.st_mtime_ns, st.st_size,
+        boxes[:patch_cnt], [payload.get(k) for k in PIXEL_FIELDS],
+        target_content_width, encoding,
+        [payload.get(k) for k in FLATE_FIELDS] if encoding == "flate" else None,
+    ], default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class BlockRenderer:
+    """Renders the blocks of a stitch export, in parallel when *workers* > 1.
+
+    Worker processes are forked so that they need no re-import of the app;
+    where fork is unavailable a thread pool is used instead (cv2 releases the
+    GIL while decoding and resizing).  The pool is *pool* or, without one, is
+    made by the constructor; that falls back to threads as well once other
+    threads are running (see workers.make_executor).  *read_image* serves the
+    serial and threaded paths, typically from the shared decoded-image cache.
+    Finished blocks are kept in *cache* when one is given.
+    """
+
+    def __init__(self, workers: int, read_image: Callable[[str], Optional[np.ndarray]],
+                 cache: Optional[ByteBudgetLRU] = None, pool: Optional[Executor] = None):
+        self.workers = max(0, int(workers))
+        self._read_image = read_image
+        self._cache = cache
+        self._pool = pool if pool is not None else make_executor(self.workers, "stitch")
+        self.uses_processes = isinstance(self._pool, ProcessPoolExecutor)
+
+    def _remember(self, key: str, fut: Future) -> None:
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        block = fut.result()
+        if block is None:
+            return
+        if block.content is not None:
+            block.content.setflags(write=False)
+            nbytes = block.content.nbytes
+        else:
+            nbytes = len(block.data)
+        self._cache.put(key, block, nbytes)
+
+    def _submit(self, path, boxes, payload, target, encoding) -> Future:
+        key = None
+        if self._cache is not None:
+            key = block_cache_key(path, boxes, payload, target, encoding)
+            block = self._cache.get(key) if key is not None else None
+            if block is not None:
+                fut: Future = Future()
+                fut.set_result(block)
+                return fut
+
+        pool = self._pool
+        if pool is None:
+            fut = Future()
+            try:
+                fut.set_result(render_block(path, boxes, payload, target, encoding, self._read_image))
+            except Exception as e:
+                fut.set_exception(e)
+        else:
+            read_image = None if self.uses_processes else self._read_image
+            fut = pool.submit(render_block, path, boxes, payload, target, encoding, read_image)
+        if key is not None:
+            fut.add_done_callback(lambda f: self._remember(key, f))
+        return fut
+
+    def iter_frames(
+        self,
+        frames: Iterable[tuple[list[Optional[str]], list[list[int]]]],
+        payload: dict,
+        encoding: Optional[str] = None,
+    ) -> Iterator[list[Optional[RenderedBlock]]]:
+        """Yield the blocks of each frame, in order and one per method slot.
+
+        *frames* holds ``(slot_paths, boxes)`` per frame.  Slots whose block
+        could not be built are None.  At most a few frames per worker are in
+        flight, so memory stays bounded for long exports.
+        """
+        frames = iter(frames)
+        first = next(frames, None)
+        if first is None:
+            return
+        paths, boxes = first
+        blocks = [f.result() for f in [self._submit(p, boxes, payload, None, encoding) for p in paths]]
+        targets = [b.width if b is not None else None for b in blocks]
+        yield blocks
+
+        window = max(1, 2 * self.workers)
+        pending: deque[list[Future]] = deque()
+        try:
+            for paths, boxes in frames:
+                pending.append([
+                    self._submit(p, boxes, payload, targets[i], encoding)
+                    for i, p in enumerate(paths)
+                ])
+                if len(pending) >= window:
+                    yield [f.result() for f in pending.popleft()]
+            while pending:
+                yield [f.result() for f in pending.popleft()]
+        finally:
+            for futs in pending:
+                for f in futs:
+                    f.cancel()
@@ -0,0 +1,115 @@
+"""
+Reduced-resolution copies of frames for the display grid.
+
+Requested widths are snapped up to a small ladder so that the on-disk cache
+stays bounded.  JPEG sources are decoded with cv2's scaled IMREAD_REDUCED_*
+modes (the DCT is only partially evaluated) before a final INTER_AREA
+resize; other formats go through the shared decoded-image cache.  Results
+live under <cache>/thumbs, keyed by source path, mtime, size and width.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from typing import Optional
+
+import cv2
+
+from image_cache import DecodedImageCache
+from image_meta import ImageSizeIndex
+
+logger = logging.getLogger("cherrypicker.thumbs")
+
+WIDTH_LADDER = (256, 512, 1024, 2048)
+TIER_WIDTHS = {"thumb": 256, "medium": 1024}
+
+_JPEG_EXTS = (".jpg", ".jpeg")
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def snap_width(width: int) -> Optional[int]:
+    """Smallest ladder width >= *width*, or None when only full size will do."""
+    for w in WIDTH_LADDER:
+        if width <= w:
+            return w
+    return None
+
+
+class ThumbnailStore:
+    def __init__(self, cache_dir: str, decoded: DecodedImageCache, sizes: ImageSizeIndex):
+        self.root = os.path.join(cache_dir, "thumbs")
+        self._decoded = decoded
+        self._sizes = sizes
+        self._lock = threading.Lock()
+        self._key_locks: dict[str, threading.Lock] = {}
+
+    def _cache_file(self, path: str, width: int, is_jpeg: bool) -> Optional[str]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        raw = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{width}"
+        key = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, key[:2], key + (".jpg" if is_jpeg else ".png"))
+
+    def _render(self, path: str, src_w: int, width: int, is_jpeg: bool, cache_decode: bool):
+        img = None
+        if is_jpeg:
+            for factor, flag in _REDUCED_FLAGS:
+                if -(-src_w // factor) >= width:
+                    img = cv2.imread(path, flag)
+                    break
+        if img is None:
+            img = self._decoded.get(path) if cache_decode else self._decoded.peek(path)
+        if img is None and not cache_decode:
+            img = cv2.imread(path)
+        if img is None:
+            return None
+        h, w = img.shape[:2]
+        if w > width:
+            img = cv2.resize(img, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+        return img
+
+    def get(self, path: str, width: int, cache_decode: bool = True) -> Optional[str]:
+        """Path of a cached copy of *path* at most *width* wide (snapped to the
+        ladder), or None if the original file should be served instead.
+
+        With *cache_decode* False a full decode needed for the resize is not
+        added to the shared decoded-image cache.
+        """
+        snapped = snap_width(width)
+        size = self._sizes.get(path)
+        if snapped is None or size is None or snapped >= size[0]:
+            return None
+
+        is_jpeg = os.path.normcase(path).endswith(_JPEG_EXTS)
+        out = self._cache_file(path, snapped, is_jpeg)
+        if out is None:
+            return None
+        if os.path.isfile(out):
+            return out
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(out, threading.Lock())
+        try:
+            with key_lock:
+                if os.path.isfile(out):
+                    return out
+                img = self._render(path, size[0], snapped, is_jpeg, cache_decode)
+                if img is None:
+                    return None
+                params = [cv2.IMWRITE_JPEG_QUALITY, 92] if is_jpeg else [cv2.IMWRITE_PNG_COMPRESSION, 3]
+                ok, buf = cv2.imencode(os.path.splitext(out)[1], img, params)
+                if not ok:
+                    return None
+                os.makedirs(os.path.dirname(out), exist_ok=True)
+                tmp = f"{out}.{uuid.uuid4().hex}.tmp"
+                with open(tmp, "wb") as fd:
+                    fd.write(buf.tobytes())
+                os.replace(tmp, out)
+        finally:
+            with self._lock:
+                self._key_locks.pop(out, None)
+        return out
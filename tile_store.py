@@ -0,0 +1,144 @@
+"""
+On-disk multi-resolution tile pyramids for large frames.
+
+Level 0 is the original resolution and every further level halves both
+dimensions (rounding up) until the whole frame fits in a single tile.  Tiles
+are PNG files under <cache>/tiles/<key>/<level>/<x>_<y>.png, where the key is
+derived from the source path, mtime and size.  A frame's pyramid is built
+lazily the first time one of its tiles (or a region) is requested.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import uuid
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from image_cache import DecodedImageCache
+
+logger = logging.getLogger("cherrypicker.tiles")
+
+_TILE_PNG_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+
+
+def level_count(width: int, height: int, tile_size: int) -> int:
+    levels = 1
+    while max(math.ceil(width / 2 ** (levels - 1)), math.ceil(height / 2 ** (levels - 1))) > tile_size:
+        levels += 1
+    return levels
+
+
+def level_dims(width: int, height: int, level: int) -> tuple[int, int]:
+    return max(1, math.ceil(width / 2 ** level)), max(1, math.ceil(height / 2 ** level))
+
+
+class TilePyramidStore:
+    def __init__(self, cache_dir: str, decoded: DecodedImageCache, tile_cache: DecodedImageCache,
+                 tile_size: int = 256):
+        self.root = os.path.join(cache_dir, "tiles")
+        self.tile_size = max(16, int(tile_size))
+        self._decoded = decoded
+        self._tiles = tile_cache
+        self._lock = threading.Lock()
+        self._build_locks: dict[str, threading.Lock] = {}
+
+    def _pyramid_dir(self, path: str) -> Optional[str]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        raw = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{self.tile_size}"
+        return os.path.join(self.root, hashlib.sha1(raw.encode("utf-8")).hexdigest())
+
+    def _build(self, path: str, out_dir: str) -> bool:
+        img = self._decoded.get(path)
+        if img is None:
+            return False
+        h, w = img.shape[:2]
+        levels = level_count(w, h, self.tile_size)
+        ts = self.tile_size
+
+        tmp_dir = f"{out_dir}.tmp-{uuid.uuid4().hex}"
+        level_img = img
+        for level in range(levels):
+            if level > 0:
+                lw, lh = level_dims(w, h, level)
+                level_img = cv2.resize(level_img, (lw, lh), interpolation=cv2.INTER_AREA)
+            lh, lw = level_img.shape[:2]
+            level_dir = os.path.join(tmp_dir, str(level))
+            os.makedirs(level_dir, exist_ok=True)
+            for ty in range(math.ceil(lh / ts)):
+                for tx in range(math.ceil(lw / ts)):
+                    tile = level_img[ty * ts:(ty + 1) * ts, tx * ts:(tx + 1) * ts]
+                    cv2.imwrite(os.path.join(level_dir, f"{tx}_{ty}.png"), tile, _TILE_PNG_PARAMS)
+        with open(os.path.join(tmp_dir, "pyramid.json"), "w", encoding="utf-8") as fd:
+            json.dump({"width": w, "height": h, "levels": levels, "tile_size": ts}, fd)
+
+        try:
+            os.replace(tmp_dir, out_dir)
+        except OSError:
+            # Another process finished the same pyramid first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        logger.info("Built %d-level tile pyramid for %s", levels, path)
+        return True
+
+    def ensure(self, path: str) -> Optional[dict]:
+        """Build the pyramid of *path* if needed; returns its geometry and directory."""
+        out_dir = self._pyramid_dir(path)
+        if out_dir is None:
+            return None
+        info_file = os.path.join(out_dir, "pyramid.json")
+        if not os.path.isfile(info_file):
+            with self._lock:
+                build_lock = self._build_locks.setdefault(out_dir, threading.Lock())
+            try:
+                with build_lock:
+                    if not os.path.isfile(info_file) and not self._build(path, out_dir):
+                        return None
+            finally:
+                with self._lock:
+                    self._build_locks.pop(out_dir, None)
+        with open(info_file, "r", encoding="utf-8") as fd:
+            info = json.load(fd)
+        info["dir"] = out_dir
+        return info
+
+    def tile_path(self, path: str, level: int, x: int, y: int) -> Optional[str]:
+        info = self.ensure(path)
+        if info is None or level < 0 or level >= info["levels"]:
+            return None
+        lw, lh = level_dims(info["width"], info["height"], level)
+        ts = info["tile_size"]
+        if x < 0 or y < 0 or x * ts >= lw or y * ts >= lh:
+            return None
+        return os.path.join(info["dir"], str(level), f"{x}_{y}.png")
+
+    def read_region(self, path: str, x1: int, y1: int, x2: int, y2: int) -> Optional[np.ndarray]:
+        """Full-resolution pixels of [x1, x2) x [y1, y2) assembled from level-0 tiles."""
+        info = self.ensure(path)
+        if info is None:
+            return None
+        ts = info["tile_size"]
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(info["width"], x2), min(info["height"], y2)
+        if x2 <= x1 or y2 <= y1:
+            return None
+
+        out = np.zeros((y2 - y1, x2 - x1, 3), dtype=np.uint8)
+        for ty in range(y1 // ts, (y2 - 1) // ts + 1):
+            for tx in range(x1 // ts, (x2 - 1) // ts + 1):
+                tile = self._tiles.get(os.path.join(info["dir"], "0", f"{tx}_{ty}.png"))
+                if tile is None:
+                    return None
+                ox, oy = tx * ts, ty * ts
+                sx1, sy1 = max(x1, ox), max(y1, oy)
+                sx2, sy2 = min(x2, ox + tile.shape[1]), min(y2, oy + tile.shape[0])
+                out[sy1 - y1:sy2 - y1, sx1 - x1:sx2 - x1] = tile[sy1 - oy:sy2 - oy, sx1 - ox:sx2 - ox]
+        return out
@@ -4,30 +4,41 @@ differences can be highlighted – e.g. variance map, ranking map.
 Originally by Hylz – rewritten for web-based CherryPicker.
 
 Bug fixes vs original:
-- Uses float64 accumulator for variance to avoid uint8 overflow/wrap-around
+- Accumulates variance in float32 (streaming Welford updates, see below) to
+  avoid uint8 overflow/wrap-around; on 0-255 pixels its rounding error is
+  orders of magnitude below one step of the 8-bit heatmap, though less exact
+  than a float64 sum
 - Normalises variance to full 0-255 range (original truncated via uint8 cast)
 - Properly casts ranking to uint8 for applyColorMap
 - Guards against missing GT / Ours indices
 - Does not mutate caller's config list permanently (returns a copy)
+
+The variance map streams: each frame keeps a float32 Welford mean / M2 pair
+and reads one method image at a time, so memory is a few (H, W, C) float32
+buffers per worker however many methods there are.  Frames are spread over
+a process pool (``visualizer_processes``).  The ranking map counts, per
+pixel, the methods scoring below ours while streaming over them, instead of
+sorting a stack of every method's metric; maps for several methods share
+one pass.
 """
 
 import os
-import glob
 import logging
+import pickle
+from concurrent.futures import Executor, as_completed
+from typing import Callable, Optional
 
 import cv2
 import numpy as np
 
+from frame_index import load_image_paths
+from workers import make_executor
+
 logger = logging.getLogger("cherrypicker.visualizer")
 
 
 def _load_image_paths(config: dict) -> dict:
-    img_paths: dict[int, list[str]] = {}
-    for idx, method in enumerate(config["methods"]):
-        img_paths[idx] = sorted(
-            glob.glob(os.path.join(method["path"], "**", "*.png"), recursive=True)
-            + glob.glob(os.path.join(method["path"], "**", "*.jpg"), recursive=True)
-        )
+    img_paths = load_image_paths(config, (".png", ".jpg"))
     frame_cnt = len(img_paths.get(0, []))
     for key in img_paths:
         if len(img_paths[key]) != frame_cnt:
@@ -37,8 +48,50 @@ def _load_image_paths(config: dict) -> dict:
     return img_paths
 
 
-def make_variance_map(config: dict) -> dict:
-    """Creates a per-pixel variance heatmap across all methods."""
+def _log_progress(label: str) -> Callable[[int, int], None]:
+    """Progress callback that logs every tenth of the frames."""
+    def _report(done: int, total: int) -> None:
+        step = max(1, total // 10)
+        if done == total or done % step == 0:
+            logger.info("%s: %d/%d frames", label, done, total)
+    return _report
+
+
+def _variance_frame(paths: list[str], shape: tuple[int, int, int], out_path: str) -> None:
+    """Write the variance heatmap of one frame, reading the methods one by one.
+
+    A missing image counts as black, as in the stacked computation.
+    """
+    mean = np.zeros(shape, dtype=np.float32)
+    m2 = np.zeros(shape, dtype=np.float32)
+    delta = np.empty(shape, dtype=np.float32)
+    for k, img_path in enumerate(paths, 1):
+        im = cv2.imread(img_path)
+        x = im.astype(np.float32) if im is not None else np.zeros(shape, dtype=np.float32)
+        np.subtract(x, mean, out=delta)
+        mean += delta * np.float32(1.0 / k)
+        x -= mean
+        x *= delta
+        m2 += x
+    variance = m2.sum(axis=2) / np.float32(max(len(paths), 1))  # (H, W)
+    # Normalise to 0-255 for colour-map
+    vmin, vmax = variance.min(), variance.max()
+    if vmax > vmin:
+        normed = ((variance - vmin) / (vmax - vmin) * 255).astype(np.uint8)
+    else:
+        normed = np.zeros_like(variance, dtype=np.uint8)
+    viz = cv2.applyColorMap(normed, cv2.COLORMAP_JET)
+    cv2.imwrite(out_path, viz)
+
+
+def make_variance_map(config: dict, progress: Optional[Callable[[int, int], None]] = None,
+                      pool: Optional[Executor] = None) -> dict:
+    """Creates a per-pixel variance heatmap across all methods.
+
+    *progress* is called with (frames_done, frames_total); by default
+    progress is logged.  Frames run on *pool* (see workers.make_executor) or,
+    without one, on a pool of ``visualizer_processes`` made for this call.
+    """
     path = os.path.join(config["visualization_path"], "variance_map")
     os.makedirs(path, exist_ok=True)
 
@@ -49,38 +102,143 @@ def make_variance_map(config: dict) -> dict:
     img0 = cv2.imread(img_paths[0][0])
     if img0 is None:
         raise FileNotFoundError(f"Cannot read: {img_paths[0][0]}")
-    h, w, c = img0.shape
-
-    for i in range(frame_cnt):
-        arr = np.zeros((m_cnt, h, w, c), dtype=np.float64)
-        for j in range(m_cnt):
-            im = cv2.imread(img_paths[j][i])
-            if im is not None:
-                arr[j] = im.astype(np.float64)
-        variance = np.var(arr, axis=0).sum(axis=2)  # (H, W)
-        # Normalise to 0-255 for colour-map
-        vmin, vmax = variance.min(), variance.max()
-        if vmax > vmin:
-            normed = ((variance - vmin) / (vmax - vmin) * 255).astype(np.uint8)
+    shape = img0.shape
+    del img0
+
+    if progress is None:
+        progress = _log_progress("Variance map")
+    units = [([img_paths[j][i] for j in range(m_cnt)], os.path.join(path, f"{i:06d}.png"))
+             for i in range(frame_cnt)]
+    own_pool = pool is None
+    if own_pool:
+        workers = int(config.get("visualizer_processes", min(4, os.cpu_count() or 1)))
+        pool = make_executor(min(workers, frame_cnt), "visualizer")
+    futures = []
+    try:
+        if pool is None:
+            for done, (paths, out_path) in enumerate(units, 1):
+                _variance_frame(paths, shape, out_path)
+                progress(done, frame_cnt)
         else:
-            normed = np.zeros_like(variance, dtype=np.uint8)
-        viz = cv2.applyColorMap(normed, cv2.COLORMAP_JET)
-        cv2.imwrite(os.path.join(path, f"{i:06d}.png"), viz)
+            futures = [pool.submit(_variance_frame, paths, shape, out_path) for paths, out_path in units]
+            for done, fut in enumerate(as_completed(futures), 1):
+                fut.result()
+                progress(done, frame_cnt)
+    finally:
+        for fut in futures:
+            fut.cancel()
+        if own_pool and pool is not None:
+            pool.shutdown()
 
     config["methods"].append({"name": "variance_map", "path": path})
     logger.info("Variance maps saved to %s", path)
     return config
 
 
-def make_ranking_map(config: dict, metric) -> dict:
+def l1_metric(img: np.ndarray, gt: np.ndarray) -> np.ndarray:
+    """Negated per-pixel L1 distance summed over channels (higher = better).
+
+    Works on the uint8 images directly: the channel sum of absdiff is at most
+    765 and fits int16, so no float copy is made.
     """
-    Creates a per-pixel ranking map showing where 'ours' ranks among methods.
+    diff = cv2.absdiff(img, gt)
+    return -diff.sum(axis=2, dtype=np.int16)
+
+
+def _picklable(fn) -> bool:
+    try:
+        pickle.dumps(fn)
+    except Exception:
+        return False
+    return True
 
-    *metric(img, gt)* should return an (H, W) array where **higher = better**.
+
+def _ranking_frame(paths: list[str], gt_idx: int, targets: list[int], shape: tuple[int, int, int],
+                   out_paths: list[str], metric: Optional[Callable]) -> None:
+    """Write the ranking maps of one frame for the methods in *targets*.
+
+    A method's rank is its position in an ascending stable sort of the
+    metric values: the methods scoring below it, plus the ones before it in
+    the method order that tie with it.  The targets are scored first and
+    kept; every other method is then read and scored once and compared with
+    all of them.  A missing method image scores 0, as in the stacked
+    computation; a missing GT skips the frame.
     """
-    path = os.path.join(config["visualization_path"], "ranking_map")
-    os.makedirs(path, exist_ok=True)
+    gt_img = cv2.imread(paths[gt_idx])
+    if gt_img is None:
+        return
+    if metric is None:
+        def score(img):
+            return l1_metric(img, gt_img)
+    else:
+        gt_float = gt_img.astype(np.float64)
+
+        def score(img):
+            return metric(img.astype(np.float64), gt_float)
 
+    h, w = shape[:2]
+    zero = np.zeros((h, w), dtype=np.float32)
+
+    def method_score(j: int):
+        im = cv2.imread(paths[j])
+        return score(im) if im is not None else zero
+
+    scores = {t: method_score(t) for t in targets}
+    ranks = {t: np.zeros((h, w), dtype=np.int32) for t in targets}
+    for j in range(len(paths)):
+        values = scores[j] if j in scores else method_score(j)
+        for t in targets:
+            if j == t:
+                continue
+            ranks[t] += values < scores[t]
+            if j < t:
+                ranks[t] += values == scores[t]
+
+    m_cnt = len(paths)
+    for t, out_path in zip(targets, out_paths):
+        our_rank = ranks[t] / max(m_cnt - 1, 1)
+        viz = cv2.applyColorMap((our_rank * 255).astype(np.uint8), cv2.COLORMAP_JET)
+        cv2.imwrite(out_path, viz)
+
+
+def _ranking_targets(config: dict, methods, gt_idx: Optional[int]) -> list[int]:
+    """Method indices to rank: ``None`` for ours, ``"all"`` or a list of names."""
+    names = [m["name"] for m in config["methods"]]
+    if methods is None:
+        ours = [i for i, m in enumerate(config["methods"]) if m.get("is_ours")]
+        if not ours:
+            raise ValueError("No method marked as 'is_ours' in config.")
+        return ours[-1:]
+    if methods == "all":
+        return [i for i, name in enumerate(names)
+                if i != gt_idx and name != "variance_map" and not name.startswith("ranking_map")]
+    targets = []
+    for name in methods:
+        if name not in names:
+            raise ValueError(f"ranking_map_methods names an unknown method: {name}")
+        if names.index(name) not in targets:
+            targets.append(names.index(name))
+    return targets
+
+
+def make_ranking_map(config: dict, metric: Optional[Callable] = None,
+                     progress: Optional[Callable[[int, int], None]] = None,
+                     pool: Optional[Executor] = None) -> dict:
+    """
+    Creates per-pixel ranking maps showing where a method ranks among methods.
+
+    *metric(img, gt)* should return an (H, W) array where **higher = better**;
+    it gets float64 images.  Without one, l1_metric runs on the uint8 images.
+    Frames run on the process pool when *metric* can be pickled, serially
+    otherwise (e.g. a lambda).  *progress* and *pool* are as in
+    make_variance_map().
+
+    ``ranking_map_methods`` in *config* picks the ranked methods: unset for
+    the 'is_ours' method, ``all`` for every method but GT and the generated
+    maps, or a list of names.  All of them come out of one pass over the
+    frames; ours is added as the ``ranking_map`` method and any other X as
+    ``ranking_map_X``.
+    """
     img_paths = _load_image_paths(config)
     frame_cnt = len(img_paths[0])
     m_cnt = len(img_paths)
@@ -88,39 +246,58 @@ def make_ranking_map(config: dict, metric) -> dict:
     img0 = cv2.imread(img_paths[0][0])
     if img0 is None:
         raise FileNotFoundError(f"Cannot read: {img_paths[0][0]}")
-    h, w, c = img0.shape
+    shape = img0.shape
+    del img0
 
     gt_idx = None
-    ours_idx = None
     for i, m in enumerate(config["methods"]):
         if m.get("is_gt"):
             gt_idx = i
-        if m.get("is_ours"):
-            ours_idx = i
 
     if gt_idx is None:
         raise ValueError("No method marked as 'is_gt' in config.")
-    if ours_idx is None:
-        raise ValueError("No method marked as 'is_ours' in config.")
-
-    for i in range(frame_cnt):
-        gt_img = cv2.imread(img_paths[gt_idx][i])
-        if gt_img is None:
-            continue
-        arr = np.zeros((m_cnt, h, w), dtype=np.float64)
-        for j in range(m_cnt):
-            comp = cv2.imread(img_paths[j][i])
-            if comp is not None:
-                arr[j] = metric(comp.astype(np.float64), gt_img.astype(np.float64))
-
-        sort_idx = np.argsort(arr, axis=0)
-        our_rank = np.zeros((h, w), dtype=np.float64)
-        our_where = np.where(sort_idx == ours_idx)
-        our_rank[our_where[1], our_where[2]] = our_where[0]
-        our_rank = our_rank / max(m_cnt - 1, 1)
-        viz = cv2.applyColorMap((our_rank * 255).astype(np.uint8), cv2.COLORMAP_JET)
-        cv2.imwrite(os.path.join(path, f"{i:06d}.png"), viz)
+    targets = _ranking_targets(config, config.get("ranking_map_methods"), gt_idx)
+    if not targets:
+        raise ValueError("ranking_map_methods selects no method to rank.")
 
-    config["methods"].append({"name": "ranking_map", "path": path})
-    logger.info("Ranking maps saved to %s", path)
-    return config
\ No newline at end of file
+    map_names = []
+    for t in targets:
+        m = config["methods"][t]
+        map_names.append("ranking_map" if m.get("is_ours") else f"ranking_map_{m['name']}")
+    map_dirs = [os.path.join(config["visualization_path"], name) for name in map_names]
+    for d in map_dirs:
+        os.makedirs(d, exist_ok=True)
+
+    if progress is None:
+        progress = _log_progress("Ranking maps" if len(targets) > 1 else "Ranking map")
+    units = [([img_paths[j][i] for j in range(m_cnt)], [os.path.join(d, f"{i:06d}.png") for d in map_dirs])
+             for i in range(frame_cnt)]
+    own_pool = pool is None
+    if metric is not None and not _picklable(metric):
+        logger.info("Ranking metric cannot be sent to worker processes; ranking serially.")
+        own_pool, pool = False, None
+    elif own_pool:
+        workers = int(config.get("visualizer_processes", min(4, os.cpu_count() or 1)))
+        pool = make_executor(min(workers, frame_cnt), "visualizer")
+    futures = []
+    try:
+        if pool is None:
+            for done, (paths, out_paths) in enumerate(units, 1):
+                _ranking_frame(paths, gt_idx, targets, shape, out_paths, metric)
+                progress(done, frame_cnt)
+        else:
+            futures = [pool.submit(_ranking_frame, paths, gt_idx, targets, shape, out_paths, metric)
+                       for paths, out_paths in units]
+            for done, fut in enumerate(as_completed(futures), 1):
+                fut.result()
+                progress(done, frame_cnt)
+    finally:
+        for fut in futures:
+            fut.cancel()
+        if own_pool and pool is not None:
+            pool.shutdown()
+
+    for name, d in zip(map_names, map_dirs):
+        config["methods"].append({"name": name, "path": d})
+    logger.info("Ranking maps saved to %s", ", ".join(map_dirs))
+    return config
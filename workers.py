@@ -0,0 +1,165 @@
+"""
+Priority scheduling of server-side work.
+
+PriorityScheduler owns a fixed set of threads that run submitted callables
+in priority order (INTERACTIVE before BACKGROUND before HEAVY, FIFO within a
+priority).  The first *reserved* threads only ever pick up interactive jobs,
+so UI requests always have a lane even while every other thread is busy
+exporting.  HEAVY jobs are additionally capped at *heavy_limit* concurrent
+runs and at *max_pending* queued jobs; the remaining threads run at a lower
+OS priority so that long exports yield the CPU to interactive decodes.
+
+make_executor() builds the CPU pools of the crop, PPT, visualisation and
+stitch code.  It forks all of a pool's processes before returning and starts
+no thread doing so, which lets the app fork every pool at startup while its
+main thread is its only thread: a child forked while another thread holds a
+lock (cv2, malloc, logging) can hang forever.  Once other threads run, it
+makes thread pools instead.
+"""
+
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+import cv2
+
+logger = logging.getLogger("cherrypicker.workers")
+
+INTERACTIVE = 0
+BACKGROUND = 5
+HEAVY = 10
+
+
+class SchedulerBusy(RuntimeError):
+    """Raised by submit() when too many heavy jobs are already queued."""
+
+
+def lower_thread_priority() -> None:
+    # On Linux nice values are per thread, addressed by the native thread id
+    if sys.platform.startswith("linux") and hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except OSError:
+            pass
+
+
+def _init_worker() -> None:
+    # One OpenCV thread per worker process; the pool already fills the cores
+    cv2.setNumThreads(1)
+
+
+def make_executor(workers: int, name: str = "pool") -> Optional[Executor]:
+    """Pool of *workers* forked processes; None if workers <= 1.
+
+    Threads are used instead where fork is unavailable or when another
+    thread is already running, see the module docstring.
+    """
+    if workers <= 1:
+        return None
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+    if threading.active_count() > 1:
+        logger.info("Other threads are running; the %s pool uses threads instead of processes", name)
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"),
+                               initializer=_init_worker)
+    # Fork every worker now, as the executor itself does before starting its
+    # manager and queue feeder threads on the first submit()
+    launch = getattr(pool, "_launch_processes", None)
+    if launch is not None:
+        launch()
+    else:  # CPython before 3.10.9
+        for _ in range(workers):
+            pool._spawn_process()
+    logger.info("Started %d %s worker processes", workers, name)
+    return pool
+
+
+class PriorityScheduler:
+    def __init__(self, reserved: int = 2, shared: int = 2, heavy_limit: int = 1, max_pending: int = 8):
+        self.reserved = max(1, int(reserved))
+        self.shared = max(1, int(shared))
+        self.heavy_limit = max(1, min(int(heavy_limit), self.shared))
+        self.max_pending = max(1, int(max_pending))
+        self._cond = threading.Condition()
+        self._queue: list[tuple[int, int, Future, Callable, tuple, dict]] = []
+        self._seq = itertools.count()
+        self._heavy_pending = 0
+        self._heavy_running = 0
+        self._threads = []
+        for i in range(self.reserved + self.shared):
+            reserved = i < self.reserved
+            name = f"sched-{'ui' if reserved else 'shared'}-{i}"
+            t = threading.Thread(target=self._worker, args=(reserved,), name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, priority: int, fn: Callable, *args, **kwargs) -> Future:
+        fut: Future = Future()
+        with self._cond:
+            if priority >= HEAVY:
+                if self._heavy_pending >= self.max_pending:
+                    raise SchedulerBusy("Too many heavy jobs queued")
+                self._heavy_pending += 1
+            heapq.heappush(self._queue, (priority, next(self._seq), fut, fn, args, kwargs))
+            self._cond.notify_all()
+        return fut
+
+    def _take(self, reserved: bool):
+        """Pop the best job this thread may run, or None; caller holds the lock."""
+        if not self._queue:
+            return None
+        priority = self._queue[0][0]
+        if reserved and priority > INTERACTIVE:
+            return None
+        if priority >= HEAVY and self._heavy_running >= self.heavy_limit:
+            return None
+        return heapq.heappop(self._queue)
+
+    def _worker(self, reserved: bool) -> None:
+        if not reserved:
+            lower_thread_priority()
+        while True:
+            with self._cond:
+                job = self._take(reserved)
+                while job is None:
+                    self._cond.wait()
+                    job = self._take(reserved)
+                heavy = job[0] >= HEAVY
+                if heavy:
+                    self._heavy_pending -= 1
+                    self._heavy_running += 1
+            _, _, fut, fn, args, kwargs = job
+            try:
+                if fut.set_running_or_notify_cancel():
+                    try:
+                        fut.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        fut.set_exception(e)
+            finally:
+                if heavy:
+                    with self._cond:
+                        self._heavy_running -= 1
+                        self._cond.notify_all()
+
+    def map(self, priority: int, fn: Callable, items) -> list:
+        """Run fn over *items* at *priority* and return the results in order."""
+        futures = [self.submit(priority, fn, item) for item in items]
+        return [f.result() for f in futures]
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "reserved_threads": self.reserved,
+                "shared_threads": self.shared,
+                "queued": len(self._queue),
+                "heavy_pending": self._heavy_pending,
+                "heavy_running": self._heavy_running,
+                "heavy_limit": self.heavy_limit,
+            }
@@ -0,0 +1,50 @@
+"""
+Zip archives produced incrementally for streaming responses.
+
+zipfile writes to any object with write()/flush(); without tell() it falls
+back to data descriptors, so entries can be sent as soon as they are added
+and the central directory follows on close().  Already-compressed images are
+stored, text entries are deflated.
+"""
+
+import time
+import zipfile
+
+
+class _Sink:
+    """Write-only buffer that zipfile writes into and the caller drains."""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+class ZipStream:
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", allowZip64=True)
+
+    def add(self, name: str, data: bytes, compress: bool = False) -> None:
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        self._zip.writestr(info, data)
+
+    def drain(self) -> bytes:
+        """Archive bytes produced since the previous drain()."""
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        """Finish the archive and return its remaining bytes."""
+        self._zip.close()
+        return self._sink.drain()